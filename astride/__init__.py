@@ -1,3 +1,6 @@
 from astride.test.run import test
 from astride.detect import Streak
+from astride.catalog import StreakCatalog, StreakResult
 from astride.utils.logger import Logger
+from astride.utils.reference import ReferenceStack
+from astride.track import Tracker
@@ -0,0 +1,149 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from astropy.io import fits
+
+from astride.catalog import StreakCatalog
+from astride.utils.logger import Logger, init_worker, log_context, \
+    stop_queue
+from astride.utils.memory import parse_memory, plan_frame
+
+
+def _get_shape(filename, hdu=0):
+    """Return the image shape from the fits header, without the data."""
+    header = fits.getheader(filename, hdu)
+
+    return header['NAXIS2'], header['NAXIS1']
+
+
+def _detect(filename, max_memory=None, write_outputs=False, **kwargs):
+    """
+    Detect streaks in a frame.
+
+    Returns
+    -------
+    result : dict
+        The 'filename', the 'catalog' of the streaks serialized without
+        the contours (see StreakCatalog.to_bytes), the measured
+        'peak_memory' and the 'max_memory' of the frame in bytes.
+    """
+    from astride.detect import Streak
+
+    streak = Streak(filename, max_memory=max_memory, **kwargs)
+    catalog = streak.detect()
+    if write_outputs:
+        streak.write_outputs()
+
+    return {'filename': filename, 'catalog': catalog.to_bytes(),
+            'peak_memory': streak.peak_memory, 'max_memory': max_memory}
+
+
+def run_batch(filenames, n_workers=None, max_memory=None,
+              write_outputs=False, **kwargs):
+    """
+    Detect streaks in many fits files using worker processes.
+
+    If max_memory is given, the number of workers is chosen so that each
+    worker has a budget of at least the estimated memory of its largest
+    frame in 'float32', and the budget is split evenly between them. Each
+    frame then chooses its data type, strips and extreme point algorithm
+    within its share (see the max_memory option of Streak). The peak
+    memory of each frame is logged against its share.
+
+    Parameters
+    ----------
+    filenames : list of str
+        Fits filenames.
+    n_workers : int, optional
+        The maximum number of worker processes. If None, the number of
+        CPUs.
+    max_memory : int or str, optional
+        Memory budget of all the workers in bytes, or a string such as
+        '8G'. Default is None (i.e. no budget).
+    write_outputs : bool, optional
+        If True, the streaks of each frame are written to its output path
+        (see Streak.write_outputs).
+    kwargs : dict, optional
+        Other options of the Streak class.
+
+    Returns
+    -------
+    results : list of dict
+        One dictionary per file, in the same order, having the
+        'filename', the 'catalog' of the streaks without the contours
+        (see StreakCatalog), the measured 'peak_memory' and the
+        'max_memory' of the frame in bytes.
+    """
+    logger = Logger().getLogger()
+    filenames = list(filenames)
+    if len(filenames) == 0:
+        return []
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    n_workers = min(n_workers, len(filenames))
+
+    frame_memory = None
+    if max_memory is not None:
+        max_memory = parse_memory(max_memory)
+
+        # The smallest footprint of the largest frame without strips.
+        hdu = kwargs.get('hdu', 0)
+        options = {'remove_bkg': kwargs.get('remove_bkg', 'constant'),
+                   'pyramid_factor': max(kwargs.get('pyramid_factor', 1), 1),
+                   'local_threshold': kwargs.get('local_threshold', False),
+                   'masked': any(kwargs.get(name) is not None
+                                 for name in ('mask', 'dq_hdu', 'roi')),
+                   'mask_sources': kwargs.get('mask_sources', False) or
+                   kwargs.get('source_catalog') is not None,
+                   'reference': kwargs.get('reference') is not None}
+        estimate = max(plan_frame(_get_shape(filename, hdu), float('inf'),
+                                  kwargs.get('dtype') or 'float32',
+                                  **options)[2]
+                       for filename in filenames)
+
+        n_workers = max(min(n_workers, int(max_memory // estimate)), 1)
+        frame_memory = max_memory // n_workers
+        logger.info('%d workers with %.1f MB each.', n_workers,
+                    frame_memory / 2.**20)
+
+    if n_workers > 1:
+        queue = Logger().get_queue()
+        try:
+            with ProcessPoolExecutor(
+                    max_workers=n_workers, initializer=init_worker,
+                    initargs=(queue, logger.level)) as executor:
+                futures = [executor.submit(_detect, filename, frame_memory,
+                                           write_outputs, **kwargs)
+                           for filename in filenames]
+                results = [future.result() for future in futures]
+        finally:
+            stop_queue()
+    else:
+        results = [_detect(filename, frame_memory, write_outputs, **kwargs)
+                   for filename in filenames]
+
+    for result in results:
+        result['catalog'] = StreakCatalog.from_bytes(result['catalog'])
+        if result['peak_memory'] is None:
+            continue
+        with log_context(frame=result['filename']):
+            logger.info('Peak memory %.1f MB of %.1f MB.',
+                        result['peak_memory'] / 2.**20,
+                        result['max_memory'] / 2.**20)
+
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Detect streaks in many fits files.')
+    parser.add_argument('filenames', nargs='+')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-memory', default=None)
+    args = parser.parse_args()
+
+    run_batch(args.filenames, n_workers=args.workers,
+              max_memory=args.max_memory, write_outputs=True)
@@ -0,0 +1,350 @@
+import struct
+from collections.abc import Mapping
+
+import numpy as np
+
+
+# Columns of the catalog. Integer and float columns are kept in separate
+# contiguous buffers, one row per column, so every column is a contiguous
+# array that NumPy and Arrow share without copying.
+INT_FIELDS = ('index', 'connectivity')
+FLOAT_FIELDS = ('x_center', 'y_center', 'area', 'perimeter',
+                'shape_factor', 'radius_deviation', 'slope', 'slope_angle',
+                'intercept', 'x_min', 'x_max', 'y_min', 'y_max',
+                'ep1_x', 'ep1_y', 'ep2_x', 'ep2_y', 'length', 'thickness')
+SKY_FIELDS = ('ra', 'dec', 'ep1_ra', 'ep1_dec', 'ep2_ra', 'ep2_dec')
+
+# Fields of Streak.get_outputs, in the order of the output file.
+OUTPUT_FIELDS = ('index', 'x_center', 'y_center', 'area', 'perimeter',
+                 'shape_factor', 'radius_deviation', 'slope_angle',
+                 'intercept', 'connectivity', 'ep1_x', 'ep1_y',
+                 'ep2_x', 'ep2_y', 'length', 'thickness')
+
+# Magic bytes, the number of streaks, whether the sky coordinates and the
+# contours are included, and the item size of the contour coordinates.
+_MAGIC = b'ASTRIDE1'
+_HEADER = struct.Struct('<8sQ??B')
+
+
+class StreakResult(Mapping):
+    """
+    Read-only view of a streak of a StreakCatalog.
+
+    Values are read as result['x_center'] or result.x_center. Besides the
+    catalog fields, 'extreme_points' gives the two extreme points as
+    (x, y) arrays, and 'x' and 'y' give the contour if the catalog has
+    contours.
+
+    Parameters
+    ----------
+    catalog : StreakCatalog
+        Catalog having the streak.
+    row : int
+        Position of the streak in the catalog.
+    """
+    __slots__ = ('_catalog', '_row')
+
+    def __init__(self, catalog, row):
+        object.__setattr__(self, '_catalog', catalog)
+        object.__setattr__(self, '_row', row)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('StreakResult is read-only.')
+
+    def __getitem__(self, key):
+        catalog = self._catalog
+        if key in catalog._positions:
+            kind, i = catalog._positions[key]
+            if kind == 'int':
+                return int(catalog._ints[i, self._row])
+            return float(catalog._floats[i, self._row])
+        if key == 'extreme_points':
+            return [np.array([self['ep1_x'], self['ep1_y']]),
+                    np.array([self['ep2_x'], self['ep2_y']])]
+        if key in ('x', 'y') and catalog.has_contours:
+            start, stop = catalog._offsets[self._row:self._row + 2]
+            return catalog._coords[0 if key == 'x' else 1, start:stop]
+
+        raise KeyError(key)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __iter__(self):
+        return iter(self._catalog.fields)
+
+    def __len__(self):
+        return len(self._catalog.fields)
+
+    def __repr__(self):
+        return 'StreakResult(index=%d, x_center=%.2f, y_center=%.2f)' % \
+            (self['index'], self['x_center'], self['y_center'])
+
+    def __reduce__(self):
+        return _get_result, (self._catalog, self._row)
+
+
+def _get_result(catalog, row):
+    return StreakResult(catalog, row)
+
+
+class StreakCatalog:
+    """
+    Immutable catalog of detected streaks, returned by Streak.detect.
+
+    The summary values of all the streaks are kept in two contiguous
+    buffers, one for the integer and one for the float columns, and the
+    contours, if kept, in another buffer. So a catalog is cheap to send
+    between processes, and its columns are shared with NumPy (see
+    to_numpy) and Arrow (see to_arrow) without copying. All the arrays
+    are read-only.
+
+    Iterating a catalog, or indexing it by an integer, gives StreakResult
+    views, which are read like the dictionaries of Streak.streaks.
+    Indexing it by a field name gives the column.
+
+    Parameters
+    ----------
+    ints : numpy.ndarray
+        (len(INT_FIELDS), N) int64 array of the integer columns.
+    floats : numpy.ndarray
+        (len(FLOAT_FIELDS) [+ len(SKY_FIELDS)], N) float64 array of the
+        float columns, having the sky coordinates if its first dimension
+        includes SKY_FIELDS.
+    offsets : numpy.ndarray, optional
+        (N + 1) int64 array of the start of each contour in coords.
+    coords : numpy.ndarray, optional
+        (2, M) array of the x and y coordinates of all the contours.
+    """
+    def __init__(self, ints, floats, offsets=None, coords=None):
+        self._ints = _read_only(np.asarray(ints, dtype=np.int64))
+        self._floats = _read_only(np.asarray(floats, dtype=np.float64))
+        self.has_sky = len(self._floats) > len(FLOAT_FIELDS)
+        self.has_contours = coords is not None
+        self._offsets = None
+        self._coords = None
+        if self.has_contours:
+            self._offsets = _read_only(np.asarray(offsets, dtype=np.int64))
+            self._coords = _read_only(np.asarray(coords))
+
+        self.fields = INT_FIELDS + FLOAT_FIELDS
+        if self.has_sky:
+            self.fields += SKY_FIELDS
+        self._positions = {name: ('int', i)
+                           for i, name in enumerate(INT_FIELDS)}
+        self._positions.update(
+            (name, ('float', i)) for i, name in
+            enumerate(self.fields[len(INT_FIELDS):]))
+
+    @classmethod
+    def from_edges(cls, edges, wcs=None, contours=True):
+        """
+        Create a catalog of edges.
+
+        Parameters
+        ----------
+        edges : list of dict
+            Quantified edges (e.g. Streak.streaks).
+        wcs : astropy.wcs.WCS, optional
+            WCS of the image. If given, the sky coordinates in degrees of
+            the centers and the extreme points are added.
+        contours : bool, optional
+            If True, the contour of each edge is kept.
+
+        Returns
+        -------
+        catalog : StreakCatalog
+            Catalog of the edges.
+        """
+        n = len(edges)
+        ints = np.empty((len(INT_FIELDS), n), dtype=np.int64)
+        floats = np.empty((len(FLOAT_FIELDS) +
+                           (len(SKY_FIELDS) if wcs is not None else 0), n))
+        for j, edge in enumerate(edges):
+            ep1, ep2 = edge['extreme_points']
+            values = dict(edge, ep1_x=ep1[0], ep1_y=ep1[1],
+                          ep2_x=ep2[0], ep2_y=ep2[1])
+            ints[:, j] = [values[name] for name in INT_FIELDS]
+            floats[:len(FLOAT_FIELDS), j] = [values[name]
+                                             for name in FLOAT_FIELDS]
+
+        # Convert all the coordinates at once.
+        if wcs is not None and n > 0:
+            rows = [FLOAT_FIELDS.index(name) for name in
+                    ('x_center', 'y_center', 'ep1_x', 'ep1_y',
+                     'ep2_x', 'ep2_y')]
+            xy = floats[rows]
+            xy = xy.reshape(3, 2, n).transpose(2, 0, 1).reshape(-1, 2)
+            radec = wcs.wcs_pix2world(xy, 0).reshape(n, 6)
+            floats[len(FLOAT_FIELDS):] = radec.T
+
+        offsets = coords = None
+        if contours:
+            lengths = [len(edge['x']) for edge in edges]
+            offsets = np.zeros(n + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(lengths)
+            dtype = np.result_type(*[edge['x'] for edge in edges]) \
+                if n > 0 else np.float64
+            coords = np.empty((2, offsets[-1]), dtype=dtype)
+            for j, edge in enumerate(edges):
+                coords[0, offsets[j]:offsets[j + 1]] = edge['x']
+                coords[1, offsets[j]:offsets[j + 1]] = edge['y']
+
+        return cls(ints, floats, offsets, coords)
+
+    def __len__(self):
+        return self._ints.shape[1]
+
+    def __iter__(self):
+        return (StreakResult(self, row) for row in range(len(self)))
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self._positions:
+                raise KeyError(key)
+            kind, i = self._positions[key]
+            return self._ints[i] if kind == 'int' else self._floats[i]
+
+        rows = range(len(self))[key]
+        if isinstance(rows, range):
+            return [StreakResult(self, row) for row in rows]
+
+        return StreakResult(self, rows)
+
+    def __repr__(self):
+        return 'StreakCatalog(%d streaks)' % len(self)
+
+    def __reduce__(self):
+        return StreakCatalog.from_bytes, (self.to_bytes(self.has_contours),)
+
+    def without_contours(self):
+        """Return the catalog without the contours, sharing its columns."""
+        return StreakCatalog(self._ints, self._floats)
+
+    def to_numpy(self):
+        """
+        Return the columns as read-only NumPy arrays, without copying.
+
+        Returns
+        -------
+        columns : dict
+            Array of each field.
+        """
+        return {name: self[name] for name in self.fields}
+
+    def to_arrow(self):
+        """
+        Return the columns as an Arrow table, without copying.
+
+        Requires pyarrow.
+
+        Returns
+        -------
+        table : pyarrow.Table
+            Table having a column per field.
+        """
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise RuntimeError('"pyarrow" must be installed to convert '
+                               'catalogs to Arrow.')
+
+        return pa.table({name: pa.array(self[name]) for name in self.fields})
+
+    def to_dicts(self, fields=None):
+        """
+        Return the streaks as dictionaries.
+
+        Parameters
+        ----------
+        fields : list of str, optional
+            Fields to return. If None, the fields of Streak.get_outputs
+            (OUTPUT_FIELDS), and the sky coordinates if any.
+
+        Returns
+        -------
+        streaks : list of dict
+            One dictionary per streak.
+        """
+        if fields is None:
+            fields = OUTPUT_FIELDS + (SKY_FIELDS if self.has_sky else ())
+        columns = [self[name].tolist() for name in fields]
+
+        return [dict(zip(fields, values)) for values in zip(*columns)]
+
+    def to_bytes(self, contours=False):
+        """
+        Serialize the catalog.
+
+        Parameters
+        ----------
+        contours : bool, optional
+            If True, the contours are included as well.
+
+        Returns
+        -------
+        data : bytes
+            Serialized catalog. See from_bytes.
+        """
+        contours = contours and self.has_contours
+        itemsize = self._coords.itemsize if contours else 0
+        buffers = [_HEADER.pack(_MAGIC, len(self), self.has_sky, contours,
+                                itemsize),
+                   self._ints.astype('<i8').tobytes(),
+                   self._floats.astype('<f8').tobytes()]
+        if contours:
+            buffers += [self._offsets.astype('<i8').tobytes(),
+                        self._coords.astype('<f%d' % itemsize).tobytes()]
+
+        return b''.join(buffers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Deserialize a catalog of to_bytes.
+
+        The columns are views of the data, so they are not copied.
+
+        Parameters
+        ----------
+        data : bytes
+            Serialized catalog.
+
+        Returns
+        -------
+        catalog : StreakCatalog
+            Deserialized catalog.
+        """
+        magic, n, has_sky, contours, itemsize = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise RuntimeError('Data is not a serialized StreakCatalog.')
+
+        n_floats = len(FLOAT_FIELDS) + (len(SKY_FIELDS) if has_sky else 0)
+        offset = _HEADER.size
+        ints = np.frombuffer(data, '<i8', len(INT_FIELDS) * n, offset)
+        offset += ints.nbytes
+        floats = np.frombuffer(data, '<f8', n_floats * n, offset)
+        offset += floats.nbytes
+
+        offsets = coords = None
+        if contours:
+            offsets = np.frombuffer(data, '<i8', n + 1, offset)
+            offset += offsets.nbytes
+            coords = np.frombuffer(data, np.dtype('<f%d' % itemsize),
+                                   2 * offsets[-1], offset).reshape(2, -1)
+
+        return cls(ints.reshape(len(INT_FIELDS), n),
+                   floats.reshape(n_floats, n), offsets, coords)
+
+
+def _read_only(array):
+    """Return a read-only view of an array."""
+    array = array.view()
+    array.flags.writeable = False
+
+    return array
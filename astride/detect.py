@@ -1,19 +1,41 @@
+import itertools
+import logging
 import os
 import sys
+import warnings
 
 import numpy as np
 import pylab as pl
 
+from scipy import ndimage
 from skimage import measure
 from astropy.io import fits
-from astropy.stats import sigma_clipped_stats
 from astropy.stats import SigmaClip
 from astropy import coordinates
 from astropy import units as u
 from astropy.wcs import WCS
 from photutils.background import Background2D, MedianBackground
 
+from astride.catalog import StreakCatalog
+from astride.utils.cache import ResultCache
+from astride.utils.contour import find_contours
 from astride.utils.edge import EDGE
+from astride.utils.hough import Hough
+from astride.utils.logger import log_context, log_stage
+from astride.utils.memory import PeakMemory
+from astride.utils.memory import get_max_outer_points
+from astride.utils.memory import parse_memory
+from astride.utils.memory import plan_frame
+from astride.utils.misc import bin_image
+from astride.utils.profile import get_profiles
+from astride.utils.reference import ReferenceStack
+
+# Numbers of the frames created from arrays without a label in this
+# process, used to label them in the log records.
+_array_ids = itertools.count(1)
+from astride.utils.stats import sample_clipped_stats
+
+logger = logging.getLogger('ASTRiDE')
 
 
 class Streak:
@@ -23,7 +45,7 @@ class Streak:
     Parameters
     ----------
     filename : str
-        Fits filename.
+        Fits filename. Not required if data is given.
     remove_bkg : {'constant', 'map'}, optional.
         Which method to remove image background. 'constant' uses sigma-clipped
         statistics of the image to calculate the constant background value.
@@ -31,6 +53,11 @@ class Streak:
         If your image has varing background, use 'map'.
     bkg_box_size : int, optional
         Box size for background estimation.
+    bkg_sample_size : int, optional
+        The maximum number of pixels drawn at random to calculate the
+        constant background value and its confidence bounds (see
+        background_bounds). Images with fewer pixels use all of them.
+        Only used if remove_bkg is 'constant'.
     contour_threshold : float, optional
         Threshold to search contours (i.e. edges of an input image)
     min_points: int, optional
@@ -47,41 +74,192 @@ class Streak:
         See skimage.measure.find_contours for details.
     output_path: str, optional
         Path to save figures and output files. If None, the input folder name
-        and base filename is used as the output folder name.
+        and base filename is used as the output folder name. If None and
+        there is no filename, no output can be written.
+    mask_sources: bool, optional
+        If True, point sources (i.e. stars) are masked before searching
+        contours, which removes most of the contours in crowded fields.
+    source_catalog: array_like, optional
+        Pixel coordinates of point sources to mask, either as (x, y) pairs
+        or as a table having 'xcentroid' and 'ycentroid' columns
+        (e.g. from photutils). If given, the sources are not searched.
+    source_elongation: float, optional
+        The maximum elongation (i.e. the ratio of the major to the minor
+        axis) of a region above the contour threshold to be regarded as
+        a point source, whatever its size. Single stars are below about
+        1.5, and most blends of stars below 3, whereas streaks are far
+        more elongated.
+    source_radius: float, optional
+        Radius in pixels of the masked region around each source
+        in the source_catalog.
+    reference: numpy.ndarray or ReferenceStack, optional
+        Reference image of the same field subtracted from the image before
+        the detection, so that static sources are removed. If a
+        ReferenceStack is given, its running median of the previous frames
+        is subtracted, and then the current frame is added to the stack.
+        The first frame of a sequence is processed without subtraction.
+    data: numpy.ndarray, optional
+        Image data to use instead of reading the fits file.
+        See also Streak.from_array.
+    header: astropy.io.fits.Header, optional
+        Fits header of the image data, used for the WCS information.
+    engine: {'contour', 'hough'}, optional
+        Which method to detect streaks. 'contour' quantifies shapes of the
+        contours. 'hough' searches straight lines in a Hough accumulator of
+        the binned image and refines them at the full resolution, which
+        finds long faint streaks broken into fragments in the contours.
+        Default is 'contour'.
+    hough_bin_factor: int, optional
+        Binning factor of the 'hough' engine.
+    hough_min_length: float, optional
+        The minimum length in pixels of streaks for the 'hough' engine.
+    pyramid_factor: int, optional
+        If larger than one, the background map is estimated from every
+        pyramid_factor-th pixel, and the contours are first searched in the
+        image binned by pyramid_factor. The contours are then searched at
+        the full resolution only around elongated regions of the binned
+        image. Much faster for large and mostly empty images.
+        Only used by the 'contour' engine. Default is 1.
+    hdu: int or str, optional
+        Index or name of the HDU having the image in the fits file.
+    cache: ResultCache or str, optional
+        Cache of detection results, or a folder for it. A frame detected
+        again with the same data and parameters is read from the cache.
+        The results are loaded as pickles, so the folder must be trusted.
+    local_threshold: bool, optional
+        If True, contours are searched in the signal-to-noise image, which
+        is the background removed image divided by a map of the
+        background RMS, so that contour_threshold is relative to the
+        local noise. Useful for images having vignetting or varying
+        noise. The RMS map is that of Background2D if remove_bkg is 'map',
+        or the robust RMS in boxes of bkg_box_size pixels otherwise.
+        Default is False.
+    dtype: {'float64', 'float32'}, optional
+        Data type of the image, the background map and the contour
+        coordinates. 'float32' halves the memory traffic on large images.
+        The sums of the shape metrics are still done in float64, so the
+        streak positions, areas and angles agree with 'float64' to
+        about 1e-3 pixels, 1e-4 relatively and 1e-3 degree, respectively.
+        If None, 'float64' is used unless max_memory requires 'float32'.
+        Default is None.
+    mask: numpy.ndarray, optional
+        Boolean mask of the image that is True at bad pixels (e.g. bad
+        columns, saturated bleed trails, overscan). Masked pixels are
+        excluded from the background statistics, set to zero, and no
+        contour is searched across them.
+    dq_hdu: int or str, optional
+        Index or name of the HDU having the data quality array in the fits
+        file. Pixels of non-zero data quality are masked as well.
+    roi: list, optional
+        A list of (x_min, x_max, y_min, y_max) rectangles in pixels.
+        If given, streaks are searched only inside the rectangles, and
+        the pixels outside them are masked. The background statistics,
+        the background and RMS maps and the point sources are only
+        computed inside the rectangles (or their bounding box for the
+        maps), so a small region of a large image is fast.
+    max_memory: int or str, optional
+        Memory budget of the detection in bytes, or a string such as '2G'.
+        The peak memory is estimated from the image shape and the options,
+        and then 'float32' is used if the budget is too small for
+        'float64' (unless dtype is given), contours are searched in
+        horizontal strips if the budget is still too small, and the
+        extreme points of large edges are searched on their convex hulls.
+        The measured peak memory of each detection is in peak_memory.
+        Default is None (i.e. no budget).
     """
     def __init__(self, filename, remove_bkg='constant', bkg_box_size=50,
-                 contour_threshold=3., min_points=10, shape_cut=0.2,
-                 area_cut=20., radius_dev_cut=0.5, connectivity_angle=3.,
-                 fully_connected='high', output_path=None):
-        hdulist = fits.open(filename)
-        raw_image = hdulist[0].data.astype(np.float64)
+                 bkg_sample_size=2**20, contour_threshold=3., min_points=10,
+                 shape_cut=0.2, area_cut=20., radius_dev_cut=0.5,
+                 connectivity_angle=3.,
+                 fully_connected='high', output_path=None,
+                 mask_sources=False, source_catalog=None,
+                 source_elongation=3., source_radius=3., reference=None,
+                 data=None, header=None,
+                 engine='contour', hough_bin_factor=8, hough_min_length=50.,
+                 pyramid_factor=1, hdu=0, cache=None, dtype=None,
+                 local_threshold=False, mask=None, dq_hdu=None, roi=None,
+                 max_memory=None):
+        if data is None:
+            hdulist = fits.open(filename)
+            data = hdulist[hdu].data
+            header = hdulist[hdu].header
+            if dq_hdu is not None:
+                mask = self._combine_masks(mask, hdulist[dq_hdu].data != 0)
+            hdulist.close()
+        elif dq_hdu is not None:
+            raise RuntimeError('"dq_hdu" requires a fits file. Give the '
+                               'data quality as "mask" instead.')
+        self.filename = filename
+        self.hdu = hdu
+        # Label of the frame in the log records.
+        self.label = filename if filename is not None else \
+            'array-%d' % next(_array_ids)
 
         # check WCS info
-        try:
-            wcsinfo = hdulist[0].header['CTYPE1']
-            if wcsinfo:
-                self.wcsinfo = True
-                self.filename = filename
-        except:
-            self.wcsinfo = False
-
-        hdulist.close()
+        self.wcsinfo = header is not None and bool(header.get('CTYPE1'))
+        self.wcs = WCS(header) if self.wcsinfo else None
 
         # Raw image.
-        self.raw_image = raw_image
+        dtype_options = ('float64', 'float32')
+        if dtype is not None and np.dtype(dtype).name not in dtype_options:
+            raise RuntimeError('"dtype" must be the one among: %s' %
+                               ', '.join(dtype_options))
+
+        # Choose the data type and the strip height within the memory budget.
+        self.max_memory = None
+        self.strip_height = None
+        self.peak_memory = None
+        self._max_outer_points = None
+        if max_memory is not None:
+            self.max_memory = parse_memory(max_memory)
+            dtype, self.strip_height, _memory = plan_frame(
+                np.shape(data), self.max_memory, dtype,
+                remove_bkg=remove_bkg, pyramid_factor=max(pyramid_factor, 1),
+                local_threshold=local_threshold,
+                masked=mask is not None or dq_hdu is not None or
+                roi is not None,
+                mask_sources=mask_sources or source_catalog is not None,
+                reference=reference is not None)
+            self._max_outer_points = get_max_outer_points(self.max_memory)
+        self.dtype = np.dtype(dtype or 'float64')
+        self.raw_image = np.asarray(data, dtype=self.dtype)
+
+        # Mask of bad pixels and of pixels outside the regions of interest.
+        self.roi = roi
+        if roi is not None:
+            outside = np.ones(self.raw_image.shape, dtype=bool)
+            for y_min, y_max, x_min, x_max in self._get_roi_windows(
+                    self.raw_image.shape):
+                outside[y_min:y_max, x_min:x_max] = False
+            mask = self._combine_masks(mask, outside)
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+            if mask.shape != self.raw_image.shape:
+                raise RuntimeError('The mask shape %s does not match the '
+                                   'image shape %s.' %
+                                   (mask.shape, self.raw_image.shape))
+        self.mask = mask
         # Background structure and background map
         self._bkg = None
         self.background_map = None
         # Background removed image.
         self.image = None
+        # Signal-to-noise image, if local_threshold is True.
+        self.snr_image = None
+        # Mask of point sources.
+        self.source_mask = None
         # Raw edges
         self.raw_borders = None
         # Filtered edges, so streak, by their morphologies and
         # also connected (i.e. linked) by their slope.
         self.streaks = None
+        # Immutable catalog of the streaks, returned by detect.
+        self.catalog = None
         # Statistics for the image data.
         self._med = None
         self._std = None
+        # 95% confidence bounds of the constant background statistics.
+        self.background_bounds = None
 
         # Other variables.
         remove_bkg_options = ('constant', 'map')
@@ -90,7 +268,9 @@ class Streak:
                                ', '.join(remove_bkg_options))
         self.remove_bkg = remove_bkg
         self.bkg_box_size = bkg_box_size
+        self.bkg_sample_size = bkg_sample_size
         self.contour_threshold = contour_threshold
+        self.local_threshold = local_threshold
 
         # These variables for the edge detections and linking.
         self.min_points = min_points
@@ -100,59 +280,577 @@ class Streak:
         self.connectivity_angle = connectivity_angle
         self.fully_connected = fully_connected
 
+        # These variables for the source masking.
+        self.mask_sources = mask_sources
+        self.source_catalog = source_catalog
+        self.source_elongation = source_elongation
+        self.source_radius = source_radius
+
+        # Reference image or stack for the difference imaging.
+        self.reference = reference
+
+        # Detection engine.
+        engine_options = ('contour', 'hough')
+        if engine not in engine_options:
+            raise RuntimeError('"engine" must be the one among: %s' %
+                               ', '.join(engine_options))
+        self.engine = engine
+        self.hough_bin_factor = hough_bin_factor
+        self.hough_min_length = hough_min_length
+        self.pyramid_factor = int(pyramid_factor)
+
+        # Cache of detection results.
+        if isinstance(cache, str):
+            cache = ResultCache(cache)
+        self.cache = cache
+
         # Set output path.
-        if output_path is None:
+        if output_path is None and filename is not None:
             output_path = '%s' % \
                           (filename[:filename.rfind('.')])
-        if output_path[-1] != '/':
+        if output_path is not None and output_path[-1] != '/':
             output_path += '/'
         self.output_path = output_path
 
-        # For plotting.
-        pl.rcParams['figure.figsize'] = [12, 9]
+    @staticmethod
+    def _combine_masks(mask, other):
+        """Return the union of two masks, where the first may be None."""
+        if mask is None:
+            return other
+        return np.logical_or(mask, other)
+
+    @classmethod
+    def from_array(cls, data, header=None, label=None, **kwargs):
+        """
+        Create a Streak instance from an image array in memory.
+
+        Nothing is read from or written to the disk unless output_path is
+        given and write_outputs or plot_figures is called.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            Image data.
+        header : astropy.io.fits.Header, optional
+            Fits header of the image data, used for the WCS information.
+        label : str, optional
+            Label of the frame in the log records, kept in label. If
+            None, "array-N" where N counts the frames created from arrays
+            in the process.
+        kwargs : dict, optional
+            Other options of the Streak class.
+
+        Returns
+        -------
+        streak : Streak
+            A Streak instance.
+        """
+        streak = cls(None, data=data, header=header, **kwargs)
+        if label is not None:
+            streak.label = label
+
+        return streak
 
     def detect(self):
-        """Run the pipeline to detect streaks."""
-        # Remove background.
-        if self.remove_bkg is 'map':
-            self._remove_background()
-        elif self.remove_bkg is 'constant':
-            _mean, self._med, self._std = \
-                sigma_clipped_stats(self.raw_image)
-            self.image = self.raw_image - self._med
-
-        # Detect sources. Test purpose only.
-        # self._detect_sources()
+        """
+        Run the pipeline to detect streaks.
+
+        Returns
+        -------
+        catalog : StreakCatalog
+            Immutable catalog of the detected streaks, also kept in
+            catalog.
+        """
+        with log_context(frame=self.label):
+            # Read the result if it is cached.
+            if self.cache is not None:
+                key = self.cache.get_key(self.raw_image,
+                                         self._get_parameters())
+                result = self.cache.get(key)
+                if result is not None:
+                    self._set_result(result)
+                    logger.debug('Read %d streaks from the cache.',
+                                 len(self.streaks))
+                    return self._set_catalog()
+
+            if self.max_memory is None:
+                self._detect()
+            else:
+                self._detect_within_budget()
+            logger.debug('Detected %d streaks.', len(self.streaks))
+
+            if self.cache is not None:
+                self.cache.put(key,
+                               self._get_result(self.cache.intermediates))
+
+            return self._set_catalog()
+
+    def _set_catalog(self):
+        """Set and return the catalog of the detected streaks."""
+        self.catalog = StreakCatalog.from_edges(
+            self.streaks, wcs=self.wcs)
+
+        return self.catalog
+
+    def _detect_within_budget(self):
+        """Run the detection stages, and then measure the peak memory."""
+        with PeakMemory() as peak:
+            self._detect()
+        self.peak_memory = peak.peak
+
+        if self.peak_memory > self.max_memory:
+            logger.warning('Peak memory %.1f MB exceeded the budget of '
+                           '%.1f MB.', self.peak_memory / 2.**20,
+                           self.max_memory / 2.**20)
+        else:
+            logger.debug('Peak memory %.1f MB of the budget of %.1f MB.',
+                         self.peak_memory / 2.**20, self.max_memory / 2.**20)
+
+    def _get_parameters(self):
+        """
+        Return all the parameters affecting the detection.
+
+        Returns
+        -------
+        parameters : dict
+            Parameters. The source catalog and the reference are given as
+            arrays.
+        """
+        parameters = {
+            'hdu': self.hdu,
+            'remove_bkg': self.remove_bkg, 'bkg_box_size': self.bkg_box_size,
+            'bkg_sample_size': self.bkg_sample_size,
+            'contour_threshold': self.contour_threshold,
+            'local_threshold': self.local_threshold,
+            'min_points': self.min_points, 'shape_cut': self.shape_cut,
+            'area_cut': self.area_cut, 'radius_dev_cut': self.radius_dev_cut,
+            'connectivity_angle': self.connectivity_angle,
+            'fully_connected': self.fully_connected,
+            'mask_sources': self.mask_sources,
+            'source_elongation': self.source_elongation,
+            'source_radius': self.source_radius,
+            'engine': self.engine, 'hough_bin_factor': self.hough_bin_factor,
+            'hough_min_length': self.hough_min_length,
+            'pyramid_factor': self.pyramid_factor,
+            'dtype': self.dtype.name, 'mask': self.mask,
+            'source_catalog': None, 'reference': None}
+
+        if self.source_catalog is not None:
+            parameters['source_catalog'] = \
+                np.array(self._get_catalog_positions())
+        if isinstance(self.reference, ReferenceStack):
+            parameters['reference'] = self.reference.get_reference()
+        else:
+            parameters['reference'] = self.reference
+
+        return parameters
+
+    def _get_result(self, intermediates=False):
+        """Return the detection result to cache."""
+        result = {'streaks': self.streaks, 'med': self._med,
+                  'std': self._std,
+                  'background_bounds': self.background_bounds}
+        if intermediates:
+            result.update({'raw_borders': self.raw_borders,
+                           'background_map': self.background_map,
+                           'source_mask': self.source_mask,
+                           'image': self.image})
+
+        return result
+
+    def _set_result(self, result):
+        """Set the detection result read from the cache."""
+        self.streaks = result['streaks']
+        self._med = result['med']
+        self._std = result['std']
+        self.background_bounds = result.get('background_bounds')
+        self.raw_borders = result.get('raw_borders')
+        self.background_map = result.get('background_map')
+        self.source_mask = result.get('source_mask')
+        self.image = result.get('image')
+
+        # The current frame is still needed for the next frames.
+        if isinstance(self.reference, ReferenceStack):
+            self.reference.add(self.raw_image)
+
+    def _detect(self):
+        """Run the detection stages."""
+        with log_stage(logger, 'prepare'):
+            self._prepare_image()
 
         # Detect streaks.
-        self._detect_streaks()
+        if self.engine == 'hough':
+            with log_stage(logger, 'hough'):
+                self._detect_streaks_hough()
+        else:
+            with log_stage(logger, 'windows'):
+                windows = self._get_windows()
+            with log_stage(logger, 'contour'):
+                self._detect_streaks(windows)
+
+    def _prepare_image(self):
+        """Set the image to search streaks and its statistics."""
+        # Subtract the reference image, so static sources are removed.
+        image = self._subtract_reference()
+
+        # Only the regions of interest are prepared, and the rest of the
+        # images stays zero.
+        windows = self._get_frame_windows(image.shape)
+
+        # Remove background. The constant background is estimated from
+        # a bounded sample of the pixels.
+        if self.remove_bkg == 'map':
+            self._remove_background(image, windows)
+        elif self.remove_bkg == 'constant':
+            _mean, self._med, self._std, median_bounds, std_bounds = \
+                sample_clipped_stats(image, mask=self.mask,
+                                     max_samples=self.bkg_sample_size,
+                                     windows=windows)
+            self.background_bounds = {'median': median_bounds,
+                                      'std': std_bounds}
+            self.image = self._subtract_in_windows(image, self._med,
+                                                   windows)
+
+        # Masked pixels are set to the background, so no contour is found
+        # in them, and contours crossing them are closed at their border.
+        if self.mask is not None:
+            for region in self._get_regions(windows):
+                self.image[region][self.mask[region]] = 0.
+
+        # Divide by the local noise. The RMS map is a new array, so it is
+        # divided in place without another full size array.
+        if self.local_threshold:
+            region = self._get_bounding_region(windows)
+            rms = self._get_rms_map(image[region], self._get_mask(region))
+            if windows is None:
+                self.snr_image = np.divide(self.image, rms, out=rms)
+            else:
+                self.snr_image = np.zeros(image.shape, dtype=self.dtype)
+                self.snr_image[region] = np.divide(self.image[region], rms,
+                                                   out=rms)
+
+        if self.mask_sources or self.source_catalog is not None:
+            self._mask_sources()
+
+    def _mask_sources(self):
+        """Mask point sources, so that their contours are not searched."""
+        self.source_mask = self._detect_sources()
+        self.image[self.source_mask] = 0.
+        if self.snr_image is not None:
+            self.snr_image[self.source_mask] = 0.
+
+    def _get_frame_windows(self, shape):
+        """
+        Return the windows of the image to prepare.
 
-    def _remove_background(self):
-        # Get background map and subtract.
+        Parameters
+        ----------
+        shape : tuple
+            Shape of the image.
+
+        Returns
+        -------
+        windows : list
+            A list of (y_min, y_max, x_min, x_max) windows of the regions
+            of interest, padded by a pixel of the masked exterior, or None
+            to prepare the whole image.
+        """
+        if self.roi is None:
+            return None
+        return self._merge_windows(self._get_roi_windows(shape, 1))
+
+    @staticmethod
+    def _get_regions(windows):
+        """Return the windows as slices, or the whole image if None."""
+        if windows is None:
+            return [np.s_[:, :]]
+        return [np.s_[y_min:y_max, x_min:x_max]
+                for y_min, y_max, x_min, x_max in windows]
+
+    @staticmethod
+    def _get_bounding_region(windows):
+        """Return the slices of the bounding box of the windows."""
+        if windows is None:
+            return np.s_[:, :]
+        windows = np.asarray(windows)
+        return np.s_[windows[:, 0].min():windows[:, 1].max(),
+                     windows[:, 2].min():windows[:, 3].max()]
+
+    def _get_mask(self, region):
+        """Return the mask inside the region, or None if no mask."""
+        return None if self.mask is None else self.mask[region]
+
+    def _subtract_in_windows(self, image, background, windows):
+        """
+        Return the background subtracted image inside the windows.
+
+        Parameters
+        ----------
+        image : numpy.ndarray
+            Image before the background removal.
+        background : float or numpy.ndarray
+            Constant background, or a background map of the image shape.
+        windows : list
+            Windows to subtract the background in, or None for the whole
+            image. The pixels outside the windows are zero.
+
+        Returns
+        -------
+        image : numpy.ndarray
+            A new background removed image.
+        """
+        if windows is None:
+            return np.subtract(image, background, dtype=self.dtype)
+
+        result = np.zeros(image.shape, dtype=self.dtype)
+        for region in self._get_regions(windows):
+            np.subtract(image[region], background if np.isscalar(background)
+                        else background[region], out=result[region],
+                        dtype=self.dtype, casting='same_kind')
+
+        return result
+
+    def _get_detection_image(self):
+        """
+        Return the image to search streaks in, and its noise.
+
+        Returns
+        -------
+        image : numpy.ndarray
+            The signal-to-noise image if local_threshold is True, or the
+            background removed image otherwise.
+        noise : float
+            Standard deviation of the noise of the image.
+        """
+        if self.snr_image is not None:
+            return self.snr_image, 1.
+        return self.image, self._std
+
+    def _get_rms_map(self, image, mask=None):
+        """
+        Return a map of the background RMS at the full resolution.
+
+        Parameters
+        ----------
+        image : numpy.ndarray
+            Image before the background removal, of the region where
+            the background was removed.
+        mask : numpy.ndarray, optional
+            Mask of the image.
+
+        Returns
+        -------
+        rms : numpy.ndarray
+            A new array of the background RMS.
+        """
+        if self.remove_bkg == 'map':
+            rms = self._bkg.background_rms
+            factors = (self.pyramid_factor, self.pyramid_factor)
+        else:
+            rms, factors = self._get_box_rms(image, mask)
+
+        # Boxes without valid pixels have the global noise.
+        rms = np.where(rms > 0., rms, self._std)
+
+        # Back to the full resolution.
+        rms = rms.astype(self.dtype, copy=False)
+        if factors != (1, 1):
+            rms = np.repeat(np.repeat(rms, factors[0], axis=0), factors[1],
+                            axis=1)
+            rms = rms[:image.shape[0], :image.shape[1]]
+        if rms.shape != image.shape:
+            # Pixels beyond the last full box have the RMS of the last box.
+            rms = np.pad(rms, [(0, image.shape[0] - rms.shape[0]),
+                               (0, image.shape[1] - rms.shape[1])],
+                         mode='edge')
+
+        return rms
+
+    def _get_box_rms(self, image, mask=None):
+        """
+        Return the robust RMS of the background in boxes.
+
+        The RMS of each box is the median absolute deviation, scaled to
+        the standard deviation, of about 16 x 16 pixels sampled in the box.
+        The map is then median filtered over 3 x 3 boxes.
+
+        Parameters
+        ----------
+        image : numpy.ndarray
+            Image before the background removal.
+        mask : numpy.ndarray, optional
+            Mask of the image.
+
+        Returns
+        -------
+        rms : numpy.ndarray
+            RMS of each box.
+        factors : tuple
+            Size of the boxes in pixels along the y and x axes.
+        """
+        box_size = max(int(self.bkg_box_size), 1)
+        stride = max(box_size // 16, 1)
+        sample = image[::stride, ::stride].astype(np.float64)
+        if mask is not None:
+            sample[mask[::stride, ::stride]] = np.nan
+
+        # Boxes of the sampled pixels, at least one box along each axis.
+        size_y = min(max(box_size // stride, 1), sample.shape[0])
+        size_x = min(max(box_size // stride, 1), sample.shape[1])
+        ny = sample.shape[0] // size_y
+        nx = sample.shape[1] // size_x
+        boxes = sample[:ny * size_y, :nx * size_x] \
+            .reshape(ny, size_y, nx, size_x).swapaxes(1, 2) \
+            .reshape(ny, nx, size_y * size_x)
+
+        # Boxes having only masked pixels have the global noise.
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            medians = np.nanmedian(boxes, axis=2, keepdims=True)
+            rms = 1.4826 * np.nanmedian(np.abs(boxes - medians), axis=2)
+        rms[~np.isfinite(rms)] = self._std
+        rms = ndimage.median_filter(rms, size=3, mode='nearest')
+
+        return rms, (size_y * stride, size_x * stride)
+
+    def _get_windows(self):
+        """
+        Return windows to search contours in.
+
+        Returns
+        -------
+        windows : list
+            A list of (y_min, y_max, x_min, x_max) windows, or None to
+            search the whole image.
+        """
+        # The regions of interest are padded by a pixel of the masked
+        # exterior, so contours crossing their borders are closed.
+        if self.pyramid_factor > 1:
+            windows = self._find_candidate_windows()
+            if self.roi is not None:
+                windows = self._clip_windows(
+                    windows, self._get_roi_windows(self.image.shape, 1))
+            return windows
+        if self.roi is not None:
+            return self._merge_windows(
+                self._get_roi_windows(self.image.shape, 1))
+        return None
+
+    def _get_roi_windows(self, shape, padding=0):
+        """
+        Return the regions of interest as windows inside the image.
+
+        Parameters
+        ----------
+        shape : tuple
+            Shape of the image.
+        padding : int, optional
+            Padding in pixels around each region.
+
+        Returns
+        -------
+        windows : list
+            A list of (y_min, y_max, x_min, x_max) windows.
+        """
+        height, width = shape
+        windows = []
+        for x_min, x_max, y_min, y_max in self.roi:
+            window = [max(int(np.floor(y_min)) - padding, 0),
+                      min(int(np.ceil(y_max)) + padding, height),
+                      max(int(np.floor(x_min)) - padding, 0),
+                      min(int(np.ceil(x_max)) + padding, width)]
+            if window[0] < window[1] and window[2] < window[3]:
+                windows.append(window)
+
+        return windows
+
+    def _clip_windows(self, windows, regions):
+        """Return the overlaps of the windows with the regions."""
+        clipped = []
+        for window in windows:
+            for region in regions:
+                overlap = [max(window[0], region[0]),
+                           min(window[1], region[1]),
+                           max(window[2], region[2]),
+                           min(window[3], region[3])]
+                if overlap[0] < overlap[1] and overlap[2] < overlap[3]:
+                    clipped.append(overlap)
+
+        return self._merge_windows(clipped)
+
+    def _subtract_reference(self):
+        """
+        Subtract the reference image from the raw image.
+
+        Returns
+        -------
+        image : numpy.ndarray
+            Difference image, or the raw image if there is no reference.
+        """
+        if self.reference is None:
+            return self.raw_image
+
+        if isinstance(self.reference, ReferenceStack):
+            reference = self.reference.get_reference()
+            # Add the current frame for the next frames.
+            self.reference.add(self.raw_image)
+            if reference is None:
+                return self.raw_image
+        else:
+            reference = self.reference
+
+        if reference.shape != self.raw_image.shape:
+            raise RuntimeError('The reference shape %s does not match the '
+                               'image shape %s.' %
+                               (reference.shape, self.raw_image.shape))
+
+        return np.subtract(self.raw_image, reference, dtype=self.dtype)
+
+    def _remove_background(self, image, windows=None):
+        # Get background map of the bounding box of the windows and
+        # subtract.
+        region = self._get_bounding_region(windows)
+        step = self.pyramid_factor
+        box_size = max(self.bkg_box_size // step, 1)
         sigma_clip = SigmaClip(sigma=3., maxiters=10)
         bkg_estimator = MedianBackground()
-        self._bkg = Background2D(self.raw_image,
-                           (self.bkg_box_size, self.bkg_box_size),
-                           filter_size=(3, 3),
+        mask = self._get_mask(region)
+        mask = None if mask is None else mask[::step, ::step]
+        self._bkg = Background2D(image[region][::step, ::step],
+                           (box_size, box_size),
+                           filter_size=(3, 3), mask=mask,
                            sigma_clip=sigma_clip, bkg_estimator=bkg_estimator)
-        self.background_map = self._bkg.background
-        self.image = self.raw_image - self.background_map
+        background_map = self._bkg.background
+        shape = image[region].shape
+        if step > 1:
+            # Back to the full resolution.
+            background_map = np.repeat(np.repeat(background_map, step,
+                                                 axis=0), step, axis=1)
+            background_map = background_map[:shape[0], :shape[1]]
+        background_map = background_map.astype(self.dtype, copy=False)
+        if windows is None:
+            self.background_map = background_map
+            self.image = image - self.background_map
+        else:
+            self.background_map = np.zeros(image.shape, dtype=self.dtype)
+            self.background_map[region] = background_map
+            self.image = self._subtract_in_windows(
+                image, self.background_map, windows)
 
         self._med = self._bkg.background_median
         self._std = self._bkg.background_rms_median
 
-    def _detect_streaks(self):
+    def _detect_streaks(self, windows=None):
         # Find contours.
         # Returned contours is the list of [row, columns] (i.e. [y, x])
-        contours = measure.find_contours(
-            self.image, self._std * self.contour_threshold,
-            fully_connected=self.fully_connected)
+        contours = self._find_contours(windows)
 
         # Quantify shapes of the contours and save them as 'edges'.
         edge = EDGE(contours, min_points=self.min_points,
                     shape_cut=self.shape_cut, area_cut=self.area_cut,
                     radius_dev_cut=self.radius_dev_cut,
-                    connectivity_angle=self.connectivity_angle)
+                    connectivity_angle=self.connectivity_angle,
+                    max_outer_points=self._max_outer_points)
         edge.quantify()
         self.raw_borders = edge.get_edges()
 
@@ -163,17 +861,258 @@ class Streak:
         # Set streaks variable.
         self.streaks = edge.get_edges()
 
+    def _find_contours(self, windows=None):
+        """
+        Find contours of the image, or only inside the windows.
+
+        Parameters
+        ----------
+        windows : list, optional
+            A list of (y_min, y_max, x_min, x_max) windows. If None,
+            the whole image is searched.
+
+        Returns
+        -------
+        contours : list
+            A list of contours in the image coordinates.
+        """
+        image, noise = self._get_detection_image()
+        level = noise * self.contour_threshold
+        if windows is None:
+            windows = [(0, image.shape[0], 0, image.shape[1])]
+
+        # Note that find_contours always works in float64, so the
+        # coordinates are converted back to the image data type. Within a
+        # memory budget, only a strip of each window is converted at once.
+        contours = []
+        for y_min, y_max, x_min, x_max in windows:
+            for contour in find_contours(
+                    image[y_min:y_max, x_min:x_max], level,
+                    fully_connected=self.fully_connected,
+                    strip_height=self.strip_height):
+                contour = contour.astype(self.dtype, copy=False)
+                contour += (y_min, x_min)
+                contours.append(contour)
+
+        return contours
+
+    def _find_candidate_windows(self):
+        """
+        Find windows around elongated regions in the binned image.
+
+        Returns
+        -------
+        windows : list
+            A list of non-overlapping (y_min, y_max, x_min, x_max) windows.
+        """
+        step = self.pyramid_factor
+        image, noise = self._get_detection_image()
+        binned = bin_image(image, step)
+
+        # The noise of the binned image is smaller by the binning factor.
+        contours = measure.find_contours(
+            binned, noise / step * self.contour_threshold,
+            fully_connected=self.fully_connected)
+
+        # Shape factors of the closed contours. Point sources are round,
+        # and noise is mostly within a binned pixel.
+        shape_factors = np.zeros(len(contours))
+        closed = [i for i, contour in enumerate(contours)
+                  if np.all(contour[0] == contour[-1])]
+        if len(closed) > 0:
+            counts = np.array([len(contours[i]) for i in closed])
+            offsets = np.zeros(len(closed), dtype=np.intp)
+            offsets[1:] = np.cumsum(counts)[:-1]
+            points = np.concatenate([contours[i] for i in closed])
+            areas, perimeters = EDGE([]).get_shape_factors(
+                points[:, 1], points[:, 0], offsets)[:2]
+            shape_factors[closed] = 4. * np.pi * areas / perimeters ** 2.
+
+        # Elongated regions larger than a binned pixel are candidates.
+        padding = 2 * step
+        windows = []
+        for contour, shape_factor in zip(contours, shape_factors):
+            y_min, x_min = np.floor(contour.min(axis=0))
+            y_max, x_max = np.ceil(contour.max(axis=0))
+            if max(y_max - y_min, x_max - x_min) < 2 or shape_factor > 0.6:
+                continue
+            windows.append([max(int(y_min) * step - padding, 0),
+                            min(int(y_max + 1) * step + padding,
+                                self.image.shape[0]),
+                            max(int(x_min) * step - padding, 0),
+                            min(int(x_max + 1) * step + padding,
+                                self.image.shape[1])])
+
+        return self._merge_windows(windows)
+
+    def _merge_windows(self, windows):
+        """Merge overlapping windows until none of them overlaps."""
+        merged = True
+        while merged:
+            merged = False
+            result = []
+            for window in windows:
+                for other in result:
+                    if window[0] < other[1] and other[0] < window[1] and \
+                       window[2] < other[3] and other[2] < window[3]:
+                        other[0] = min(other[0], window[0])
+                        other[1] = max(other[1], window[1])
+                        other[2] = min(other[2], window[2])
+                        other[3] = max(other[3], window[3])
+                        merged = True
+                        break
+                else:
+                    result.append(list(window))
+            windows = result
+
+        return windows
+
+    def _detect_streaks_hough(self):
+        # Search straight lines.
+        image, noise = self._get_detection_image()
+        hough = Hough(image, noise, self.contour_threshold,
+                      bin_factor=self.hough_bin_factor,
+                      min_length=self.hough_min_length)
+        hough.detect()
+        self.raw_borders = hough.get_edges()
+
+        # Link the lines by their slopes.
+        edge = EDGE([], connectivity_angle=self.connectivity_angle)
+        edge.edges = list(self.raw_borders)
+        edge.connect_edges()
+
+        # Set streaks variable.
+        self.streaks = edge.get_edges()
+
     def _detect_sources(self):
-        from photutils.detection import DAOStarFinder
+        """
+        Build a mask of point sources.
+
+        Without a source catalog, each connected region above the contour
+        threshold whose elongation is within "source_elongation" is
+        regarded as a point source.
+
+        Returns
+        -------
+        mask : numpy.ndarray
+            Boolean mask that is True at pixels of point sources.
+        """
+        if self.source_catalog is not None:
+            return self._mask_catalog_sources()
+
+        # Sources are only searched in the regions of interest.
+        image, noise = self._get_detection_image()
+        windows = self._get_frame_windows(image.shape)
+        if windows is None:
+            return self._find_sources(image, noise)
+
+        mask = np.zeros(image.shape, dtype=bool)
+        for region in self._get_regions(windows):
+            mask[region] = self._find_sources(image[region], noise)
+
+        return mask
+
+    def _find_sources(self, image, noise):
+        """
+        Return a mask of the point sources in an image.
+
+        Parameters
+        ----------
+        image : numpy.ndarray
+            Image to search sources in.
+        noise : float
+            Standard deviation of the noise of the image.
+
+        Returns
+        -------
+        mask : numpy.ndarray
+            Boolean mask that is True at pixels of point sources.
+        """
+        # Connected regions above the contour threshold. Connect the high
+        # values diagonally as well if so does find_contours.
+        if self.fully_connected == 'high':
+            structure = np.ones((3, 3), dtype=bool)
+        else:
+            structure = None
+        labels, n_labels = ndimage.label(
+            image > noise * self.contour_threshold,
+            structure=structure)
+
+        # Regions that are not elongated are point sources, whatever their
+        # size, so blended stars are masked as well. The elongation is
+        # the ratio of the major to the minor axis of the second moments
+        # of the pixel positions.
+        ys, xs = np.nonzero(labels)
+        indices = labels[ys, xs]
+        counts = np.maximum(np.bincount(indices, minlength=n_labels + 1), 1)
+
+        def get_mean(values):
+            return np.bincount(indices, values, n_labels + 1) / counts
+
+        y_mean = get_mean(ys)
+        x_mean = get_mean(xs)
+        ys = ys - y_mean[indices]
+        xs = xs - x_mean[indices]
+        # A pixel has a variance of 1/12 by itself.
+        yy = get_mean(ys**2) + 1. / 12.
+        xx = get_mean(xs**2) + 1. / 12.
+        xy = get_mean(xs * ys)
+        half_difference = np.hypot((yy - xx) / 2., xy)
+        major = (yy + xx) / 2. + half_difference
+        minor = (yy + xx) / 2. - half_difference
+        is_source = major <= self.source_elongation**2 * minor
+        is_source[0] = False
+
+        return is_source[labels]
+
+    def _mask_catalog_sources(self):
+        """
+        Build a mask of circles around the sources in the source catalog.
 
-        fwhm = 3.
-        detection_threshold = 3.
-        daofind = DAOStarFinder(threshold=(self._med + self._std *
-                                detection_threshold), fwhm=fwhm)
-        sources = daofind.find_stars(self.image)
-        pl.plot(sources['xcentroid'], sources['ycentroid'], 'r.')
+        Returns
+        -------
+        mask : numpy.ndarray
+            Boolean mask that is True at pixels of point sources.
+        """
+        xs, ys = self._get_catalog_positions()
+
+        # Pixel offsets inside a circle of the source radius.
+        r = int(np.ceil(self.source_radius))
+        dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+        inside = dx**2 + dy**2 <= self.source_radius**2
+        dx = dx[inside]
+        dy = dy[inside]
+
+        # Masked pixels of all the sources at once.
+        xx = np.rint(xs).astype(np.intp)[:, np.newaxis] + dx
+        yy = np.rint(ys).astype(np.intp)[:, np.newaxis] + dy
+        valid = (xx >= 0) & (xx < self.image.shape[1]) & \
+                (yy >= 0) & (yy < self.image.shape[0])
 
-    def _find_box(self, n, edges, xs, ys):
+        mask = np.zeros(self.image.shape, dtype=bool)
+        mask[yy[valid], xx[valid]] = True
+
+        return mask
+
+    def _get_catalog_positions(self):
+        """
+        Return the pixel coordinates of the sources in the source catalog.
+
+        Returns
+        -------
+        xs, ys : numpy.ndarray
+            X and Y coordinates.
+        """
+        catalog = self.source_catalog
+        if hasattr(catalog, 'colnames') or hasattr(catalog, 'keys'):
+            xs = np.asarray(catalog['xcentroid'], dtype=np.float64)
+            ys = np.asarray(catalog['ycentroid'], dtype=np.float64)
+        else:
+            xs, ys = np.asarray(catalog, dtype=np.float64).reshape(-1, 2).T
+
+        return xs, ys
+
+    def _find_box(self, n, edges, xs, ys, plotted):
         """
         Connect edges by their "connectivity" values.
 
@@ -190,6 +1129,9 @@ class Streak:
             X min and max coordinates. (N,2) matrix.
         ys : array_like
             Y min and max coordinates. (N,2) matrix.
+        plotted : set
+            Indices of the edges already surrounded by a box, which the
+            current edge is added to.
 
         Returns
         -------
@@ -200,13 +1142,14 @@ class Streak:
         """
         # Add current coordinates.
         current_edge = [edge for edge in edges if edge['index'] == n][0]
-        current_edge['box_plotted'] = True
+        plotted.add(n)
         xs.append([current_edge['x_min'], current_edge['x_max']])
         ys.append([current_edge['y_min'], current_edge['y_max']])
 
         # If connected with other edge.
         if current_edge['connectivity'] != -1:
-            self._find_box(current_edge['connectivity'], edges, xs, ys)
+            self._find_box(current_edge['connectivity'], edges, xs, ys,
+                           plotted)
         # Otherwise.
         else:
             return xs, ys
@@ -220,21 +1163,23 @@ class Streak:
         cut_threshold: float, optional
             Threshold to cut image values to make it more visible.
         """
-        if not os.path.exists(self.output_path):
-            os.makedirs(self.output_path)
+        if self.image is None:
+            raise RuntimeError('No background removed image. Run detect() '
+                               'first, or cache the result with '
+                               'intermediates.')
+        self._check_output_path()
 
-        # Plot the image.
-        plot_data = self.image.copy()
+        # For plotting.
+        pl.rcParams['figure.figsize'] = [12, 9]
 
         # Background subtracted image,
         # so the median value should be close to zero.
         med = 0.
         std = self._std
 
-        plot_data[np.where(self.image > med + cut_threshold * std)] = \
-            med + cut_threshold * std
-        plot_data[np.where(self.image < med - cut_threshold * std)] = \
-            med - cut_threshold * std
+        # Plot the image, clipped into a single new array.
+        plot_data = np.clip(self.image, med - cut_threshold * std,
+                            med + cut_threshold * std)
         pl.clf()
         pl.imshow(plot_data, origin='lower', cmap='gray')
 
@@ -259,13 +1204,16 @@ class Streak:
         # Plot boxes.
         # Box margin in pixel.
         box_margin = 10
+        # Indices of the edges surrounded by a box already, kept apart
+        # from the edges, so plotting does not change the results.
+        plotted = set()
         for n, edge in enumerate(edges):
             # plot boxes around the edge.
-            if not edge['box_plotted']:
+            if edge['index'] not in plotted:
                 # Define the box to plot.
                 xs = []
                 ys = []
-                self._find_box(edge['index'], edges, xs, ys)
+                self._find_box(edge['index'], edges, xs, ys, plotted)
                 x_min = max(np.min(xs) - box_margin, 0)
                 x_max = min(np.max(xs) + box_margin, self.image.shape[1])
                 y_min = max(np.min(ys) - box_margin, 0)
@@ -273,7 +1221,6 @@ class Streak:
                 box_x = [x_min, x_min, x_max, x_max]
                 box_y = [y_min, y_max, y_max, y_min]
                 # pl.fill(box_x, box_y, ls='--', fill=False, ec='r', lw=2)
-                edge['box_plotted'] = True
 
         pl.xlabel('X/pixel')
         pl.ylabel('Y/pixel')
@@ -281,21 +1228,17 @@ class Streak:
         pl.savefig('%sall.png' % self.output_path)
 
         # Plot all individual edges (connected).
+        plotted = set()
         for n, edge in enumerate(edges):
-            # Reset.
-            edge['box_plotted'] = False
-
-        for n, edge in enumerate(edges):
-            if not edge['box_plotted']:
+            if edge['index'] not in plotted:
                 # Define the box to plot.
                 xs = []
                 ys = []
-                self._find_box(edge['index'], edges, xs, ys)
+                self._find_box(edge['index'], edges, xs, ys, plotted)
                 x_min = max(np.min(xs) - box_margin, 0)
                 x_max = min(np.max(xs) + box_margin, self.image.shape[1])
                 y_min = max(np.min(ys) - box_margin, 0)
                 y_max = min(np.max(ys) + box_margin, self.image.shape[0])
-                edge['box_plotted'] = True
                 pl.axis([x_min, x_max, y_min, y_max])
                 pl.savefig('%s%d.png' % (self.output_path, edge['index']))
 
@@ -324,8 +1267,7 @@ class Streak:
         """
 
         try:
-            header = fits.getheader(filename)
-            w = WCS(header)
+            w = self._get_wcs(filename)
             astcoords_deg = w.wcs_pix2world([[x, y]], 0)
             c = coordinates.SkyCoord(astcoords_deg * u.deg,
                                              frame='icrs')
@@ -362,8 +1304,7 @@ class Streak:
         """
 
         try:
-            header = fits.getheader(filename)
-            w = WCS(header)
+            w = self._get_wcs(filename)
             astcoords_deg = w.wcs_pix2world([[x, y]], 0)
 
             astcoords = coordinates.SkyCoord(
@@ -375,11 +1316,71 @@ class Streak:
             _ = e
             pass
 
-    def write_outputs(self, filename: str = 'streaks.txt'):
-        """Write information of detected streaks to a file."""
+    def _get_wcs(self, filename=None):
+        """Return the WCS of the image, or of the given fits file."""
+        if filename is None or filename == self.filename:
+            return self.wcs
+        return WCS(fits.getheader(filename))
+
+    def _check_output_path(self):
+        """Create the output path if it does not exist."""
+        if self.output_path is None:
+            raise RuntimeError('"output_path" must be given to write outputs '
+                               'of a Streak created without a filename.')
         if not os.path.exists(self.output_path):
             os.makedirs(self.output_path)
 
+    def get_outputs(self):
+        """
+        Return information of detected streaks without writing a file.
+
+        Returns
+        -------
+        outputs : list of dict
+            One dictionary per streak, having the same values as the
+            columns of the output file. Sky coordinates are in degrees and
+            only given if the image has WCS information.
+        """
+        if self.catalog is None:
+            raise RuntimeError('Streaks must be detected first.')
+
+        return self.catalog.to_dicts()
+
+    def get_profiles(self, step=1., half_width=None, padding=10):
+        """
+        Return brightness profiles along and across the detected streaks.
+
+        All the streaks are sampled at once in the background removed
+        image. See astride.utils.profile.get_profiles for details.
+
+        Parameters
+        ----------
+        step : float, optional
+            Sampling interval along each streak in pixels.
+        half_width : float, optional
+            Half width in pixels of the band across each streak to sum the
+            flux in. If None, the thickness of each streak is used.
+        padding : int, optional
+            Padding in pixels around each streak of its cutout.
+
+        Returns
+        -------
+        profiles : list of dict
+            One dictionary per streak, having the 'index', 'distance',
+            'flux', 'width', 'cutout' and 'cutout_origin' values.
+        """
+        if self.image is None:
+            raise RuntimeError('No background removed image. Run detect() '
+                               'first, or cache the result with '
+                               'intermediates.')
+
+        return get_profiles(self.image, self.streaks, step=step,
+                            half_width=half_width, padding=padding)
+
+    def write_outputs(self, filename: str = 'streaks.txt'):
+        """Write information of detected streaks to a file."""
+        self._check_output_path()
+
         filepath = os.path.join(self.output_path, filename)
         with open(filepath, 'w') as fp:
             # Define the headers for both cases
@@ -0,0 +1,316 @@
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+
+from astride.catalog import StreakCatalog
+from astride.utils.logger import Logger, init_worker, stop_queue
+
+
+def _init_worker(queue, level):
+    """
+    Import the detection pipeline once per worker process, and send its
+    log records to the server process.
+    """
+    import astride.detect  # noqa: F401
+
+    init_worker(queue, level)
+
+
+def _detect(path=None, data=None, params=None, label=None):
+    """
+    Detect streaks in a frame inside a worker process.
+
+    Parameters
+    ----------
+    path : str, optional
+        Fits filename.
+    data : numpy.ndarray, optional
+        Image data, used instead of the fits file.
+    params : dict, optional
+        Options of the Streak class.
+    label : str, optional
+        Label of the image data in the log records.
+
+    Returns
+    -------
+    catalog : bytes
+        Serialized catalog of detected streaks without the contours.
+        See StreakCatalog.to_bytes.
+    """
+    from astride.detect import Streak
+
+    params = params or {}
+    if data is not None:
+        streak = Streak.from_array(data, label=label, **params)
+    else:
+        streak = Streak(path, **params)
+
+    return streak.detect().to_bytes()
+
+
+class StreakServer:
+    """
+    Resident streak detection service over HTTP.
+
+    Frames are processed by warm worker processes, so the interpreter
+    start-up and the imports are paid once. The service answers the
+    following requests:
+
+    POST /detect
+        A JSON body {"path": ..., "params": {...}} of a fits file, or
+        {"frames": [{"path": ...}, ...]} to process a batch of frames in
+        parallel. Alternatively, raw image bytes with the "X-Shape"
+        (e.g. "512,512") and "X-Dtype" (e.g. "float32") headers, and
+        optionally Streak options as JSON in the "X-Params" header and
+        the label of the frame in the log records in the "X-Label"
+        header (by default "request-N" of the N-th request).
+        Responds {"streaks": [...]} or {"results": [...]} for a batch.
+    GET /metrics
+        Request counts and latency percentiles in seconds.
+
+    If more than max_pending frames are being processed, new requests are
+    rejected with "503 Service Unavailable" instead of being queued.
+
+    Parameters
+    ----------
+    host : str, optional
+        Host address to listen on.
+    port : int, optional
+        Port to listen on. If zero, a free port is chosen (see port).
+    n_workers : int, optional
+        The number of worker processes. If None, the number of CPUs.
+    max_pending : int, optional
+        The maximum number of frames being processed at once.
+    params : dict, optional
+        Default options of the Streak class, updated by the options
+        of each request.
+    history : int, optional
+        The number of latest frames used for the latency percentiles.
+    """
+    def __init__(self, host='127.0.0.1', port=0, n_workers=None,
+                 max_pending=16, params=None, history=1000):
+        self.params = params or {}
+        self.max_pending = max_pending
+        self.logger = Logger().getLogger()
+
+        self._queue = Logger().get_queue()
+        self._executor = ProcessPoolExecutor(
+            max_workers=n_workers, initializer=_init_worker,
+            initargs=(self._queue, self.logger.level))
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=history)
+        self._counts = {'requests': 0, 'frames': 0, 'rejected': 0,
+                        'errors': 0}
+        self._pending = 0
+        self._thread = None
+
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+
+    @property
+    def port(self):
+        """Port the service listens on."""
+        return self._httpd.server_address[1]
+
+    def start(self):
+        """Start serving in a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        self.logger.info('Serving on %s:%d.', *self._httpd.server_address)
+
+    def serve_forever(self):
+        """Serve until interrupted."""
+        self.logger.info('Serving on %s:%d.', *self._httpd.server_address)
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Stop serving and the worker processes."""
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+        self._executor.shutdown()
+        # Release the log queue once, even if shut down again.
+        if self._queue is not None:
+            self._queue = None
+            stop_queue()
+
+    def get_metrics(self):
+        """
+        Return request counts and latency percentiles.
+
+        Returns
+        -------
+        metrics : dict
+            Counts of requests, frames, rejected and failed requests,
+            frames being processed, and percentiles of the latency
+            per frame in seconds.
+        """
+        with self._lock:
+            metrics = dict(self._counts)
+            metrics['pending'] = self._pending
+            latencies = np.array(self._latencies)
+
+        metrics['latency'] = {}
+        if len(latencies) > 0:
+            for percentile in (50, 90, 99):
+                metrics['latency']['p%d' % percentile] = \
+                    float(np.percentile(latencies, percentile))
+            metrics['latency']['max'] = float(latencies.max())
+
+        return metrics
+
+    def _acquire(self, n_frames):
+        """Reserve slots for frames, or return False if too busy."""
+        with self._lock:
+            if self._pending + n_frames > self.max_pending:
+                self._counts['rejected'] += 1
+                return False
+            self._pending += n_frames
+        return True
+
+    def _release(self, n_frames):
+        with self._lock:
+            self._pending -= n_frames
+
+    def _process(self, frames):
+        """
+        Detect streaks in the frames in parallel.
+
+        Parameters
+        ----------
+        frames : list of dict
+            Arguments of _detect for each frame.
+
+        Returns
+        -------
+        results : list of list
+            Information of detected streaks of each frame. See
+            Streak.get_outputs.
+        """
+        start = time.time()
+        futures = [self._executor.submit(_detect, **frame)
+                   for frame in frames]
+        results = []
+        for future in futures:
+            results.append(StreakCatalog.from_bytes(future.result())
+                           .to_dicts())
+            with self._lock:
+                self._latencies.append(time.time() - start)
+                self._counts['frames'] += 1
+
+        return results
+
+    def _parse_frames(self, handler, body, request_id):
+        """Return the frames of a request."""
+        content_type = handler.headers.get('Content-Type', '')
+        if content_type.startswith('application/octet-stream'):
+            shape = tuple(int(n)
+                          for n in handler.headers['X-Shape'].split(','))
+            dtype = np.dtype(handler.headers.get('X-Dtype', 'float64'))
+            data = np.frombuffer(body, dtype=dtype).reshape(shape)
+            params = dict(self.params)
+            params.update(json.loads(handler.headers.get('X-Params', '{}')))
+            label = handler.headers.get('X-Label',
+                                        'request-%d' % request_id)
+            return [{'data': data, 'params': params, 'label': label}], False
+
+        request = json.loads(body)
+        batch = 'frames' in request
+        frames = []
+        for frame in (request['frames'] if batch else [request]):
+            params = dict(self.params)
+            params.update(frame.get('params', {}))
+            frames.append({'path': frame['path'], 'params': params})
+
+        return frames, batch
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if urlparse(self.path).path == '/metrics':
+                    self._respond(200, server.get_metrics())
+                else:
+                    self._respond(404, {'error': 'Not found.'})
+
+            def do_POST(self):
+                if urlparse(self.path).path != '/detect':
+                    self._respond(404, {'error': 'Not found.'})
+                    return
+
+                with server._lock:
+                    server._counts['requests'] += 1
+                    request_id = server._counts['requests']
+                body = self.rfile.read(int(self.headers.get('Content-Length',
+                                                            0)))
+                try:
+                    frames, batch = server._parse_frames(self, body,
+                                                         request_id)
+                except (KeyError, ValueError, TypeError) as e:
+                    self._respond(400, {'error': 'Bad request: %s' % e})
+                    return
+
+                if not server._acquire(len(frames)):
+                    self._respond(503, {'error': 'Too many pending frames.'},
+                                  {'Retry-After': '1'})
+                    return
+                try:
+                    results = server._process(frames)
+                except Exception as e:
+                    with server._lock:
+                        server._counts['errors'] += 1
+                    server.logger.error('Detection failed: %s', e)
+                    self._respond(500, {'error': str(e)})
+                    return
+                finally:
+                    server._release(len(frames))
+
+                if batch:
+                    self._respond(200, {'results': results})
+                else:
+                    self._respond(200, {'streaks': results[0]})
+
+            def _respond(self, code, content, headers=None):
+                body = json.dumps(content).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                server.logger.debug(format, *args)
+
+        return Handler
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Serve ASTRiDE streak detection over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-pending', type=int, default=16)
+    args = parser.parse_args()
+
+    StreakServer(args.host, args.port, n_workers=args.workers,
+                 max_pending=args.max_pending).serve_forever()
@@ -0,0 +1,288 @@
+import copy
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from astride.detect import Streak
+from astride.utils.edge import EDGE
+
+# Parameters of each stage of the pipeline. Later stages are computed once
+# per set of the parameters of the earlier stages.
+BACKGROUND_PARAMETERS = ('remove_bkg', 'bkg_box_size')
+CONTOUR_PARAMETERS = ('contour_threshold', 'fully_connected')
+EDGE_PARAMETERS = ('min_points',)
+CUT_PARAMETERS = ('shape_cut', 'area_cut', 'radius_dev_cut')
+LINK_PARAMETERS = ('connectivity_angle',)
+
+
+def _expand(grid, names):
+    """Return all the combinations of the grid values of the parameters."""
+    values = [grid[name] for name in names]
+    return [dict(zip(names, combination))
+            for combination in itertools.product(*values)]
+
+
+def _get_background_key(streak, background_set):
+    """
+    Return a key of a background parameter set, which is the same for the
+    sets giving the same prepared image.
+    """
+    # The box size is only used by the background map and the RMS map.
+    if background_set['remove_bkg'] == 'map' or streak.local_threshold:
+        return tuple(background_set.items())
+    return (background_set['remove_bkg'],)
+
+
+def _sweep_contours(streak, grid, mask_sources=False):
+    """
+    Detect streaks for all the parameter sets sharing a prepared image.
+
+    Contours are searched once per contour parameter set, quantified once
+    per edge parameter set, and the cuts are applied to all the edges of
+    all the cut parameter sets at once.
+
+    Parameters
+    ----------
+    streak : Streak
+        A Streak instance whose image is prepared.
+    grid : dict
+        Values of the parameters, except for the background parameters.
+    mask_sources : bool, optional
+        If True, point sources are detected and masked for each contour
+        parameter set, since they are found above the contour threshold.
+
+    Returns
+    -------
+    rows : list of dict
+        Parameters and detected streaks of each parameter set.
+    """
+    rows = []
+    cut_sets = _expand(grid, CUT_PARAMETERS)
+    cuts = np.array([[cut_set[name] for name in CUT_PARAMETERS]
+                     for cut_set in cut_sets])
+    prepared = streak
+    for contour_set in _expand(grid, CONTOUR_PARAMETERS):
+        if mask_sources:
+            streak = copy.copy(prepared)
+            streak.image = prepared.image.copy()
+            if prepared.snr_image is not None:
+                streak.snr_image = prepared.snr_image.copy()
+        for name, value in contour_set.items():
+            setattr(streak, name, value)
+        if mask_sources:
+            streak._mask_sources()
+        contours = streak._find_contours(streak._get_windows())
+
+        for edge_set in _expand(grid, EDGE_PARAMETERS):
+            edge = EDGE(contours, max_outer_points=streak._max_outer_points,
+                        **edge_set)
+            edge.quantify()
+            edges = edge.get_edges()
+
+            # Pass or fail of every edge for every cut set, (N_cut, N_edge).
+            shape_factors = np.array([e['shape_factor'] for e in edges])
+            areas = np.array([e['area'] for e in edges])
+            radius_deviations = np.array([e['radius_deviation']
+                                          for e in edges])
+            passed = (shape_factors <= cuts[:, 0:1]) & \
+                     (areas >= cuts[:, 1:2]) & \
+                     (radius_deviations >= cuts[:, 2:3])
+
+            for cut_set, cut_passed in zip(cut_sets, passed):
+                indices = np.nonzero(cut_passed)[0]
+                for link_set in _expand(grid, LINK_PARAMETERS):
+                    # Same as EDGE.filter_edges and then EDGE.connect_edges.
+                    linked = EDGE([], **link_set)
+                    linked.edges = [dict(edges[i], index=n + 1,
+                                         connectivity=-1)
+                                    for n, i in enumerate(indices)]
+                    linked.connect_edges()
+
+                    row = {}
+                    for parameters in (contour_set, edge_set, cut_set,
+                                       link_set):
+                        row.update(parameters)
+                    row['streaks'] = linked.get_edges()
+                    row['n_streaks'] = len(row['streaks'])
+                    rows.append(row)
+
+    return rows
+
+
+def _score(streaks, ground_truth, match_distance, match_angle):
+    """
+    Return the scores of detected streaks against the ground truth.
+
+    A detected streak matches a true streak if its center is within
+    match_distance pixels of the true segment, and its slope angle is
+    within match_angle degrees of that of the true segment.
+
+    Returns
+    -------
+    scores : dict
+        Precision, recall and F1 score.
+    """
+    truth = np.asarray(ground_truth, dtype=np.float64).reshape(-1, 4)
+    if len(streaks) == 0 or len(truth) == 0:
+        precision = 0. if len(streaks) > 0 else 1.
+        recall = 0. if len(truth) > 0 else 1.
+    else:
+        centers = np.array([[e['x_center'], e['y_center']] for e in streaks])
+        angles = np.array([e['slope_angle'] for e in streaks])
+
+        # Distances from every center to every true segment, (N, M).
+        p1 = truth[:, 0:2]
+        p2 = truth[:, 2:4]
+        direction = p2 - p1
+        t = np.sum((centers[:, np.newaxis] - p1) * direction, axis=2) / \
+            np.maximum(np.sum(direction**2, axis=1), 1e-12)
+        nearest = p1 + np.clip(t, 0., 1.)[:, :, np.newaxis] * direction
+        distances = np.sqrt(np.sum((centers[:, np.newaxis] - nearest)**2,
+                                   axis=2))
+
+        # Angle differences, where 90 and -90 degree are the same.
+        true_angles = np.degrees(np.arctan2(direction[:, 1],
+                                            direction[:, 0]))
+        differences = np.abs((angles[:, np.newaxis] - true_angles + 90.) %
+                             180. - 90.)
+
+        matched = (distances <= match_distance) & \
+                  (differences <= match_angle)
+        precision = np.mean(np.any(matched, axis=1))
+        recall = np.mean(np.any(matched, axis=0))
+
+    if precision + recall > 0.:
+        f1 = 2. * precision * recall / (precision + recall)
+    else:
+        f1 = 0.
+
+    return {'precision': float(precision), 'recall': float(recall),
+            'f1': float(f1)}
+
+
+def sweep(filename=None, grid=None, data=None, header=None,
+          ground_truth=None, match_distance=5., match_angle=5.,
+          n_workers=1, **kwargs):
+    """
+    Detect streaks for every parameter set of a grid.
+
+    Expensive stages are shared between the parameter sets. The
+    background is removed once per 'remove_bkg' and 'bkg_box_size' set
+    (only once per 'remove_bkg' if the box size is not used, i.e. for the
+    'constant' background without 'local_threshold'), the contours are
+    searched once per 'contour_threshold' and 'fully_connected' set, the
+    contours are quantified once per 'min_points', and the 'shape_cut',
+    'area_cut' and 'radius_dev_cut' cuts are applied to all the edges at
+    once. Point sources of 'mask_sources' are masked once per contour
+    parameter set. Only the 'contour' engine is supported.
+
+    Parameters
+    ----------
+    filename : str, optional
+        Fits filename.
+    grid : dict
+        Lists of values of the parameters to sweep, among 'remove_bkg',
+        'bkg_box_size', 'contour_threshold', 'fully_connected',
+        'min_points', 'shape_cut', 'area_cut', 'radius_dev_cut' and
+        'connectivity_angle'. The other parameters are fixed to the
+        values of the Streak class.
+    data : numpy.ndarray, optional
+        Image data to use instead of reading the fits file.
+    header : astropy.io.fits.Header, optional
+        Fits header of the image data.
+    ground_truth : array_like, optional
+        True streaks as (x1, y1, x2, y2) segments. If given, the
+        precision, recall and F1 score of each parameter set are added.
+    match_distance : float, optional
+        The maximum distance in pixels of a matched center from a true
+        segment.
+    match_angle : float, optional
+        The maximum difference in degree of a matched slope angle.
+    n_workers : int, optional
+        The number of worker processes. Each contour parameter set of each
+        background parameter set is processed by a worker.
+    kwargs : dict, optional
+        Other fixed options of the Streak class.
+
+    Returns
+    -------
+    rows : list of dict
+        One dictionary per parameter set, having the parameter values,
+        'n_streaks', 'streaks' (the detected streaks like Streak.streaks)
+        and the scores if ground_truth is given.
+    """
+    grid = dict(grid or {})
+    streak = Streak(filename, data=data, header=header, **kwargs)
+    if streak.engine != 'contour':
+        raise RuntimeError('"engine" must be "contour" to sweep '
+                           'parameters.')
+    names = BACKGROUND_PARAMETERS + CONTOUR_PARAMETERS + EDGE_PARAMETERS + \
+        CUT_PARAMETERS + LINK_PARAMETERS
+    for name in grid:
+        if name not in names:
+            raise RuntimeError('"%s" cannot be swept. It must be the one '
+                               'among: %s' % (name, ', '.join(names)))
+    for name in names:
+        grid.setdefault(name, [getattr(streak, name)])
+
+    # Subtract the reference once, since a reference stack changes
+    # whenever a frame is subtracted.
+    streak.raw_image = streak._subtract_reference()
+    streak.reference = None
+
+    # Point sources found above the contour threshold are masked per
+    # contour parameter set, and those of a source catalog only once.
+    mask_sources = streak.mask_sources and streak.source_catalog is None
+    streak.mask_sources = False
+
+    # Remove background once per background parameter set giving a
+    # different image (e.g. the box size of a constant background is not
+    # used), and then split the remaining grid into tasks per contour
+    # parameter set.
+    background_sets = _expand(grid, BACKGROUND_PARAMETERS)
+    task_indices = {}
+    tasks = []
+    for background_set in background_sets:
+        key = _get_background_key(streak, background_set)
+        if key in task_indices:
+            continue
+        for name, value in background_set.items():
+            setattr(streak, name, value)
+        streak._prepare_image()
+
+        # Only the prepared image is needed by the tasks.
+        prepared = copy.copy(streak)
+        prepared.raw_image = None
+        prepared.cache = None
+        prepared._bkg = None
+        task_indices[key] = []
+        for contour_set in _expand(grid, CONTOUR_PARAMETERS):
+            task_grid = dict(grid)
+            task_grid.update({name: [value]
+                              for name, value in contour_set.items()})
+            task_indices[key].append(len(tasks))
+            tasks.append((prepared, task_grid))
+
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(_sweep_contours, prepared, task_grid,
+                                       mask_sources)
+                       for prepared, task_grid in tasks]
+            results = [future.result() for future in futures]
+    else:
+        results = [_sweep_contours(prepared, task_grid, mask_sources)
+                   for prepared, task_grid in tasks]
+
+    rows = []
+    for background_set in background_sets:
+        key = _get_background_key(streak, background_set)
+        for index in task_indices[key]:
+            for row in results[index]:
+                row = dict(row, **background_set)
+                if ground_truth is not None:
+                    row.update(_score(row['streaks'], ground_truth,
+                                      match_distance, match_angle))
+                rows.append(row)
+
+    return rows
@@ -52,8 +52,6 @@ def test():
 
     logger.info('Done.')
 
-    logger.handlers = []
-
 
 if __name__ == '__main__':
     test()
@@ -0,0 +1,66 @@
+import numpy as np
+
+
+# Streaks as (x1, y1, x2, y2) segments and stars as (x, y) of the default
+# synthetic image.
+STREAKS = ((40, 60, 420, 150), (100, 350, 300, 250))
+STARS = ((250, 50), (450, 300), (60, 250))
+
+
+def get_synthetic_image(seed=0, shape=(400, 500), streaks=STREAKS,
+                        stars=STARS, n_random_stars=0, streak_peak=60.,
+                        star_peak=500., background=100., noise=5.):
+    """
+    Return a noisy image having streaks and stars.
+
+    Parameters
+    ----------
+    seed : int, optional
+        Seed of the noise and of the random stars.
+    shape : tuple, optional
+        Shape of the image.
+    streaks : list, optional
+        Streaks as (x1, y1, x2, y2) segments in pixels.
+    stars : list, optional
+        Stars as (x, y) positions in pixels.
+    n_random_stars : int, optional
+        The number of stars at random positions with random peaks up to
+        star_peak, added to the given stars.
+    streak_peak : float, optional
+        Peak value of the streaks above the background.
+    star_peak : float, optional
+        Peak value of the given stars above the background.
+    background : float, optional
+        Background level.
+    noise : float, optional
+        Standard deviation of the Gaussian noise.
+
+    Returns
+    -------
+    image : numpy.ndarray
+        The image in float64.
+    """
+    rng = np.random.default_rng(seed)
+    image = rng.normal(background, noise, shape)
+
+    y, x = np.mgrid[:shape[0], :shape[1]]
+    for x1, y1, x2, y2 in streaks:
+        # Distance from each pixel to the streak segment.
+        dx, dy = x2 - x1, y2 - y1
+        t = np.clip(((x - x1) * dx + (y - y1) * dy) / (dx**2 + dy**2), 0, 1)
+        distances = np.hypot(x - x1 - t * dx, y - y1 - t * dy)
+        image += streak_peak * np.exp(-0.5 * (distances / 1.5)**2)
+
+    positions = [(x0, y0, star_peak) for x0, y0 in stars]
+    positions += zip(rng.uniform(0, shape[1], n_random_stars),
+                     rng.uniform(0, shape[0], n_random_stars),
+                     rng.uniform(0.1, 1., n_random_stars) * star_peak)
+    for x0, y0, peak in positions:
+        # Only the pixels around each star, so many stars are cheap.
+        x_min, x_max = max(int(x0) - 10, 0), min(int(x0) + 11, shape[1])
+        y_min, y_max = max(int(y0) - 10, 0), min(int(y0) + 11, shape[0])
+        image[y_min:y_max, x_min:x_max] += peak * np.exp(
+            -0.5 * ((x[y_min:y_max, x_min:x_max] - x0)**2 +
+                    (y[y_min:y_max, x_min:x_max] - y0)**2) / 2.**2)
+
+    return image
@@ -0,0 +1,103 @@
+import logging
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from astride.batch import run_batch
+from astride.detect import Streak
+from astride.test.synthetic import get_synthetic_image
+from astride.utils.logger import Logger
+from astride.utils.memory import plan_frame
+
+
+def _write_frames(tmp_path, n):
+    filenames = []
+    for seed in range(n):
+        filename = str(tmp_path / ('frame%d.fits' % seed))
+        fits.writeto(filename, get_synthetic_image(seed=seed))
+        filenames.append(filename)
+
+    return filenames
+
+
+def _get_estimate(**options):
+    """Return the estimated memory of a synthetic frame in float32."""
+    return plan_frame(get_synthetic_image().shape, float('inf'), 'float32',
+                      **options)[2]
+
+
+@pytest.fixture
+def messages():
+    messages = []
+
+    class Handler(logging.Handler):
+        def emit(self, record):
+            messages.append(record.getMessage())
+
+    logger = Logger().getLogger()
+    handler = Handler(logging.INFO)
+    logger.addHandler(handler)
+    try:
+        yield messages
+    finally:
+        logger.removeHandler(handler)
+
+
+def test_results(tmp_path):
+    filenames = _write_frames(tmp_path, 3)
+    results = run_batch(filenames, n_workers=2, contour_threshold=3.)
+
+    # The results are in the order of the files, as detected one by one.
+    assert [result['filename'] for result in results] == filenames
+    for filename, result in zip(filenames, results):
+        expected = Streak(filename, contour_threshold=3.).detect()
+        assert np.array_equal(result['catalog']['x_center'],
+                              expected['x_center'])
+        assert result['peak_memory'] is None
+        assert result['max_memory'] is None
+
+    assert run_batch([]) == []
+
+
+# The budgets are in units of the estimated memory of a frame. A budget
+# smaller than a frame still uses a worker.
+@pytest.mark.parametrize('n_frames, n_workers, budget, expected', [
+    (4, 4, 2.5, 2), (4, 1, 2.5, 1), (1, 4, 2.5, 1), (4, 4, 0.5, 1)])
+def test_n_workers(tmp_path, messages, n_frames, n_workers, budget,
+                   expected):
+    filenames = _write_frames(tmp_path, n_frames)
+    max_memory = int(budget * _get_estimate())
+    results = run_batch(filenames, n_workers=n_workers,
+                        max_memory=max_memory)
+
+    share = max_memory // expected
+    assert '%d workers with %.1f MB each.' % (expected, share / 2.**20) \
+        in messages
+    for result in results:
+        assert result['max_memory'] == share
+        assert result['peak_memory'] is not None
+
+    # The peak memory of each frame is logged against its share.
+    assert sum(message.endswith(' MB of %.1f MB.' % (share / 2.**20))
+               for message in messages) == n_frames
+
+
+def test_n_workers_options(tmp_path, messages):
+    # The options enlarging the frame footprint leave fewer workers.
+    filenames = _write_frames(tmp_path, 4)
+    options = {'remove_bkg': 'map', 'local_threshold': True,
+               'mask_sources': True}
+    estimate = _get_estimate(**options)
+    assert estimate > 1.5 * _get_estimate()
+    run_batch(filenames, n_workers=4, max_memory=int(3.5 * estimate),
+              **options)
+
+    assert any(message.startswith('3 workers') for message in messages)
+
+
+def test_memory_string(tmp_path):
+    filenames = _write_frames(tmp_path, 2)
+    results = run_batch(filenames, n_workers=1, max_memory='64M')
+
+    assert [result['max_memory'] for result in results] == [64 * 2**20] * 2
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+
+from astride.detect import Streak
+from astride.test.synthetic import get_synthetic_image
+from astride.utils.cache import ResultCache
+
+
+@pytest.fixture
+def image():
+    return get_synthetic_image()
+
+
+def _get_key(cache, image, **kwargs):
+    streak = Streak.from_array(image, cache=cache, **kwargs)
+
+    return cache.get_key(streak.raw_image, streak._get_parameters())
+
+
+def test_key(tmp_path, image):
+    cache = ResultCache(str(tmp_path))
+    key = _get_key(cache, image)
+    assert _get_key(cache, image.copy()) == key
+
+    changed = image.copy()
+    changed[0, 0] += 1.
+    mask = np.zeros(image.shape, dtype=bool)
+    mask[0, 0] = True
+    keys = [_get_key(cache, changed),
+            _get_key(cache, image, contour_threshold=2.),
+            _get_key(cache, image, mask=mask),
+            _get_key(cache, image, reference=np.zeros(image.shape))]
+    assert len(set(keys + [key])) == len(keys) + 1
+
+
+def test_hit(tmp_path, image, monkeypatch):
+    streak = Streak.from_array(image, cache=str(tmp_path))
+    catalog = streak.detect()
+
+    # Detected again from the cache only.
+    def fail(self):
+        raise AssertionError('Detected again.')
+    monkeypatch.setattr(Streak, '_detect', fail)
+    streak = Streak.from_array(image, cache=str(tmp_path))
+    assert streak.detect().to_dicts() == catalog.to_dicts()
+
+    # Without intermediates, figures cannot be plotted.
+    streak.output_path = '%s/' % tmp_path
+    with pytest.raises(RuntimeError):
+        streak.plot_figures()
+    with pytest.raises(RuntimeError):
+        streak.get_profiles()
+
+
+def test_intermediates(tmp_path, image, monkeypatch):
+    cache = ResultCache(str(tmp_path / 'cache'), intermediates=True)
+    Streak.from_array(image, cache=cache).detect()
+
+    monkeypatch.setattr(Streak, '_detect', None)
+    streak = Streak.from_array(image, cache=cache)
+    streak.detect()
+    streak.output_path = '%s/' % tmp_path
+    streak.plot_figures()
+    assert len(streak.get_profiles()) == len(streak.streaks)
+
+
+def test_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path), max_size=2500)
+    data = np.zeros(100)
+    for n, key in enumerate('abc'):
+        cache.put(key, {'data': data})
+        os.utime(cache._get_filepath(key), (n, n))
+    size = os.path.getsize(cache._get_filepath('b'))
+    assert 2 * size < 2500 < 3 * size
+
+    # The least recently used result is removed first, and reading a
+    # result marks it as recently used.
+    assert not os.path.exists(cache._get_filepath('a'))
+    assert cache.get('a') is None
+    assert cache.get('b') is not None
+    cache.put('d', {'data': data})
+    assert sorted(os.listdir(str(tmp_path))) == ['b.pkl', 'd.pkl']
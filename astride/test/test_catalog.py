@@ -0,0 +1,62 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from astride.catalog import StreakCatalog
+from astride.detect import Streak
+from astride.test.synthetic import get_synthetic_image
+
+
+@pytest.fixture(scope='module')
+def streak():
+    streak = Streak.from_array(get_synthetic_image())
+    streak.detect()
+
+    return streak
+
+
+def test_catalog(streak):
+    catalog = streak.catalog
+
+    assert len(catalog) == len(streak.streaks) > 0
+    for result, edge in zip(catalog, streak.streaks):
+        for key in ('index', 'connectivity', 'x_center', 'area',
+                    'slope_angle', 'length', 'thickness'):
+            assert result[key] == edge[key]
+        assert np.array_equal(result['x'], edge['x'])
+        assert np.array_equal(result.extreme_points,
+                              edge['extreme_points'])
+    assert catalog.to_dicts() == streak.get_outputs()
+
+
+def test_read_only(streak):
+    catalog = streak.catalog
+
+    with pytest.raises(ValueError):
+        catalog['x_center'][0] = 0.
+    with pytest.raises(AttributeError):
+        catalog[0].x_center = 0.
+
+
+@pytest.mark.parametrize('contours', [False, True])
+def test_serialization(streak, contours):
+    catalog = streak.catalog
+    data = catalog.to_bytes(contours=contours)
+    restored = StreakCatalog.from_bytes(data)
+
+    assert restored.has_contours == contours
+    assert restored.to_dicts() == catalog.to_dicts()
+    if contours:
+        assert np.array_equal(restored[-1]['y'], catalog[-1]['y'])
+
+    restored = pickle.loads(pickle.dumps(catalog))
+    assert np.array_equal(restored[0]['x'], catalog[0]['x'])
+
+
+def test_plotting_state(streak, tmp_path):
+    keys = [set(edge) for edge in streak.streaks]
+    streak.output_path = '%s/' % tmp_path
+    streak.plot_figures()
+
+    assert [set(edge) for edge in streak.streaks] == keys
@@ -0,0 +1,70 @@
+from os.path import dirname
+from os.path import join
+
+import numpy as np
+import pytest
+
+from astride.detect import Streak
+from astride.test.synthetic import get_synthetic_image
+
+
+# Accuracy bounds of the float32 mode documented in the Streak class.
+POSITION_TOLERANCE = 1e-3
+RELATIVE_TOLERANCE = 1e-4
+ANGLE_TOLERANCE = 1e-3
+
+
+def _detect(dtype, data=None, **kwargs):
+    if data is None:
+        filename = join(dirname(__file__), '../datasets/samples', 'long.fits')
+        streak = Streak(filename, dtype=dtype, **kwargs)
+    else:
+        streak = Streak.from_array(data, dtype=dtype, **kwargs)
+    streak.detect()
+
+    return streak
+
+
+def _assert_close(streaks, expected):
+    assert len(streaks) == len(expected) > 0
+    for edge, expected_edge in zip(streaks, expected):
+        assert edge['connectivity'] == expected_edge['connectivity']
+        for key in ('x_center', 'y_center'):
+            assert abs(edge[key] - expected_edge[key]) <= POSITION_TOLERANCE
+        for key in ('area', 'perimeter', 'length'):
+            assert abs(edge[key] - expected_edge[key]) <= \
+                RELATIVE_TOLERANCE * abs(expected_edge[key])
+        for ep, expected_ep in zip(edge['extreme_points'],
+                                   expected_edge['extreme_points']):
+            assert np.all(np.abs(np.subtract(ep, expected_ep)) <=
+                          POSITION_TOLERANCE)
+        assert abs(edge['slope_angle'] - expected_edge['slope_angle']) <= \
+            ANGLE_TOLERANCE
+
+
+@pytest.mark.parametrize('kwargs', [
+    {}, {'remove_bkg': 'map'}, {'pyramid_factor': 4},
+    {'contour_threshold': 2.}])
+def test_float32_sample(kwargs):
+    streak32 = _detect('float32', **kwargs)
+    streak64 = _detect('float64', **kwargs)
+
+    assert streak32.raw_image.dtype == np.float32
+    assert streak32.image.dtype == np.float32
+    if streak32.background_map is not None:
+        assert streak32.background_map.dtype == np.float32
+    _assert_close(streak32.streaks, streak64.streaks)
+
+
+@pytest.mark.parametrize('remove_bkg', ['constant', 'map'])
+def test_float32_synthetic(remove_bkg):
+    image = get_synthetic_image()
+    streak32 = _detect('float32', image, remove_bkg=remove_bkg)
+    streak64 = _detect('float64', image, remove_bkg=remove_bkg)
+
+    _assert_close(streak32.streaks, streak64.streaks)
+
+
+def test_invalid_dtype():
+    with pytest.raises(RuntimeError):
+        Streak.from_array(np.zeros((10, 10)), dtype='int16')
@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from astride.utils.edge import EDGE
+
+
+def _get_contours(rng, n):
+    """
+    Return random closed contours as lists of [row, column].
+
+    The contours are star-shaped polygons of 11 to 600 points, far from the
+    origin of the frame.
+    """
+    contours = []
+    for _ in range(n):
+        n_points = rng.integers(10, 600)
+        angles = np.sort(rng.uniform(0., 2. * np.pi, n_points))
+        radii = rng.uniform(1., 20., n_points) * \
+            rng.uniform(0.1, 1., 2)[:, np.newaxis]
+        center = rng.uniform(500., 2000., 2)
+        contour = np.column_stack([center[0] + radii[0] * np.sin(angles),
+                                   center[1] + radii[1] * np.cos(angles)])
+        contours.append(np.vstack([contour, contour[:1]]))
+
+    return contours
+
+
+def _pack(edges):
+    counts = [len(edge['x']) for edge in edges]
+    offsets = np.zeros(len(counts), dtype=np.intp)
+    offsets[1:] = np.cumsum(counts)[:-1]
+
+    return np.concatenate([edge['x'] for edge in edges]), \
+        np.concatenate([edge['y'] for edge in edges]), offsets
+
+
+def test_shape_factors():
+    edge = EDGE(_get_contours(np.random.default_rng(0), 50))
+    areas, perimeters, x_centers, y_centers, radius_deviations, \
+        x_mins, x_maxs, y_mins, y_maxs = \
+        edge.get_shape_factors(*_pack(edge.edges))
+
+    for i, border in enumerate(edge.edges):
+        x, y = border['x'], border['y']
+        area, perimeter, x_center, y_center, distances = \
+            edge.get_shape_factor(x, y)
+        radius = np.median(distances)
+
+        assert areas[i] == pytest.approx(area, rel=1e-9)
+        assert perimeters[i] == pytest.approx(perimeter, rel=1e-9)
+        assert x_centers[i] == pytest.approx(x_center, abs=1e-6)
+        assert y_centers[i] == pytest.approx(y_center, abs=1e-6)
+        assert radius_deviations[i] == pytest.approx(
+            np.std(distances - radius) / radius, rel=1e-6)
+        assert (x_mins[i], x_maxs[i], y_mins[i], y_maxs[i]) == \
+            (x.min(), x.max(), y.min(), y.max())
+
+
+def test_lines():
+    edge = EDGE(_get_contours(np.random.default_rng(1), 50))
+    angles, x_means, y_means, half_thicknesses = \
+        edge.get_lines(*_pack(edge.edges))
+
+    for i, border in enumerate(edge.edges):
+        # The orthogonal least squares line is along the first principal
+        # axis of the points without the closing point.
+        points = np.column_stack([border['x'], border['y']])
+        mean = points[:-1].mean(axis=0)
+        direction = np.linalg.svd(points[:-1] - mean)[2][0]
+        distances = np.abs((points[:, 0] - mean[0]) * direction[1] -
+                           (points[:, 1] - mean[1]) * direction[0])
+
+        assert (x_means[i], y_means[i]) == pytest.approx(mean, abs=1e-6)
+        assert abs(np.dot(direction, [np.cos(angles[i]),
+                                      np.sin(angles[i])])) == \
+            pytest.approx(1., abs=1e-9)
+        assert -np.pi / 2. < angles[i] <= np.pi / 2.
+        assert half_thicknesses[i] == pytest.approx(np.median(distances),
+                                                    abs=1e-6)
+
+
+@pytest.mark.parametrize('max_outer_points', [None, 30])
+def test_extreme_points(max_outer_points):
+    edge = EDGE(_get_contours(np.random.default_rng(2), 50),
+                max_outer_points=max_outer_points)
+    extreme_points = edge.get_all_extreme_points(*_pack(edge.edges))
+
+    for i, border in enumerate(edge.edges):
+        x, y = border['x'], border['y']
+        farthest = np.max(np.hypot(np.subtract.outer(x, x),
+                                   np.subtract.outer(y, y)))
+        ep1, ep2 = extreme_points[i]
+
+        assert np.hypot(*(ep2 - ep1)) == pytest.approx(farthest, rel=1e-12)
+        for ep in (ep1, ep2):
+            assert np.any((x == ep[0]) & (y == ep[1]))
+
+
+@pytest.mark.parametrize('angle', [0., 30., 90., -60.])
+def test_straight_edge(angle):
+    # A thin rectangle of 100 x 2 pixels from (500, 300) along the angle.
+    c, s = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+    t = np.concatenate([np.arange(0., 100.), np.arange(99., -1., -1.)])
+    offset = np.where(np.arange(200) < 100, -1., 1.)
+    x = 500. + t * c - offset * s
+    y = 300. + t * s + offset * c
+    contour = np.column_stack([np.append(y, y[0]), np.append(x, x[0])])
+
+    edge = EDGE([contour])
+    edge.quantify()
+    border = edge.get_edges()[0]
+
+    assert border['slope_angle'] == pytest.approx(angle, abs=1e-9)
+    assert border['thickness'] == pytest.approx(2., abs=1e-9)
+    ep1, ep2 = border['extreme_points']
+    assert ep1[0] <= ep2[0]
+    assert border['length'] == pytest.approx(np.hypot(*(ep2 - ep1)))
+    assert border['length'] == pytest.approx(97., abs=1e-9)
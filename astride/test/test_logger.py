@@ -0,0 +1,79 @@
+import logging
+
+import numpy as np
+
+from astride.detect import Streak
+from astride.utils import logger as logger_module
+from astride.utils.logger import JSONFormatter, Logger, stop_queue
+
+
+def _get_console():
+    return [handler for handler in logging.getLogger('ASTRiDE').handlers
+            if getattr(handler, 'astride_key', None) == 'console'][0]
+
+
+def test_keep_format():
+    Logger(json_format=True)
+    try:
+        # Later calls without a format, e.g. of the server, keep it.
+        Logger()
+        assert isinstance(_get_console().formatter, JSONFormatter)
+    finally:
+        Logger(json_format=False)
+    assert not isinstance(_get_console().formatter, JSONFormatter)
+
+
+def test_stop_queue(tmp_path):
+    filepath = str(tmp_path / 'astride.log')
+    logger = Logger(filepath).getLogger()
+    queue = Logger().get_queue()
+    assert Logger().get_queue() is queue
+
+    # The queue is stopped only when both owners, e.g. two process pools,
+    # have released it.
+    stop_queue()
+    assert logger_module._listener is not None
+
+    # Records of the workers left in the queue are written when stopped.
+    record = logger.makeRecord('ASTRiDE', logging.INFO, __file__, 0,
+                               'From a worker.', (), None)
+    logging.handlers.QueueHandler(queue).handle(record)
+    stop_queue()
+    assert logger_module._listener is None
+    stop_queue()
+    assert Logger().get_queue() is not queue
+    stop_queue(force=True)
+    assert logger_module._listener is None
+
+    for handler in list(logger.handlers):
+        if getattr(handler, 'baseFilename', None) == filepath:
+            logger.removeHandler(handler)
+            handler.close()
+    with open(filepath) as f:
+        assert 'From a worker.' in f.read()
+
+
+def test_frame_label():
+    frames = []
+
+    class Handler(logging.Handler):
+        def emit(self, record):
+            frames.append(record.context.get('frame'))
+
+    data = np.zeros((64, 64))
+    logger = Logger().getLogger()
+    handler = Handler(logging.DEBUG)
+    level = logger.level
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    try:
+        Streak.from_array(data, label='night-1').detect()
+        Streak.from_array(data).detect()
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(level)
+
+    # Frames from arrays are labelled by default as well.
+    labels = list(dict.fromkeys(frames))
+    assert labels[0] == 'night-1'
+    assert len(labels) == 2 and labels[1].startswith('array-')
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from astride import detect
+from astride.detect import Streak
+from astride.test.synthetic import STREAKS, get_synthetic_image
+
+
+ROI = [(0, 250, 0, 400)]
+
+
+def _get_extents(streaks):
+    return sorted((round(edge['x_min'], 3), round(edge['x_max'], 3))
+                  for edge in streaks)
+
+
+@pytest.mark.parametrize('pyramid_factor', [1, 4])
+def test_roi_crossing_streaks(pyramid_factor):
+    image = get_synthetic_image()
+
+    # Both streaks cross the right border of the region of interest, so
+    # they are found clipped at it, as if the exterior were masked.
+    mask = np.zeros(image.shape, dtype=bool)
+    mask[:, 250:] = True
+    masked = Streak.from_array(image, mask=mask)
+    masked.detect()
+    streak = Streak.from_array(image, roi=ROI, pyramid_factor=pyramid_factor)
+    streak.detect()
+
+    assert len(streak.streaks) == 2
+    assert _get_extents(streak.streaks) == _get_extents(masked.streaks)
+    for edge in streak.streaks:
+        assert edge['x_max'] < 250.
+
+
+def test_blended_sources():
+    # A single star and a blend of two stars, larger than a star.
+    image = get_synthetic_image(stars=((250, 50), (450, 300), (456, 303)))
+    streak = Streak.from_array(image, mask_sources=True)
+    streak.detect()
+
+    assert streak.source_mask[50, 250]
+    assert streak.source_mask[300, 450] and streak.source_mask[303, 456]
+    assert len(streak.streaks) == 2
+    for x1, y1, x2, y2 in STREAKS:
+        assert not streak.source_mask[(y1 + y2) // 2, (x1 + x2) // 2]
+
+
+@pytest.mark.parametrize('options', [{}, {'remove_bkg': 'map'},
+                                     {'local_threshold': True},
+                                     {'mask_sources': True}])
+def test_roi_preparation(monkeypatch, options):
+    shapes = []
+    background_2d = detect.Background2D
+    find_sources = Streak._find_sources
+
+    def _background_2d(data, *args, **kwargs):
+        shapes.append(data.shape)
+        return background_2d(data, *args, **kwargs)
+
+    def _find_sources(self, image, noise):
+        shapes.append(image.shape)
+        return find_sources(self, image, noise)
+
+    monkeypatch.setattr(detect, 'Background2D', _background_2d)
+    monkeypatch.setattr(Streak, '_find_sources', _find_sources)
+
+    # The exterior of the region of interest is much brighter, so it
+    # would bias the background if it were used.
+    image = get_synthetic_image()
+    image[:, 260:] += 1000.
+    streak = Streak.from_array(image, roi=ROI, bkg_sample_size=1000,
+                               **options)
+    streak.detect()
+
+    # Only the region of interest padded by a pixel is prepared.
+    assert shapes == [(400, 251)] * (
+        (options.get('remove_bkg') == 'map') +
+        options.get('mask_sources', False))
+    outside = np.ones(image.shape, dtype=bool)
+    outside[:, :251] = False
+    assert np.all(streak.image[outside] == 0.)
+    if streak.snr_image is not None:
+        assert np.all(streak.snr_image[outside] == 0.)
+    if streak.source_mask is not None:
+        assert not np.any(streak.source_mask[outside])
+    assert streak._med == pytest.approx(100., abs=1.)
+    assert len(streak.streaks) == 2
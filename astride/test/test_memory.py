@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+import pytest
+
+from astride.utils import memory
+from astride.utils.memory import PeakMemory, get_contour_memory, \
+    get_pixel_memory, parse_memory, plan_frame
+
+
+@pytest.mark.parametrize('value, expected', [
+    (1000, 1000), ('1000', 1000), ('1e6', 10**6), ('512K', 512 * 2**10),
+    ('512M', 512 * 2**20), ('1.5G', 3 * 2**29), ('2T', 2 * 2**40),
+    (' 4gb ', 4 * 2**30), ('64MB', 64 * 2**20)])
+def test_parse_memory(value, expected):
+    assert parse_memory(value) == expected
+
+
+def test_parse_memory_error():
+    with pytest.raises(ValueError):
+        parse_memory('4X')
+
+
+def test_plan_frame():
+    shape = (1000, 2000)
+    n_pixels = shape[0] * shape[1]
+    contour = get_contour_memory(n_pixels)
+    float64 = n_pixels * get_pixel_memory(8) + contour
+    float32 = n_pixels * get_pixel_memory(4) + contour
+
+    # float64 if the whole frame fits, and float32 otherwise.
+    assert plan_frame(shape, float64) == (np.float64, None, float64)
+    assert plan_frame(shape, float64 - 1.) == (np.float32, None, float32)
+    assert plan_frame(shape, 1e12, 'float32') == (np.float32, None, float32)
+
+    # Strips if float32 does not fit either, as high as the rest of the
+    # budget allows.
+    budget = n_pixels * get_pixel_memory(4) + contour / 4.
+    dtype, strip_height, estimate = plan_frame(shape, budget)
+    assert dtype == np.float32
+    assert strip_height == 250
+    assert estimate <= budget
+
+    # The given data type is kept, and strips have at least 64 rows.
+    dtype, strip_height, estimate = plan_frame(shape, float32, 'float64')
+    assert dtype == np.float64 and strip_height is not None
+    dtype, strip_height, estimate = plan_frame(shape, 1.)
+    assert dtype == np.float32 and strip_height == 64
+    assert estimate > 1.
+
+
+def test_pixel_memory():
+    # Each option adds the arrays it keeps.
+    base = get_pixel_memory(4)
+    assert base == 8.
+    assert get_pixel_memory(4, reference=True) == base + 4.
+    assert get_pixel_memory(4, remove_bkg='map') > \
+        get_pixel_memory(4, remove_bkg='map', pyramid_factor=4) > base
+    assert get_pixel_memory(4, local_threshold=True, masked=True,
+                            mask_sources=True) == base + 4. + 1. + 6.
+
+
+@pytest.mark.parametrize('rss', [True, False])
+def test_peak_memory(monkeypatch, rss):
+    if not rss or memory._get_rss() is None:
+        # tracemalloc where the resident set size is not available.
+        monkeypatch.setattr(memory, '_get_rss', lambda: None)
+
+    size = 64 * 2**20
+    with PeakMemory(interval=0.001) as peak_memory:
+        data = np.ones(size // 8)
+        time.sleep(0.05)
+        del data
+
+    assert size * 0.9 <= peak_memory.peak <= size * 1.5
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from astride.detect import Streak
+from astride.test.synthetic import get_synthetic_image
+from astride.utils.profile import get_profiles
+
+
+def _get_streak(shape, p1, p2, peak, sigma):
+    """Return an image of a streak of a Gaussian cross-track profile."""
+    y, x = np.indices(shape, dtype=np.float64)
+    p1 = np.asarray(p1, dtype=np.float64)
+    p2 = np.asarray(p2, dtype=np.float64)
+    along = (p2 - p1) / np.hypot(*(p2 - p1))
+    t = (x - p1[0]) * along[0] + (y - p1[1]) * along[1]
+    d = -(x - p1[0]) * along[1] + (y - p1[1]) * along[0]
+    image = peak * np.exp(-d**2 / (2. * sigma**2))
+    image[(t < 0.) | (t > np.hypot(*(p2 - p1)))] = 0.
+
+    return image
+
+
+def test_flux_and_width():
+    p1, p2 = (20., 30.), (170., 110.)
+    peak, sigma = 100., 1.5
+    image = _get_streak((150, 200), p1, p2, peak, sigma)
+    edge = {'index': 1, 'extreme_points': [np.array(p1), np.array(p2)],
+            'thickness': 3.}
+    profile, = get_profiles(image, [edge], step=2., half_width=8.)
+
+    length = np.hypot(p2[0] - p1[0], p2[1] - p1[1])
+    assert profile['index'] == 1
+    assert np.allclose(profile['distance'],
+                       np.arange(int(length // 2.) + 1) * 2.)
+
+    # Away from the ends, the flux across the band is the integral of the
+    # Gaussian, and the width is its FWHM.
+    middle = slice(5, -5)
+    assert profile['flux'][middle] == pytest.approx(
+        peak * sigma * np.sqrt(2. * np.pi), rel=0.02)
+    assert profile['width'][middle] == pytest.approx(
+        2. * np.sqrt(2. * np.log(2.)) * sigma, rel=0.05)
+
+    # The cutout is a view of the image around the streak.
+    cutout = profile['cutout']
+    x_min, y_min = profile['cutout_origin']
+    assert np.shares_memory(cutout, image)
+    assert cutout.base is not None
+    assert (x_min, y_min) == (2, 12)
+    assert np.array_equal(
+        cutout, image[y_min:y_min + cutout.shape[0],
+                      x_min:x_min + cutout.shape[1]])
+
+
+def test_streak_profiles():
+    streak = Streak.from_array(get_synthetic_image())
+    streak.detect()
+    profiles = streak.get_profiles()
+
+    assert [p['index'] for p in profiles] == \
+        [edge['index'] for edge in streak.streaks]
+    for profile in profiles:
+        assert np.shares_memory(profile['cutout'], streak.image)
+        assert np.median(profile['flux']) > 0.
+
+
+def test_step():
+    image = np.zeros((10, 10))
+    edge = {'index': 1, 'extreme_points': [np.zeros(2), np.ones(2)],
+            'thickness': 1.}
+    for step in (0., -1.):
+        with pytest.raises(RuntimeError):
+            get_profiles(image, [edge], step=step)
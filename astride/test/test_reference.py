@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from astride.detect import Streak
+from astride.test.synthetic import STARS, get_synthetic_image
+from astride.utils.reference import ReferenceStack
+
+
+def test_ring_buffer():
+    stack = ReferenceStack(depth=3)
+    assert len(stack) == 0 and stack.get_reference() is None
+
+    stack.add(np.full((2, 2), 0.))
+    stack.add(np.full((2, 2), 10.))
+    assert len(stack) == 2
+    assert np.all(stack.get_reference() == 5.)
+
+    # The oldest frames are replaced once the stack is full.
+    for value in (1., 2., 3.):
+        stack.add(np.full((2, 2), value))
+    assert len(stack) == 3
+    assert np.all(stack.get_reference() == 2.)
+
+    with pytest.raises(RuntimeError):
+        stack.add(np.zeros((3, 2)))
+    with pytest.raises(RuntimeError):
+        ReferenceStack(depth=0)
+
+
+def test_first_frame():
+    image = get_synthetic_image()
+    stack = ReferenceStack()
+    streak = Streak.from_array(image, reference=stack)
+    catalog = streak.detect()
+
+    # The first frame is searched as it is, and then added to the stack.
+    expected = Streak.from_array(image).detect()
+    assert catalog.to_dicts() == expected.to_dicts()
+    assert len(stack) == 1
+    assert np.array_equal(stack.get_reference(), image)
+
+
+def test_shape_mismatch():
+    image = get_synthetic_image()
+    with pytest.raises(RuntimeError):
+        Streak.from_array(image, reference=np.zeros((10, 10))).detect()
+
+    stack = ReferenceStack()
+    stack.add(np.zeros((10, 10)))
+    with pytest.raises(RuntimeError):
+        Streak.from_array(image, reference=stack).detect()
+
+
+def test_static_sources():
+    # The same stars in every frame, and the streaks only in the last one.
+    stack = ReferenceStack(depth=3)
+    for seed in range(3):
+        Streak.from_array(get_synthetic_image(seed=seed, streaks=()),
+                          reference=stack).detect()
+    image = get_synthetic_image(seed=3)
+    streak = Streak.from_array(image, reference=stack)
+    streak.detect()
+
+    unsubtracted = Streak.from_array(image)
+    unsubtracted.detect()
+    for x, y in STARS:
+        assert unsubtracted.image[y, x] > 100. * unsubtracted._std
+        assert abs(streak.image[y, x]) < 5. * streak._std
+    assert len(streak.streaks) == len(unsubtracted.streaks) == 2
@@ -0,0 +1,250 @@
+import contextlib
+import json
+import logging
+import os
+import time
+import tracemalloc
+from os.path import dirname
+from os.path import join
+
+import numpy as np
+import pytest
+
+from astride.detect import Streak
+from astride.test.synthetic import get_synthetic_image
+from astride.utils.logger import Logger
+
+
+GOLDEN_PATH = join(dirname(__file__), 'golden')
+SAMPLE_PATH = join(dirname(__file__), '../datasets/samples', 'long.fits')
+
+# Tolerances of the streak catalogs against the golden results, which
+# allow for the rounding of other versions of numpy, scipy and skimage.
+POSITION_TOLERANCE = 1e-3
+RELATIVE_TOLERANCE = 1e-4
+ANGLE_TOLERANCE = 1e-3
+SKY_TOLERANCE = 1e-6
+POSITION_KEYS = ('x_center', 'y_center', 'ep1_x', 'ep1_y', 'ep2_x', 'ep2_y')
+RELATIVE_KEYS = ('area', 'perimeter', 'shape_factor', 'radius_deviation',
+                 'intercept', 'length', 'thickness')
+SKY_KEYS = ('ra', 'dec', 'ep1_ra', 'ep1_dec', 'ep2_ra', 'ep2_dec')
+
+# Tolerances of the Hough streaks against the contour streaks of the same
+# frame, in pixels and degree.
+HOUGH_TOLERANCE = 3.
+HOUGH_ANGLE_TOLERANCE = 0.5
+
+# Frame and Streak options of each case.
+CASES = {
+    'long': ('long', {}),
+    'long_map': ('long', {'remove_bkg': 'map'}),
+    'long_pyramid': ('long', {'pyramid_factor': 4}),
+    'long_hough': ('long', {'engine': 'hough'}),
+    'long_local': ('long', {'local_threshold': True}),
+    'synthetic': ('synthetic', {}),
+    'synthetic_map': ('synthetic', {'remove_bkg': 'map'}),
+    'crowded': ('crowded', {'mask_sources': True}),
+    'crowded_hough': ('crowded', {'engine': 'hough'}),
+    'large_budget': ('large', {'max_memory': '60M'}),
+}
+
+# Ceilings of the elapsed time of each stage in seconds, about ten times
+# the values on a laptop, and of the peak memory traced by tracemalloc in
+# MB, about 1.5 times the values, which do not depend on the machine.
+# Multiply them by the ASTRIDE_PERF_FACTOR environment variable on slower
+# machines. The memory ceiling of 'large_budget' is its budget.
+CEILINGS = {
+    'long': {'prepare': 0.1, 'windows': 0.1, 'contour': 0.5, 'memory': 12.},
+    'long_map': {'prepare': 0.6, 'windows': 0.1, 'contour': 0.75,
+                 'memory': 15.},
+    'long_pyramid': {'prepare': 0.1, 'windows': 0.1, 'contour': 0.5,
+                     'memory': 12.},
+    'long_hough': {'prepare': 0.1, 'hough': 1.5, 'memory': 12.},
+    'long_local': {'prepare': 0.1, 'windows': 0.1, 'contour': 0.6,
+                   'memory': 15.},
+    'synthetic': {'prepare': 0.1, 'windows': 0.1, 'contour': 0.25,
+                  'memory': 30.},
+    'synthetic_map': {'prepare': 0.5, 'windows': 0.1, 'contour': 0.25,
+                      'memory': 33.},
+    'crowded': {'prepare': 0.5, 'windows': 0.1, 'contour': 1.,
+                'memory': 220.},
+    'crowded_hough': {'prepare': 0.5, 'hough': 10., 'memory': 50.},
+    'large_budget': {'prepare': 1., 'windows': 0.1, 'contour': 3.,
+                     'memory': 60.},
+}
+
+
+def _get_frame(name):
+    """Return the Streak options to read a frame."""
+    if name == 'long':
+        return {'filename': SAMPLE_PATH}
+    if name == 'synthetic':
+        return {'data': get_synthetic_image()}
+    if name == 'crowded':
+        return {'data': get_synthetic_image(
+            seed=1, shape=(1024, 1024), streaks=((100, 200, 900, 600),),
+            stars=(), n_random_stars=2000)}
+    if name == 'large':
+        return {'data': get_synthetic_image(
+            seed=2, shape=(2048, 2048),
+            streaks=((50, 100, 2000, 1900), (1500, 200, 1900, 300)))}
+
+    raise ValueError(name)
+
+
+def _create(case):
+    frame, kwargs = CASES[case]
+    options = _get_frame(frame)
+    if 'data' in options:
+        return Streak.from_array(options['data'], **kwargs)
+
+    return Streak(options['filename'], **kwargs)
+
+
+def _get_catalog(streak):
+    """Return the streak information as JSON serializable values."""
+    return [{key: value.item() if hasattr(value, 'item') else value
+             for key, value in output.items()}
+            for output in streak.get_outputs()]
+
+
+@contextlib.contextmanager
+def _stage_times():
+    """Collect the elapsed time of each stage logged by log_stage."""
+    times = {}
+
+    class Handler(logging.Handler):
+        def emit(self, record):
+            stage = getattr(record, 'context', {}).get('stage')
+            if stage is not None and record.msg == 'Done in %.3f s.':
+                times[stage] = times.get(stage, 0.) + record.args[0]
+
+    logger = Logger().getLogger()
+    handler = Handler(logging.DEBUG)
+    level = logger.level
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    try:
+        yield times
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(level)
+
+
+def _assert_catalog(catalog, golden):
+    assert len(catalog) == len(golden) > 0
+    for output, expected in zip(catalog, golden):
+        assert output.keys() == expected.keys()
+        assert output['index'] == expected['index']
+        assert output['connectivity'] == expected['connectivity']
+        for key in POSITION_KEYS:
+            assert output[key] == pytest.approx(
+                expected[key], abs=POSITION_TOLERANCE), key
+        for key in RELATIVE_KEYS:
+            assert output[key] == pytest.approx(
+                expected[key], rel=RELATIVE_TOLERANCE,
+                abs=POSITION_TOLERANCE), key
+        assert output['slope_angle'] == pytest.approx(
+            expected['slope_angle'], abs=ANGLE_TOLERANCE)
+        for key in SKY_KEYS:
+            if key in expected:
+                assert output[key] == pytest.approx(
+                    expected[key], abs=SKY_TOLERANCE), key
+
+
+@pytest.mark.parametrize('case', sorted(CASES))
+def test_golden(case):
+    streak = _create(case)
+    streak.detect()
+
+    with open(join(GOLDEN_PATH, '%s.json' % case)) as f:
+        golden = json.load(f)
+    _assert_catalog(_get_catalog(streak), golden)
+
+
+@pytest.mark.parametrize('contour_case, hough_case',
+                         [('long', 'long_hough'),
+                          ('crowded', 'crowded_hough')])
+def test_hough_matches_contour(contour_case, hough_case):
+    contour = _create(contour_case)
+    contour.detect()
+    hough = _create(hough_case)
+    hough.detect()
+
+    # A streak may be split into a few contour streaks, but is a single
+    # Hough streak spanning all of them.
+    matched = set()
+    for streak in hough.catalog:
+        c = np.cos(np.radians(streak['slope_angle']))
+        s = np.sin(np.radians(streak['slope_angle']))
+        ends = np.array(streak['extreme_points'])
+        parts = [part for part in contour.catalog
+                 if abs(part['slope_angle'] - streak['slope_angle']) <=
+                 HOUGH_ANGLE_TOLERANCE and
+                 abs((part['x_center'] - ends[0, 0]) * s -
+                     (part['y_center'] - ends[0, 1]) * c) <=
+                 HOUGH_TOLERANCE]
+        assert len(parts) > 0
+        matched.update(part['index'] for part in parts)
+
+        points = np.array([point for part in parts
+                           for point in part['extreme_points']])
+        t = points @ [c, s]
+        assert np.hypot(*(points[np.argmin(t)] - ends[0])) <= \
+            HOUGH_TOLERANCE
+        assert np.hypot(*(points[np.argmax(t)] - ends[1])) <= \
+            HOUGH_TOLERANCE
+    assert matched == set(contour.catalog['index'].tolist())
+
+
+@pytest.mark.parametrize('case', sorted(CASES))
+def test_performance(case):
+    factor = float(os.environ.get('ASTRIDE_PERF_FACTOR', 1.))
+    ceilings = CEILINGS[case]
+
+    # The stage times without tracing, which slows down the detection.
+    streak = _create(case)
+    with _stage_times() as times:
+        streak.detect()
+    for stage, ceiling in ceilings.items():
+        if stage != 'memory':
+            assert times[stage] <= ceiling * factor, \
+                '%s took %.3f s.' % (stage, times[stage])
+
+    streak = _create(case)
+    tracemalloc.start()
+    try:
+        streak.detect()
+        peak = tracemalloc.get_traced_memory()[1] / 2.**20
+    finally:
+        tracemalloc.stop()
+    assert peak <= ceilings['memory'] * factor, \
+        'Peak memory was %.1f MB.' % peak
+
+
+def update_golden(cases=None):
+    """
+    Write the golden results of the cases.
+
+    Run only after checking that the changes of the results are intended.
+    """
+    if not os.path.exists(GOLDEN_PATH):
+        os.makedirs(GOLDEN_PATH)
+
+    for case in cases or sorted(CASES):
+        start = time.perf_counter()
+        streak = _create(case)
+        with _stage_times() as times:
+            streak.detect()
+        with open(join(GOLDEN_PATH, '%s.json' % case), 'w') as f:
+            json.dump(_get_catalog(streak), f, indent=1)
+            f.write('\n')
+        print('%s: %d streaks in %.3f s %s' % (
+            case, len(streak.streaks), time.perf_counter() - start,
+            {stage: round(t, 3) for stage, t in times.items()}))
+
+
+if __name__ == '__main__':
+    import sys
+
+    update_golden(sys.argv[1:])
@@ -0,0 +1,103 @@
+import json
+import urllib.error
+import urllib.request
+from os.path import dirname
+from os.path import join
+
+import numpy as np
+import pytest
+
+from astride.detect import Streak
+from astride.server import StreakServer
+from astride.test.synthetic import get_synthetic_image
+
+
+SAMPLE_PATH = join(dirname(__file__), '../datasets/samples', 'long.fits')
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = StreakServer(port=0, n_workers=2)
+    server.start()
+    yield server
+    server.shutdown()
+
+
+def _request(server, path, body=None, headers=None):
+    """Return the status and the JSON response of a request."""
+    request = urllib.request.Request(
+        'http://127.0.0.1:%d%s' % (server.port, path), data=body,
+        headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def _post_json(server, content):
+    return _request(server, '/detect', json.dumps(content).encode(),
+                    {'Content-Type': 'application/json'})
+
+
+def _get_expected(filename=None, data=None):
+    if data is not None:
+        streak = Streak.from_array(data)
+    else:
+        streak = Streak(filename)
+
+    return streak.detect().to_dicts()
+
+
+def test_path(server):
+    status, content = _post_json(server, {'path': SAMPLE_PATH})
+
+    assert status == 200
+    assert content['streaks'] == _get_expected(SAMPLE_PATH)
+
+
+def test_raw_bytes(server):
+    data = get_synthetic_image().astype(np.float32)
+    status, content = _request(
+        server, '/detect', data.tobytes(),
+        {'Content-Type': 'application/octet-stream',
+         'X-Shape': '%d,%d' % data.shape, 'X-Dtype': 'float32',
+         'X-Params': json.dumps({'contour_threshold': 3.})})
+
+    assert status == 200
+    assert len(content['streaks']) == 2
+    assert content['streaks'] == _get_expected(data=data)
+
+
+def test_batch(server):
+    frames = [{'path': SAMPLE_PATH},
+              {'path': SAMPLE_PATH, 'params': {'contour_threshold': 5.}}]
+    status, content = _post_json(server, {'frames': frames})
+
+    assert status == 200
+    assert len(content['results']) == 2
+    assert content['results'][0] == _get_expected(SAMPLE_PATH)
+
+    status, content = _post_json(server, {'frames': [{}]})
+    assert status == 400
+
+
+def test_metrics(server):
+    _post_json(server, {'path': SAMPLE_PATH})
+    status, metrics = _request(server, '/metrics')
+
+    assert status == 200
+    assert metrics['frames'] >= 1
+    assert metrics['pending'] == 0
+    assert set(metrics['latency']) == {'p50', 'p90', 'p99', 'max'}
+
+
+def test_rejected():
+    server = StreakServer(port=0, n_workers=1, max_pending=0)
+    server.start()
+    try:
+        status, content = _post_json(server, {'path': SAMPLE_PATH})
+        assert status == 503
+        assert _request(server, '/metrics')[1]['rejected'] == 1
+    finally:
+        server.shutdown()
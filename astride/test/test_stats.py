@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from astropy.stats import sigma_clipped_stats
+
+from astride.test.synthetic import get_synthetic_image
+from astride.utils.stats import sample_clipped_stats
+
+
+@pytest.mark.parametrize('n_random_stars', [0, 2000])
+def test_below_sample_size(n_random_stars):
+    # Images with fewer pixels than max_samples use all of them, which
+    # gives the same values as sigma_clipped_stats.
+    image = get_synthetic_image(seed=1, n_random_stars=n_random_stars)
+    mean, median, std, _, _ = sample_clipped_stats(image)
+
+    expected = sigma_clipped_stats(image)
+    assert mean == pytest.approx(expected[0], rel=1e-12)
+    assert median == expected[1]
+    assert std == pytest.approx(expected[2], rel=1e-12)
+
+
+def test_masked():
+    image = get_synthetic_image()
+    mask = np.zeros(image.shape, dtype=bool)
+    mask[:, :100] = True
+    _, median, std, _, _ = sample_clipped_stats(image, mask=mask)
+
+    expected = sigma_clipped_stats(image, mask=mask)
+    assert median == expected[1]
+    assert std == pytest.approx(expected[2], rel=1e-12)
+
+
+@pytest.mark.parametrize('max_samples', [2**20, 2000])
+def test_windows(max_samples):
+    # The background outside the windows is much brighter.
+    image = get_synthetic_image()
+    image[:, 300:] += 1000.
+    windows = [[0, 100, 0, 100], [200, 400, 150, 300]]
+    mask = np.zeros(image.shape, dtype=bool)
+    mask[250:260, 150:300] = True
+    _, median, std, _, _ = sample_clipped_stats(
+        image, mask=mask, max_samples=max_samples, windows=windows)
+
+    inside = np.ones(image.shape, dtype=bool)
+    for y_min, y_max, x_min, x_max in windows:
+        inside[y_min:y_max, x_min:x_max] = False
+    expected = sigma_clipped_stats(image, mask=inside | mask)
+    if max_samples > image.size:
+        assert median == expected[1]
+        assert std == pytest.approx(expected[2], rel=1e-12)
+    else:
+        # The whole sample is drawn inside the windows.
+        assert median == pytest.approx(expected[1], abs=0.5)
+        assert std == pytest.approx(expected[2], rel=0.1)
@@ -0,0 +1,91 @@
+import pytest
+
+from astride import sweep as sweep_module
+from astride.detect import Streak
+from astride.sweep import sweep
+from astride.test.synthetic import get_synthetic_image
+
+
+ROI = [(0, 250, 0, 400)]
+
+
+def _get_extents(streaks):
+    return sorted((round(edge['x_min'], 3), round(edge['x_max'], 3))
+                  for edge in streaks)
+
+
+def test_sweep_roi():
+    rows = sweep(data=get_synthetic_image(),
+                 grid={'contour_threshold': [2., 3.]}, roi=ROI)
+
+    assert [row['n_streaks'] for row in rows] == [2, 2]
+
+
+def test_sweep_mask_sources():
+    # No cuts, so the remains of badly masked sources are counted too.
+    options = {'mask_sources': True, 'min_points': 3, 'shape_cut': 1.,
+               'area_cut': 0., 'radius_dev_cut': 0.}
+    image = get_synthetic_image(n_random_stars=200)
+    thresholds = [2., 3., 5.]
+    rows = sweep(data=image, grid={'contour_threshold': thresholds},
+                 **options)
+
+    # Point sources are found above each swept threshold.
+    for threshold, row in zip(thresholds, rows):
+        streak = Streak.from_array(image, contour_threshold=threshold,
+                                   **options)
+        streak.detect()
+        assert _get_extents(row['streaks']) == \
+            _get_extents(streak.streaks)
+
+
+def test_sweep_engine():
+    with pytest.raises(RuntimeError):
+        sweep(data=get_synthetic_image(), grid={'contour_threshold': [2.]},
+              engine='hough')
+
+
+def test_sweep_background(monkeypatch):
+    calls = []
+    prepare_image = Streak._prepare_image
+
+    def _prepare_image(self):
+        calls.append((self.remove_bkg, self.bkg_box_size))
+        prepare_image(self)
+
+    monkeypatch.setattr(Streak, '_prepare_image', _prepare_image)
+    image = get_synthetic_image()
+    rows = sweep(data=image, grid={'remove_bkg': ['constant', 'map'],
+                                   'bkg_box_size': [30, 50]})
+
+    # The box size is not used by the constant background.
+    assert calls == [('constant', 30), ('map', 30), ('map', 50)]
+    assert [(row['remove_bkg'], row['bkg_box_size']) for row in rows] == \
+        [('constant', 30), ('constant', 50), ('map', 30), ('map', 50)]
+    assert _get_extents(rows[0]['streaks']) == \
+        _get_extents(rows[1]['streaks'])
+    for row in rows:
+        streak = Streak.from_array(image, remove_bkg=row['remove_bkg'],
+                                   bkg_box_size=row['bkg_box_size'])
+        streak.detect()
+        assert _get_extents(row['streaks']) == _get_extents(streak.streaks)
+
+
+def test_sweep_max_memory(monkeypatch):
+    max_outer_points = []
+    edge_class = sweep_module.EDGE
+
+    def _edge(contours, **kwargs):
+        max_outer_points.append(kwargs.get('max_outer_points'))
+        return edge_class(contours, **kwargs)
+
+    monkeypatch.setattr(sweep_module, 'EDGE', _edge)
+    image = get_synthetic_image()
+    rows = sweep(data=image, grid={'contour_threshold': [3.]},
+                 max_memory='100M')
+
+    # The extreme points are searched within the memory budget.
+    streak = Streak.from_array(image, max_memory='100M')
+    streak.detect()
+    assert max_outer_points[0] == streak._max_outer_points is not None
+    assert _get_extents(rows[0]['streaks']) == _get_extents(streak.streaks)
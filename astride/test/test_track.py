@@ -0,0 +1,204 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from astride.track import Tracker
+
+# Ceiling of the linking time per streak in seconds, about ten times the
+# value on a laptop. Multiply it by the ASTRIDE_PERF_FACTOR environment
+# variable on slower machines.
+LINK_CEILING = 1e-4
+
+
+def _get_orbits(rng, n):
+    """Return random poles and starting points of great circles."""
+    poles = rng.normal(size=(n, 3))
+    poles /= np.linalg.norm(poles, axis=1)[:, np.newaxis]
+    starts = np.cross(poles, rng.normal(size=(n, 3)))
+    starts /= np.linalg.norm(starts, axis=1)[:, np.newaxis]
+
+    return poles, starts
+
+
+def _get_positions(poles, starts, angles):
+    """Return points rotated by angles in degree along great circles."""
+    angles = np.radians(angles)[..., np.newaxis]
+
+    return starts * np.cos(angles) + np.cross(poles, starts) * \
+        np.sin(angles)
+
+
+def _to_radec(vectors):
+    ra = np.degrees(np.arctan2(vectors[..., 1], vectors[..., 0])) % 360.
+    dec = np.degrees(np.arcsin(np.clip(vectors[..., 2], -1., 1.)))
+
+    return ra, dec
+
+
+def _get_outputs(poles, starts, speeds, times, exposure=10.):
+    """
+    Return the streaks of objects moving along great circles.
+
+    Each object moves at its speed in degree per second from its starting
+    point at time zero, and a streak is its path during the exposure
+    starting at its time.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    ep1 = _to_radec(_get_positions(poles, starts, speeds * times))
+    ep2 = _to_radec(_get_positions(poles, starts,
+                                   speeds * (times + exposure)))
+    center = _to_radec(_get_positions(poles, starts,
+                                      speeds * (times + exposure / 2.)))
+
+    return [{'ra': center[0][i], 'dec': center[1][i],
+             'ep1_ra': ep1[0][i], 'ep1_dec': ep1[1][i],
+             'ep2_ra': ep2[0][i], 'ep2_dec': ep2[1][i]}
+            for i in range(len(speeds))]
+
+
+def _get_pole(output):
+    """Return the pole of the great circle of a streak."""
+    ep1 = _to_vectors(output['ep1_ra'], output['ep1_dec'])
+    ep2 = _to_vectors(output['ep2_ra'], output['ep2_dec'])
+    pole = np.cross(ep1, ep2)
+
+    return pole / np.linalg.norm(pole)
+
+
+def _to_vectors(ra, dec):
+    ra, dec = np.radians(ra), np.radians(dec)
+
+    return np.array([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra),
+                     np.sin(dec)])
+
+
+def test_great_circle():
+    poles, starts = _get_orbits(np.random.default_rng(0), 1)
+    tracker = Tracker()
+    track_ids = []
+    for time_ in np.arange(5) * 60.:
+        outputs = _get_outputs(poles, starts, np.array([0.2]), [time_])
+        track_ids += tracker.add_frame(outputs, time_, frame=time_)
+
+    assert track_ids == [1] * 5
+    tracks = tracker.flush()
+    assert len(tracks) == 1 and len(tracker) == 0
+    assert [d['frame'] for d in tracks[0]['detections']] == \
+        [0., 60., 120., 180., 240.]
+    assert abs(np.dot(tracks[0]['pole'], poles[0])) == \
+        pytest.approx(1., abs=1e-9)
+
+
+def test_crossing_objects():
+    # Two objects on different great circles through the same point,
+    # which both pass it at 120 seconds.
+    crossing = np.array([[1., 0., 0.]])
+    poles = np.array([[0., 0., 1.], [0., -np.sin(0.5), np.cos(0.5)]])
+    speeds = np.array([0.1, 0.15])
+    starts = _get_positions(poles, np.repeat(crossing, 2, axis=0),
+                            -speeds * 125.)
+
+    tracker = Tracker()
+    track_ids = [tracker.add_frame(
+        _get_outputs(poles, starts, speeds, [time_, time_]), time_)
+        for time_ in np.arange(5) * 60.]
+
+    assert track_ids == [[1, 2]] * 5
+    for track in tracker.flush():
+        assert len(track['detections']) == 5
+
+
+def test_time_window():
+    poles, starts = _get_orbits(np.random.default_rng(1), 1)
+    speeds = np.array([0.01])
+    tracker = Tracker(time_window=300.)
+
+    assert tracker.add_frame(_get_outputs(poles, starts, speeds, [0.]),
+                             0.) == [1]
+    assert tracker.add_frame([], 300.) == []
+    assert tracker.get_finished() == [] and len(tracker) == 1
+
+    # The track is finished without a streak for more than the window,
+    # so the next streak of the object starts a new track.
+    assert tracker.add_frame([], 301.) == []
+    tracks = tracker.get_finished()
+    assert [track['id'] for track in tracks] == [1]
+    assert len(tracker) == 0
+    assert tracker.add_frame(_get_outputs(poles, starts, speeds, [360.]),
+                             360.) == [2]
+    assert tracker.get_finished() == []
+
+
+def test_degenerate_streak():
+    poles, starts = _get_orbits(np.random.default_rng(2), 1)
+    output = _get_outputs(poles, starts, np.array([0.2]), [0.])[0]
+    point = dict(output, ep2_ra=output['ep1_ra'], ep2_dec=output['ep1_dec'])
+
+    # A streak without a great circle starts a new track, without
+    # breaking the linking of the other streaks.
+    tracker = Tracker()
+    assert tracker.add_frame([output], 0.) == [1]
+    assert tracker.add_frame(
+        [point] + _get_outputs(poles, starts, np.array([0.2]), [60.]),
+        60.) == [2, 1]
+    tracks = {track['id']: track for track in tracker.flush()}
+    assert len(tracks[1]['detections']) == 2
+    assert np.all(np.isfinite(tracks[2]['pole']))
+    assert abs(np.dot(tracks[1]['pole'], _get_pole(output))) == \
+        pytest.approx(1., abs=1e-9)
+
+
+def test_errors():
+    tracker = Tracker()
+    tracker.add_frame([], 60.)
+    with pytest.raises(RuntimeError):
+        tracker.add_frame([], 0.)
+    with pytest.raises(RuntimeError):
+        tracker.add_frame([{'x_center': 1., 'y_center': 1.}], 120.)
+
+
+def test_performance():
+    factor = float(os.environ.get('ASTRIDE_PERF_FACTOR', 1.))
+
+    # A night of 400 frames taken every 30 seconds, having 500 streaks
+    # each. Each object is seen in 5 frames.
+    rng = np.random.default_rng(3)
+    n_frames, n_new, n_seen = 400, 100, 5
+    poles, starts = _get_orbits(rng, n_frames * n_new)
+    speeds = rng.uniform(0.05, 0.5, n_frames * n_new)
+    first_frames = np.repeat(np.arange(n_frames), n_new)
+    frames = []
+    for frame in range(n_frames):
+        objects = np.nonzero((first_frames <= frame) &
+                             (first_frames > frame - n_seen))[0]
+        time_ = frame * 30.
+        frames.append((time_, objects, _get_outputs(
+            poles[objects], starts[objects], speeds[objects],
+            np.full(len(objects), time_ - first_frames[objects] * 30.))))
+    n_streaks = sum(len(objects) for _, objects, _ in frames)
+
+    tracker = Tracker(max_speed=0.5)
+    track_ids = []
+    start = time.perf_counter()
+    for time_, objects, outputs in frames:
+        track_ids.append(tracker.add_frame(outputs, time_))
+    tracker.flush()
+    elapsed = time.perf_counter() - start
+
+    # Almost every object is a single track of its own. A few objects
+    # move on nearly the same great circle as another one, within
+    # max_angle, so their streaks may be mixed up.
+    objects_of_tracks = {}
+    tracks_of_objects = {}
+    for (_, objects, _), ids in zip(frames, track_ids):
+        for i, track_id in zip(objects, ids):
+            objects_of_tracks.setdefault(track_id, set()).add(i)
+            tracks_of_objects.setdefault(i, set()).add(track_id)
+    n_wrong = sum(len(ids) > 1 or len(objects_of_tracks[min(ids)]) > 1
+                  for ids in tracks_of_objects.values())
+    assert n_wrong < 0.01 * len(tracks_of_objects), n_wrong
+    assert elapsed / n_streaks <= LINK_CEILING * factor, \
+        'Linking took %.1f microseconds per streak.' % \
+        (elapsed / n_streaks * 1e6)
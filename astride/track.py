@@ -0,0 +1,224 @@
+import numpy as np
+
+from scipy.spatial import cKDTree
+
+
+def _to_vectors(ra, dec):
+    """Return unit vectors of sky coordinates in degrees, (N, 3)."""
+    ra = np.radians(np.asarray(ra, dtype=np.float64))
+    dec = np.radians(np.asarray(dec, dtype=np.float64))
+    cos_dec = np.cos(dec)
+
+    return np.column_stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra),
+                            np.sin(dec)])
+
+
+class Tracker:
+    """
+    Link streaks of consecutive frames into tracks of the same objects.
+
+    Over a few frames, a satellite moves along a great circle. Each track
+    keeps the pole of the great circle fitted to the extreme points of its
+    streaks. The poles of the active tracks are indexed by a KD-tree, so
+    that the tracks along the same great circle as a new streak are found
+    without comparing the streak with every track. A candidate track is
+    then linked if the new streak is close to its great circle and
+    reachable from its last streak within the maximum speed.
+
+    Frames are added in time order. Tracks without any new streak for
+    time_window seconds are finished and removed from memory, so the
+    memory is bounded by the number of streaks within the time window.
+
+    Parameters
+    ----------
+    time_window : float, optional
+        The maximum time gap in seconds to link streaks.
+    max_angle : float, optional
+        The maximum angle in degree between the great circles of a streak
+        and a track.
+    max_distance : float, optional
+        The maximum distance in degree of the extreme points of a streak
+        from the great circle of a track.
+    max_speed : float, optional
+        The maximum angular speed in degree per second of tracked objects.
+    """
+    def __init__(self, time_window=300., max_angle=1., max_distance=0.05,
+                 max_speed=2.):
+        self.time_window = time_window
+        self.max_angle = max_angle
+        self.max_distance = max_distance
+        self.max_speed = max_speed
+
+        # Active tracks by their IDs, and finished tracks not yet returned.
+        self._tracks = {}
+        self._finished = []
+        self._next_id = 1
+        self._last_time = None
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def add_frame(self, outputs, time, frame=None):
+        """
+        Link the streaks of a frame to the active tracks.
+
+        Parameters
+        ----------
+        outputs : list of dict
+            Information of the streaks of the frame having sky coordinates
+            (see Streak.get_outputs).
+        time : float
+            Time of the frame in seconds. Must not be earlier than the
+            time of the previous frame.
+        frame : object, optional
+            Any label of the frame (e.g. the filename) to keep with its
+            streaks.
+
+        Returns
+        -------
+        track_ids : list of int
+            ID of the track of each streak.
+        """
+        if self._last_time is not None and time < self._last_time:
+            raise RuntimeError('Frames must be added in time order.')
+        self._last_time = time
+        self._retire(time)
+
+        if len(outputs) == 0:
+            return []
+        if 'ep1_ra' not in outputs[0]:
+            raise RuntimeError('The streaks have no sky coordinates. '
+                               'The images must have WCS information.')
+
+        ep1 = _to_vectors([o['ep1_ra'] for o in outputs],
+                          [o['ep1_dec'] for o in outputs])
+        ep2 = _to_vectors([o['ep2_ra'] for o in outputs],
+                          [o['ep2_dec'] for o in outputs])
+        centers = _to_vectors([o['ra'] for o in outputs],
+                              [o['dec'] for o in outputs])
+        poles = np.cross(ep1, ep2)
+        norms = np.sqrt(np.sum(poles**2, axis=1))
+        valid = norms > 0.
+        poles[valid] /= norms[valid, np.newaxis]
+
+        # The great circles of the streaks and of the tracks are parallel
+        # if their poles are close, in either direction.
+        track_ids = [None] * len(outputs)
+        tracks = [track for track in self._tracks.values()
+                  if track['last_time'] < time]
+        if len(tracks) > 0 and np.any(valid):
+            track_poles = np.array([track['pole'] for track in tracks])
+            last_centers = np.array([track['last_center']
+                                     for track in tracks])
+            last_times = np.array([track['last_time'] for track in tracks])
+
+            tree = cKDTree(np.vstack([track_poles, -track_poles]))
+            radius = 2. * np.sin(np.radians(self.max_angle) / 2.)
+            valid_ids = np.nonzero(valid)[0]
+            candidates = tree.query_ball_point(poles[valid_ids], radius)
+
+            # Candidate pairs of a streak and a track.
+            counts = np.array([len(indices) for indices in candidates])
+            pair_streaks = np.repeat(valid_ids, counts)
+            pair_tracks = np.array(
+                [j for indices in candidates for j in indices],
+                dtype=np.intp) % len(tracks)
+
+            # Distances of the extreme points from the great circles,
+            # and angular distances from the last streaks of the tracks.
+            pair_poles = track_poles[pair_tracks]
+            offsets = np.maximum(
+                np.abs(np.sum(pair_poles * ep1[pair_streaks], axis=1)),
+                np.abs(np.sum(pair_poles * ep2[pair_streaks], axis=1)))
+            separations = np.degrees(np.arccos(np.clip(np.sum(
+                last_centers[pair_tracks] * centers[pair_streaks], axis=1),
+                -1., 1.)))
+            reaches = self.max_speed * (time - last_times[pair_tracks]) + \
+                self.max_distance
+            linked = (offsets <= np.sin(np.radians(self.max_distance))) & \
+                (separations <= reaches)
+
+            # Link each streak to the track closest to its great circle.
+            order = np.lexsort((offsets[linked], pair_streaks[linked]))
+            linked_streaks = pair_streaks[linked][order]
+            linked_tracks = pair_tracks[linked][order]
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = linked_streaks[1:] != linked_streaks[:-1]
+            for i, j in zip(linked_streaks[first], linked_tracks[first]):
+                track_ids[i] = tracks[j]['id']
+
+        # Update the tracks after all the streaks are linked, so the
+        # streaks of the frame are linked independently of their order.
+        scatters = np.einsum('ni,nj->nij', ep1, ep1) + \
+            np.einsum('ni,nj->nij', ep2, ep2)
+        for i, output in enumerate(outputs):
+            if track_ids[i] is None:
+                track_ids[i] = self._new_track()
+            track = self._tracks[track_ids[i]]
+            track['detections'].append(dict(output, time=time, frame=frame))
+            track['scatter'] += scatters[i]
+            track['last_time'] = time
+            track['last_center'] = centers[i]
+
+        # The pole of the great circle fitted to all the extreme points
+        # of each track, which is the eigenvector of the smallest
+        # eigenvalue of their scatter matrix.
+        updated = list(set(track_ids))
+        eigenvectors = np.linalg.eigh(
+            np.array([self._tracks[j]['scatter'] for j in updated]))[1]
+        for track_id, eigenvector in zip(updated, eigenvectors):
+            self._tracks[track_id]['pole'] = eigenvector[:, 0]
+
+        return track_ids
+
+    def _new_track(self):
+        """Create an empty track and return its ID."""
+        track_id = self._next_id
+        self._next_id += 1
+        self._tracks[track_id] = {
+            'id': track_id, 'detections': [],
+            'scatter': np.zeros((3, 3)), 'pole': None,
+            'last_time': None, 'last_center': None}
+
+        return track_id
+
+    def _retire(self, time):
+        """Finish the tracks without any streak within the time window."""
+        expired = [track_id for track_id, track in self._tracks.items()
+                   if time - track['last_time'] > self.time_window]
+        for track_id in expired:
+            self._finished.append(self._finish(self._tracks.pop(track_id)))
+
+    def _finish(self, track):
+        return {'id': track['id'], 'detections': track['detections'],
+                'pole': track['pole']}
+
+    def get_finished(self):
+        """
+        Return the tracks finished since the last call, and forget them.
+
+        Returns
+        -------
+        tracks : list of dict
+            Finished tracks having the 'id', the 'detections' (the streak
+            information with the 'time' and 'frame' of each streak) and the
+            'pole' of the fitted great circle.
+        """
+        finished = self._finished
+        self._finished = []
+
+        return finished
+
+    def flush(self):
+        """
+        Finish all the active tracks, e.g. at the end of a night.
+
+        Returns
+        -------
+        tracks : list of dict
+            All the finished tracks not yet returned. See get_finished.
+        """
+        for track_id in list(self._tracks):
+            self._finished.append(self._finish(self._tracks.pop(track_id)))
+
+        return self.get_finished()
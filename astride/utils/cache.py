@@ -0,0 +1,140 @@
+import hashlib
+import os
+import pickle
+
+import numpy as np
+
+
+class ResultCache:
+    """
+    Content-addressed cache of detection results on the local disk.
+
+    Results are keyed by a hash of the image data and of all the
+    detection parameters, so a frame processed again with the same
+    parameters is not processed again. When the total size of the cached
+    results exceeds max_size, the least recently used ones are removed.
+
+    Results are saved as pickles, and loading a pickle can run arbitrary
+    code, so use only a folder that no one else can write to.
+
+    Parameters
+    ----------
+    path : str
+        Folder to save the cached results.
+    max_size : int, optional
+        The maximum total size of the cached results in bytes.
+    intermediates : bool, optional
+        If True, the background removed image, the background map and the
+        raw borders are cached as well, so that figures can be plotted
+        from a cached result. Otherwise only the streaks and the
+        background statistics are cached.
+    """
+    def __init__(self, path, max_size=2**30, intermediates=False):
+        self.path = path
+        self.max_size = max_size
+        self.intermediates = intermediates
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+    def get_key(self, data, parameters):
+        """
+        Return the key of an image and parameters.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            Image data.
+        parameters : dict
+            Detection parameters. Arrays are hashed by their contents.
+
+        Returns
+        -------
+        key : str
+            Hexadecimal hash.
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        self._update(digest, data)
+        for name in sorted(parameters):
+            digest.update(name.encode())
+            self._update(digest, parameters[name])
+
+        return digest.hexdigest()
+
+    def _update(self, digest, value):
+        """Add a value to the hash."""
+        if isinstance(value, np.ndarray):
+            digest.update(('%s%s' % (value.shape, value.dtype.str)).encode())
+            digest.update(np.ascontiguousarray(value).data)
+        else:
+            digest.update(repr(value).encode())
+
+    def _get_filepath(self, key):
+        return os.path.join(self.path, '%s.pkl' % key)
+
+    def get(self, key):
+        """
+        Return a cached result.
+
+        Parameters
+        ----------
+        key : str
+            Key of the result.
+
+        Returns
+        -------
+        result : dict
+            The cached result, or None if it is not cached.
+        """
+        filepath = self._get_filepath(key)
+        try:
+            with open(filepath, 'rb') as fp:
+                result = pickle.load(fp)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        # Mark as recently used.
+        os.utime(filepath)
+
+        return result
+
+    def put(self, key, result):
+        """
+        Cache a result, and then remove the least recently used results
+        if the cache is too large.
+
+        Parameters
+        ----------
+        key : str
+            Key of the result.
+        result : dict
+            Result to cache.
+        """
+        filepath = self._get_filepath(key)
+
+        # Write to a temporary file first, so that a partially written
+        # result is never read.
+        temp_filepath = '%s.%d.tmp' % (filepath, os.getpid())
+        with open(temp_filepath, 'wb') as fp:
+            pickle.dump(result, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_filepath, filepath)
+
+        self._evict()
+
+    def _evict(self):
+        """Remove the least recently used results beyond max_size."""
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.pkl'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(entry[1] for entry in entries)
+        for _mtime, size, filepath in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(filepath)
+            except OSError:
+                pass
+            total_size -= size
@@ -0,0 +1,123 @@
+from collections import deque
+
+import numpy as np
+
+from skimage import measure
+
+
+def find_contours(image, level, fully_connected='high', strip_height=None):
+    """
+    Find contours of an image in horizontal strips.
+
+    skimage.measure.find_contours converts the whole image to float64.
+    Here the image is searched in strips of strip_height rows overlapping
+    by one row, so only a strip is converted at once. The pieces of the
+    contours crossing the strips end exactly on the shared rows, so they
+    are joined into the same contours, in the same order, as those of the
+    whole image, although a closed contour may start from another point.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        A 2D image.
+    level : float
+        Value to search contours at.
+    fully_connected : {'high', 'low'}, optional
+        See skimage.measure.find_contours for details.
+    strip_height : int, optional
+        The number of rows of each strip. If None, the whole image is
+        searched at once.
+
+    Returns
+    -------
+    contours : list
+        A list of (row, column) contours.
+    """
+    height = image.shape[0]
+    if strip_height is None or strip_height >= height:
+        return measure.find_contours(image, level,
+                                     fully_connected=fully_connected)
+
+    strip_height = max(int(strip_height), 2)
+
+    # Pieces of the contours, ranked by the order of their first segment.
+    pieces = []
+    for start in range(0, height - 1, strip_height - 1):
+        stop = min(start + strip_height, height)
+        for contour in measure.find_contours(
+                image[start:stop], level, fully_connected=fully_connected):
+            contour[:, 0] += start
+            pieces.append(contour)
+
+    return _join_pieces(pieces)
+
+
+def _join_pieces(pieces):
+    """
+    Join pieces of contours sharing their end points.
+
+    Same as skimage.measure._find_contours._assemble_contours, but for
+    pieces instead of segments.
+    """
+    current_index = 0
+    contours = {}
+    starts = {}
+    ends = {}
+    for piece in pieces:
+        from_point = tuple(piece[0])
+        to_point = tuple(piece[-1])
+
+        # Closed contours are complete.
+        if from_point == to_point and len(piece) > 1:
+            contours[current_index] = deque([piece])
+            current_index += 1
+            continue
+
+        tail, tail_num = starts.pop(to_point, (None, None))
+        head, head_num = ends.pop(from_point, (None, None))
+
+        if tail is not None and head is not None:
+            if tail is head:
+                # Close the contour. The shared point is kept once.
+                head.append(piece[1:])
+            elif tail_num > head_num:
+                # Append the tail to the head, keeping the earlier contour.
+                head.append(piece[1:-1])
+                head.append(tail.popleft())
+                head.extend(tail)
+                contours.pop(tail_num, None)
+                ends[_last_point(head)] = (head, head_num)
+            else:
+                # Prepend the head to the tail.
+                tail.appendleft(piece[1:-1])
+                tail.extendleft(reversed(head))
+                starts.pop(_first_point(head), None)
+                contours.pop(head_num, None)
+                starts[_first_point(tail)] = (tail, tail_num)
+                ends[_last_point(tail)] = (tail, tail_num)
+        elif tail is None and head is None:
+            contour = deque([piece])
+            contours[current_index] = contour
+            starts[from_point] = (contour, current_index)
+            ends[to_point] = (contour, current_index)
+            current_index += 1
+        elif head is None:
+            # Prepend the piece to the tail.
+            tail.appendleft(piece[:-1])
+            starts[from_point] = (tail, tail_num)
+        else:
+            # Append the piece to the head.
+            head.append(piece[1:])
+            ends[to_point] = (head, head_num)
+
+    return [np.concatenate(contour) for _, contour in sorted(contours.items())]
+
+
+def _first_point(contour):
+    """Return the first point of a contour made of pieces."""
+    return tuple(contour[0][0])
+
+
+def _last_point(contour):
+    """Return the last point of a contour made of pieces."""
+    return tuple(contour[-1][-1])
@@ -1,7 +1,12 @@
 import numpy as np
-import math
 
-from scipy.optimize import leastsq
+from scipy.spatial import ConvexHull
+from scipy.spatial import QhullError
+
+# The number of points of an edge above which its extreme points are
+# searched among the vertices of its convex hull, which always include the
+# farthest points and are much faster to search for long edges.
+HULL_POINTS = 256
 
 
 class EDGE:
@@ -22,10 +27,18 @@ class EDGE:
         An empirical radius deviation cut.
     connectivity_angle: float, optional
         An maximum angle to connect each separated edge.
+    max_outer_points: int, optional
+        The maximum number of points of an edge to search its extreme
+        points using the N x N matrix of the distances between the points.
+        The extreme points of larger edges are searched among the vertices
+        of their convex hull, which needs much less memory. The hull is
+        always used for edges having more than HULL_POINTS points.
     """
     def __init__(self, contours, min_points=10, shape_cut=0.2,
-                 area_cut=10., radius_dev_cut=0.5, connectivity_angle=3.):
+                 area_cut=10., radius_dev_cut=0.5, connectivity_angle=3.,
+                 max_outer_points=None):
         # Set global values.
+        self.max_outer_points = max_outer_points
         self.shape_cut = shape_cut
         self.area_cut = area_cut
         self.radius_dev_cut = radius_dev_cut
@@ -60,115 +73,193 @@ class EDGE:
                 'connectivity': -1,
                 # For plotting a box surrounding the edge.
                 'x_min': 0., 'x_max': 0.,
-                'y_min': 0., 'y_max': 0.,
-                # For plotting. To check if this edge
-                # is surrounded by a box already.
-                'box_plotted': False})
+                'y_min': 0., 'y_max': 0.})
 
     def quantify(self):
         """Quantify shape of the contours."""
         four_pi = 4. * np.pi
-        p0 = [0., 0.]
         radian2angle = 180. / np.pi
-        for edge in self.edges:
-            # Positions
-            x = edge['x']
-            y = edge['y']
-
-            A, perimeter, x_center, y_center, distances = \
-                self.get_shape_factor(x, y)
 
+        if len(self.edges) == 0:
+            return
+
+        # Shape metrics of all the edges at once, using one packed
+        # coordinate buffer and the offset of each edge in the buffer.
+        counts = np.array([len(edge['x']) for edge in self.edges])
+        offsets = np.zeros(len(counts), dtype=np.intp)
+        offsets[1:] = np.cumsum(counts)[:-1]
+        x_all = np.concatenate([edge['x'] for edge in self.edges])
+        y_all = np.concatenate([edge['y'] for edge in self.edges])
+        areas, perimeters, x_centers, y_centers, radius_deviations, \
+            x_mins, x_maxs, y_mins, y_maxs = \
+            self.get_shape_factors(x_all, y_all, offsets)
+
+        # Straight lines fitted to all the edges at once.
+        angles, x_means, y_means, half_thicknesses = \
+            self.get_lines(x_all, y_all, offsets)
+        extreme_points = self.get_all_extreme_points(x_all, y_all, offsets)
+
+        for i, edge in enumerate(self.edges):
             # Set values.
-            edge['area'] = A
-            edge['perimeter'] = perimeter
-            edge['x_center'] = x_center
-            edge['y_center'] = y_center
+            edge['area'] = areas[i]
+            edge['perimeter'] = perimeters[i]
+            edge['x_center'] = x_centers[i]
+            edge['y_center'] = y_centers[i]
             # Circle is 1. Rectangle is 0.78. Thread-like is close to zero.
             edge['shape_factor'] = four_pi * edge['area'] / \
                                    edge['perimeter'] ** 2.
+            edge['radius_deviation'] = radius_deviations[i]
+
+            edge['x_min'] = x_mins[i]
+            edge['x_max'] = x_maxs[i]
+            edge['y_min'] = y_mins[i]
+            edge['y_max'] = y_maxs[i]
+
+            # The fitted line.
+            c, s = np.cos(angles[i]), np.sin(angles[i])
+            edge['slope'] = np.tan(angles[i])
+            edge['intercept'] = y_means[i] - edge['slope'] * x_means[i]
+            edge['slope_angle'] = angles[i] * radian2angle
+            edge['thickness'] = 2 * half_thicknesses[i]
+
+            # Project the extreme points onto the line, and then move them
+            # inward by the half thickness. The first one has the lower x.
+            ep1, ep2 = extreme_points[i]
+            t1 = (ep1[0] - x_means[i]) * c + (ep1[1] - y_means[i]) * s
+            t2 = (ep2[0] - x_means[i]) * c + (ep2[1] - y_means[i]) * s
+            t1, t2 = min(t1, t2) + half_thicknesses[i], \
+                max(t1, t2) - half_thicknesses[i]
+            edge['extreme_points'] = [
+                np.array([x_means[i] + t1 * c, y_means[i] + t1 * s]),
+                np.array([x_means[i] + t2 * c, y_means[i] + t2 * s])]
+            edge['length'] = abs(t2 - t1)
+
+    def get_extreme_points(self, x, y):
+        """
+        Return the two points of a border farthest from each other.
+
+        Parameters
+        ----------
+        x : numpy.ndarray
+            An array of x coordinates.
+        y : numpy.ndarray
+            An array of y coordinates.
+
+        Returns
+        -------
+        ep1, ep2 : tuple
+            (x, y) coordinates of the two points.
+        """
+        indices = np.arange(len(x))
+        if len(x) > self._get_max_points():
+            # The farthest points are vertices of the convex hull.
+            try:
+                indices = np.sort(ConvexHull(np.column_stack([x, y]))
+                                  .vertices)
+            except QhullError:
+                # All the points are on a line, so the farthest points are
+                # the extremes along the line.
+                if np.ptp(x) >= np.ptp(y):
+                    indices = np.array([np.argmin(x), np.argmax(x)])
+                else:
+                    indices = np.array([np.argmin(y), np.argmax(y)])
+
+        # Calculate squared pairwise distances by computing outer differences and
+        # squaring them for both x and y coordinates (alternative: NumPy broadcasting)
+        x = x[indices]
+        y = y[indices]
+        dist_squared_matrix = (
+            np.add.outer(x, -x) ** 2
+            + np.add.outer(y, -y) ** 2
+        )
+
+        # Find the index of the maximum distance squared and its value
+        idx_max = np.unravel_index(
+            np.argmax(dist_squared_matrix), dist_squared_matrix.shape
+        )
+        ep1 = (x[idx_max[0]], y[idx_max[0]])
+        ep2 = (x[idx_max[1]], y[idx_max[1]])
+
+        return ep1, ep2
+
+    def _get_max_points(self):
+        """Return the maximum number of points searched by the matrix."""
+        if self.max_outer_points is None:
+            return HULL_POINTS
+
+        return min(self.max_outer_points, HULL_POINTS)
+
+    def get_all_extreme_points(self, x, y, offsets):
+        """
+        Return the two points farthest from each other of many borders.
+
+        The borders are sorted by their number of points, and the pairwise
+        distances of a chunk of borders of similar size are computed at
+        once. The longer borders use get_extreme_points, which searches the
+        vertices of their convex hull.
 
-            # We assume that the radius of the edge
-            # as the median value of the distances from the center.
-            radius = np.median(distances)
-            edge['radius_deviation'] = np.std(distances - radius) / radius
-
-            edge['x_min'] = np.min(x)
-            edge['x_max'] = np.max(x)
-            edge['y_min'] = np.min(y)
-            edge['y_max'] = np.max(y)
-
-            # Extreme Points
-            # Calculate squared pairwise distances by computing outer differences and
-            # squaring them for both x and y coordinates (alternative: NumPy broadcasting)
-            dist_squared_matrix = (
-                np.add.outer(edge['x'], -edge['x']) ** 2
-                + np.add.outer(edge['y'], -edge['y']) ** 2
-            )
-
-            # Find the index of the maximum distance squared and its value
-            idx_max = np.unravel_index(
-                np.argmax(dist_squared_matrix), dist_squared_matrix.shape
-            )
-            ep1 = (edge['x'][idx_max[0]], edge['y'][idx_max[0]])
-            ep2 = (edge['x'][idx_max[1]], edge['y'][idx_max[1]])
-
-            # Calculate guess for line fitting
-            if not math.isclose(ep2[0], ep1[0], rel_tol=1e-9):  # Prevent division by zero
-                m_guess = (ep2[1] - ep1[1]) / (ep2[0] - ep1[0])
-                b_guess = ep1[1] - m_guess * ep1[0]
-                p0 = [m_guess, b_guess]
-            else:
-                p0 = [0,0]
-
-            # Fitting a straight line to each edge.
-            # A perfectly vertical line will stop after 'maxfev' tries with sufficiently good values.
-            # (RuntimeWarning: Number of calls to function has reached maxfev = 600.)
-            p1, s = leastsq(self.orthogonal_residuals, p0, args=(edge['x'][:-1], edge['y'][:-1]))
-            # An alternative is 'scipy.odr', but a quick test shows it is at least twice as slow.
-            edge['slope'] = p1[0]
-            edge['intercept'] = p1[1]
-            edge['slope_angle'] = np.arctan(edge['slope']) * radian2angle
-
-            # Thickness
-            # Calculate orthogonal distances to the line
-            distances = np.abs(
-                edge['slope'] * edge['x'] - edge['y'] + edge['intercept']
-            ) / np.sqrt(edge['slope'] ** 2 + 1)
-            # Use median to find central distance
-            median_distance = np.median(distances)
-            edge['thickness'] = 2 * median_distance
-
-            # Extreme Points and Length
-            def project_point(point, slope, intercept):
-                """Project a point onto the line defined by slope and intercept."""
-                x0, y0 = point
-                xp = (x0 + slope * (y0 - intercept)) / (slope**2 + 1)
-                yp = slope * xp + intercept
-                return (xp, yp)
-
-            # Project these points onto the fitted line
-            projected_p1 = project_point(ep1, edge['slope'], edge['intercept'])
-            projected_p2 = project_point(ep2, edge['slope'], edge['intercept'])
-
-            # Ensure p1 has the lower x value; if not, swap p1 and p2
-            if projected_p1[0] > projected_p2[0]:
-                projected_p1, projected_p2 = projected_p2, projected_p1
-
-            # Calculate the direction vector of the line using the slope (dx, dy) and normalize
-            direction_vector = np.array([1, edge['slope']])
-            unit_vector = direction_vector / np.linalg.norm(direction_vector)
-
-            # Add and subtract half thickness
-            adjustment_vector = unit_vector * median_distance
-            adjusted_projected_p1 = np.add(projected_p1, adjustment_vector)
-            adjusted_projected_p2 = np.subtract(projected_p2, adjustment_vector)
-
-            edge['extreme_points'] = [adjusted_projected_p1, adjusted_projected_p2]
-            edge['length'] = np.sqrt(
-                (adjusted_projected_p2[0] - adjusted_projected_p1[0]) ** 2
-                + (adjusted_projected_p2[1] - adjusted_projected_p1[1]) ** 2
-            )
+        Parameters
+        ----------
+        x : numpy.ndarray
+            Concatenated x coordinates of all the borders.
+        y : numpy.ndarray
+            Concatenated y coordinates of all the borders.
+        offsets : numpy.ndarray
+            Start index of each border in the x and y buffers.
 
+        Returns
+        -------
+        extreme_points : numpy.ndarray
+            (N_border, 2, 2) array of the (x, y) coordinates of the two
+            points of each border.
+        """
+        counts = np.diff(np.append(offsets, len(x)))
+        extreme_points = np.empty((len(counts), 2, 2))
+
+        max_points = self._get_max_points()
+        small = counts <= max_points
+        for i in np.nonzero(~small)[0]:
+            border = slice(offsets[i], offsets[i] + counts[i])
+            extreme_points[i] = self.get_extreme_points(x[border],
+                                                        y[border])
+
+        # The number of distances in a chunk is bounded as the matrix of
+        # the longest border searched by the matrix.
+        max_size = max(max_points, 64) ** 2
+        order = np.nonzero(small)[0]
+        order = order[np.argsort(counts[order], kind='stable')]
+        start = 0
+        while start < len(order):
+            end = start + 1
+            while end < len(order) and \
+                    (end + 1 - start) * counts[order[end]] ** 2 <= max_size:
+                end += 1
+            chunk = order[start:end]
+            start = end
+
+            # Coordinates padded by the last point of each border, whose
+            # distances are then ignored. The first maximum in the row-major
+            # order is the same pair as in get_extreme_points.
+            n_points = counts[chunk[-1]]
+            columns = np.arange(n_points)
+            valid = columns < counts[chunk][:, np.newaxis]
+            indices = offsets[chunk][:, np.newaxis] + \
+                np.minimum(columns, counts[chunk][:, np.newaxis] - 1)
+            xs = x[indices]
+            ys = y[indices]
+            dist_squared = (xs[:, :, np.newaxis] - xs[:, np.newaxis, :]) ** 2 \
+                + (ys[:, :, np.newaxis] - ys[:, np.newaxis, :]) ** 2
+            dist_squared[~(valid[:, :, np.newaxis] &
+                           valid[:, np.newaxis, :])] = -1.
+            idx_max = np.argmax(dist_squared.reshape(len(chunk), -1), axis=1)
+            rows = np.arange(len(chunk))
+            first, second = np.divmod(idx_max, n_points)
+            extreme_points[chunk, 0, 0] = xs[rows, first]
+            extreme_points[chunk, 0, 1] = ys[rows, first]
+            extreme_points[chunk, 1, 0] = xs[rows, second]
+            extreme_points[chunk, 1, 1] = ys[rows, second]
+
+        return extreme_points
 
     def get_shape_factor(self, x, y):
         """
@@ -213,6 +304,171 @@ class EDGE:
 
         return np.abs(A), perimeter, x_center, y_center, distances
 
+    def get_shape_factors(self, x, y, offsets):
+        """
+        Return values related to the shapes of many borders at once.
+
+        Batch version of get_shape_factor. The coordinates of all the
+        borders are packed into one buffer, and every per-border sum is
+        done by a single reduction over the buffer.
+
+        Parameters
+        ----------
+        x : numpy.ndarray
+            Concatenated x coordinates of all the borders.
+        y : numpy.ndarray
+            Concatenated y coordinates of all the borders.
+        offsets : numpy.ndarray
+            Start index of each border in the x and y buffers.
+
+        Returns
+        -------
+        areas : numpy.ndarray
+            Area of each border.
+        perimeters : numpy.ndarray
+            Perimeter of each border.
+        x_centers : numpy.ndarray
+            X center coordinate of each border.
+        y_centers : numpy.ndarray
+            Y center coordinate of each border.
+        radius_deviations : numpy.ndarray
+            Standard deviation of the distances from the center divided by
+            the median distance (i.e. radius) of each border.
+        x_mins, x_maxs, y_mins, y_maxs : numpy.ndarray
+            Bounding box of each border.
+        """
+        n_points = len(x)
+        counts = np.diff(np.append(offsets, n_points))
+        # Index of the last point of each border.
+        ends = offsets + counts - 1
+
+        # Coordinates relative to the first point of each border, which
+        # avoids the cancellation of large products in the sums below.
+        # The sums are done in float64 even for float32 coordinates.
+        x_origins = x[offsets].astype(np.float64)
+        y_origins = y[offsets].astype(np.float64)
+        x = x - np.repeat(x_origins, counts)
+        y = y - np.repeat(y_origins, counts)
+
+        # The following point of each point. The term linking the last
+        # point of a border to the first point of the next border
+        # is zeroed below.
+        x_next = np.roll(x, -1)
+        y_next = np.roll(y, -1)
+
+        # Area.
+        xyxy = x * y_next - x_next * y
+        xyxy[ends] = 0.
+        A = 1. / 2. * np.add.reduceat(xyxy, offsets)
+
+        # X and Y center.
+        one_sixth_a = 1. / (6. * A)
+        x_centers = one_sixth_a * np.add.reduceat((x + x_next) * xyxy, offsets)
+        y_centers = one_sixth_a * np.add.reduceat((y + y_next) * xyxy, offsets)
+
+        # Perimeter.
+        steps = np.sqrt((x_next - x)**2 + (y_next - y)**2)
+        steps[ends] = 0.
+        perimeters = np.add.reduceat(steps, offsets)
+
+        # Distances from the center.
+        distances = np.sqrt((x - np.repeat(x_centers, counts))**2 +
+                            (y - np.repeat(y_centers, counts))**2)
+        x_centers += x_origins
+        y_centers += y_origins
+
+        # We assume that the radius of the border is the median value of
+        # the distances from the center. Sort the distances within each
+        # border, and then pick the middle element(s).
+        border_ids = np.repeat(np.arange(len(offsets)), counts)
+        sorted_distances = distances[np.lexsort((distances, border_ids))]
+        radii = 0.5 * (sorted_distances[offsets + (counts - 1) // 2] +
+                       sorted_distances[offsets + counts // 2])
+
+        # Standard deviation of the distances around the radius.
+        deviations = distances - np.repeat(radii, counts)
+        mean_deviations = np.add.reduceat(deviations, offsets) / counts
+        residuals = deviations - np.repeat(mean_deviations, counts)
+        stds = np.sqrt(np.add.reduceat(residuals**2, offsets) / counts)
+        radius_deviations = stds / radii
+
+        # Bounding box.
+        x_mins = np.minimum.reduceat(x, offsets) + x_origins
+        x_maxs = np.maximum.reduceat(x, offsets) + x_origins
+        y_mins = np.minimum.reduceat(y, offsets) + y_origins
+        y_maxs = np.maximum.reduceat(y, offsets) + y_origins
+
+        return np.abs(A), perimeters, x_centers, y_centers, \
+            radius_deviations, x_mins, x_maxs, y_mins, y_maxs
+
+    def get_lines(self, x, y, offsets):
+        """
+        Fit straight lines to many borders at once.
+
+        Each line minimizes the sum of the squared orthogonal distances of
+        the points of a border (without the closing point), so it passes
+        through their centroid along the major axis of their second
+        moments. The half thickness of each border is the median of the
+        distances of all its points from the line.
+
+        Parameters
+        ----------
+        x : numpy.ndarray
+            Concatenated x coordinates of all the borders.
+        y : numpy.ndarray
+            Concatenated y coordinates of all the borders.
+        offsets : numpy.ndarray
+            Start index of each border in the x and y buffers.
+
+        Returns
+        -------
+        angles : numpy.ndarray
+            Angle of each line in radian, within (-pi/2, pi/2].
+        x_means, y_means : numpy.ndarray
+            Centroid of the points of each border, on its line.
+        half_thicknesses : numpy.ndarray
+            Median distance of the points from the line of each border.
+        """
+        counts = np.diff(np.append(offsets, len(x)))
+        ends = offsets + counts - 1
+
+        # Coordinates relative to the first point of each border, in
+        # float64, as in get_shape_factors.
+        x_origins = x[offsets].astype(np.float64)
+        y_origins = y[offsets].astype(np.float64)
+        x = x - np.repeat(x_origins, counts)
+        y = y - np.repeat(y_origins, counts)
+
+        # Moments of the points without the closing point.
+        weights = np.ones(len(x))
+        weights[ends] = 0.
+        n = counts - 1.
+        x_means = np.add.reduceat(x * weights, offsets) / n
+        y_means = np.add.reduceat(y * weights, offsets) / n
+        dx = (x - np.repeat(x_means, counts)) * weights
+        dy = (y - np.repeat(y_means, counts)) * weights
+        xx = np.add.reduceat(dx * dx, offsets)
+        yy = np.add.reduceat(dy * dy, offsets)
+        xy = np.add.reduceat(dx * dy, offsets)
+        angles = 0.5 * np.arctan2(2. * xy, xx - yy)
+        angles[angles <= -np.pi / 2.] += np.pi
+
+        # Median distance from the line, sorting the distances within
+        # each border.
+        distances = np.abs(
+            -(x - np.repeat(x_means, counts)) * np.repeat(np.sin(angles),
+                                                          counts) +
+            (y - np.repeat(y_means, counts)) * np.repeat(np.cos(angles),
+                                                         counts))
+        border_ids = np.repeat(np.arange(len(offsets)), counts)
+        sorted_distances = distances[np.lexsort((distances, border_ids))]
+        half_thicknesses = 0.5 * (
+            sorted_distances[offsets + (counts - 1) // 2] +
+            sorted_distances[offsets + counts // 2])
+
+        return angles, x_means + x_origins, y_means + y_origins, \
+            half_thicknesses
+
     def get_edges(self):
         return self.edges
 
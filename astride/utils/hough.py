@@ -0,0 +1,378 @@
+import numpy as np
+
+from scipy import ndimage
+
+from astride.utils.edge import EDGE
+from astride.utils.misc import bin_image
+
+
+class Hough:
+    """
+    Detect long straight streaks using a Hough transform.
+
+    Lines are first searched in a Hough accumulator of the thresholded
+    binned image, and then refined at the full resolution by a Radon
+    transform of the pixels around each line. The accumulator has a fixed
+    size and the points are voted in chunks, so the memory is bounded
+    regardless of the image size.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        Background removed image.
+    std : float
+        Standard deviation of the background noise.
+    threshold : float, optional
+        Detection threshold in units of the noise. The binned image is
+        thresholded at the same significance for the averaged noise, and
+        the median along-track level of a refined streak must be above it
+        as well.
+    bin_factor : int, optional
+        Binning factor of the coarse search.
+    n_angles : int, optional
+        The number of angles of the accumulator.
+    min_length : float, optional
+        The minimum length of a streak in pixels.
+    max_gap : float, optional
+        The maximum gap in pixels between the parts of a streak.
+        If None, five binned pixels.
+    angle_step : float, optional
+        Angle step in degree of the refinement.
+    chunk_size : int, optional
+        The number of points voted at once.
+    max_lines : int, optional
+        The maximum number of accumulator peaks to check.
+    min_uniformity : float, optional
+        The minimum ratio of the first quartile to the median of the
+        along-track contrast of a refined streak. A streak is bright along
+        its length, while a chain of stars is bright only around the
+        stars, so its first quartile is close to zero.
+    """
+    def __init__(self, image, std, threshold=3., bin_factor=8, n_angles=180,
+                 min_length=50., max_gap=None, angle_step=0.05,
+                 chunk_size=4096, max_lines=100, min_uniformity=0.3):
+        self.image = image
+        self.std = std
+        self.threshold = threshold
+        self.bin_factor = int(bin_factor)
+        self.n_angles = n_angles
+        self.min_length = min_length
+        if max_gap is None:
+            max_gap = 5. * self.bin_factor
+        self.max_gap = max_gap
+        self.angle_step = angle_step
+        self.chunk_size = chunk_size
+        self.max_lines = max_lines
+        self.min_uniformity = min_uniformity
+
+        self.edges = []
+
+    def detect(self):
+        """Search lines and refine them."""
+        b = self.bin_factor
+
+        # Points above the threshold in the binned image.
+        binned = bin_image(self.image, b)
+        ys, xs = np.nonzero(binned > self.threshold * self.std / b)
+        xs = xs.astype(np.float64)
+        ys = ys.astype(np.float64)
+
+        thetas = np.linspace(0., np.pi, self.n_angles, endpoint=False)
+        acc, diag = self._vote(xs, ys, thetas, binned.shape)
+        peaks = self._find_peaks(acc)
+
+        # Binned pixel centers in the full resolution.
+        half = (b - 1) / 2.
+
+        # Check peaks from the strongest one. Points of an accepted line
+        # are not used again, so the same streak is not detected twice.
+        used = np.zeros(len(xs), dtype=bool)
+        segments = []
+        for i, j in peaks:
+            theta = thetas[i]
+            rho = j - diag
+            c, s = np.cos(theta), np.sin(theta)
+            members = np.nonzero(
+                (np.abs(xs * c + ys * s - rho) <= 1.) & ~used)[0]
+            for run in self._split_runs(members, -xs * s + ys * c):
+                t = -xs[run] * s + ys[run] * c
+                if (t.max() - t.min() + 1.) * b < self.min_length:
+                    continue
+
+                # Into the full resolution.
+                segment = self._refine(theta, rho * b + half * (c + s),
+                                       t.min() * b + half * (c - s),
+                                       t.max() * b + half * (c - s))
+                if segment is None:
+                    continue
+                segments.append(segment)
+
+                # Points around the refined segment are not used again.
+                f_theta, f_rho, f_t_min, f_t_max, thickness = segment
+                f_c, f_s = np.cos(f_theta), np.sin(f_theta)
+                x_full = xs * b + half
+                y_full = ys * b + half
+                t_full = -x_full * f_s + y_full * f_c
+                used |= (np.abs(x_full * f_c + y_full * f_s - f_rho) <=
+                         thickness / 2. + 1.5 * b) & \
+                        (t_full >= f_t_min - b) & (t_full <= f_t_max + b)
+
+        self.edges = [self._to_edge(n + 1, *segment)
+                      for n, segment in enumerate(segments)]
+
+    def _vote(self, xs, ys, thetas, shape):
+        """
+        Fill the Hough accumulator.
+
+        Returns
+        -------
+        acc : numpy.ndarray
+            Accumulator of (angle, rho) with one pixel rho bins.
+        diag : int
+            Offset of rho zero in the accumulator.
+        """
+        cos_t = np.cos(thetas)
+        sin_t = np.sin(thetas)
+        diag = int(np.ceil(np.hypot(*shape)))
+        n_rho = 2 * diag + 1
+
+        acc = np.zeros(len(thetas) * n_rho, dtype=np.int64)
+        theta_offsets = np.arange(len(thetas)) * n_rho + diag
+        for i in range(0, len(xs), self.chunk_size):
+            rhos = np.rint(np.outer(xs[i:i + self.chunk_size], cos_t) +
+                           np.outer(ys[i:i + self.chunk_size], sin_t))
+            indices = rhos.astype(np.intp) + theta_offsets
+            acc += np.bincount(indices.ravel(), minlength=acc.size)
+
+        return acc.reshape(len(thetas), n_rho), diag
+
+    def _find_peaks(self, acc):
+        """
+        Return significant local maxima of the accumulator.
+
+        Returns
+        -------
+        peaks : numpy.ndarray
+            (N, 2) array of (angle index, rho index) ordered by votes.
+        """
+        # Votes expected from the unrelated points at each angle.
+        n_filled = np.maximum((acc > 0).sum(axis=1), 1)
+        background = acc.sum(axis=1) / n_filled
+        min_votes = np.maximum(background + 5. * np.sqrt(background),
+                               self.min_length / self.bin_factor / 2.)
+
+        local_max = ndimage.maximum_filter(acc, size=5, mode='constant')
+        peaks = np.argwhere((acc == local_max) &
+                            (acc >= min_votes[:, np.newaxis]))
+        order = np.argsort(acc[peaks[:, 0], peaks[:, 1]])[::-1]
+
+        return peaks[order[:self.max_lines]]
+
+    def _split_runs(self, members, t):
+        """Split the points along a line at the gaps."""
+        if len(members) == 0:
+            return []
+
+        members = members[np.argsort(t[members])]
+        gaps = np.diff(t[members]) > self.max_gap / self.bin_factor
+
+        return np.split(members, np.nonzero(gaps)[0] + 1)
+
+    def _band_pixels(self, theta, rho, t_min, t_max, half_width):
+        """
+        Return the pixels within a distance from a line segment.
+
+        Pixels are enumerated along the line, so the cost is bounded by
+        the band area rather than by the image size.
+
+        Returns
+        -------
+        x, y : numpy.ndarray
+            Pixel coordinates.
+        values : numpy.ndarray
+            Pixel values.
+        """
+        c, s = np.cos(theta), np.sin(theta)
+        ny, nx = self.image.shape
+
+        # Iterate over the axis closer to the line direction.
+        if abs(s) >= abs(c):
+            ends = rho * c - np.array([t_min, t_max]) * s
+            x = np.arange(np.floor(ends.min() - half_width),
+                          np.ceil(ends.max() + half_width) + 1)
+            y_line = (rho - x * c) / s
+            width = int(np.ceil(half_width / abs(s)))
+            y = np.rint(y_line)[:, np.newaxis] + np.arange(-width, width + 1)
+            x = np.broadcast_to(x[:, np.newaxis], y.shape)
+        else:
+            ends = rho * s + np.array([t_min, t_max]) * c
+            y = np.arange(np.floor(ends.min() - half_width),
+                          np.ceil(ends.max() + half_width) + 1)
+            x_line = (rho - y * s) / c
+            width = int(np.ceil(half_width / abs(c)))
+            x = np.rint(x_line)[:, np.newaxis] + np.arange(-width, width + 1)
+            y = np.broadcast_to(y[:, np.newaxis], x.shape)
+
+        x = x.ravel()
+        y = y.ravel()
+        t = -x * s + y * c
+        inside = (x >= 0) & (x < nx) & (y >= 0) & (y < ny) & \
+                 (np.abs(x * c + y * s - rho) <= half_width) & \
+                 (t >= t_min) & (t <= t_max)
+        x = x[inside].astype(np.intp)
+        y = y[inside].astype(np.intp)
+
+        return x, y, self.image[y, x]
+
+    def _refine(self, theta, rho, t_min, t_max):
+        """
+        Refine a coarse line segment at the full resolution.
+
+        Returns
+        -------
+        segment : tuple
+            (theta, rho, t_min, t_max, thickness), or None if the segment
+            is not confirmed.
+        """
+        b = self.bin_factor
+        coarse_step = np.pi / self.n_angles
+
+        # The band covers the uncertainties of the coarse angle and rho.
+        half_width = b + (t_max - t_min) / 2. * np.sin(coarse_step)
+        t_min -= b
+        t_max += b
+        x, y, values = self._band_pixels(theta, rho, t_min, t_max,
+                                         half_width)
+        if len(values) == 0:
+            return None
+
+        # Radon transform of the band at finer angles, one pixel rho bins.
+        best = (-np.inf, theta, rho)
+        n_bins = int(np.ceil(2. * half_width)) + 3
+        for angle in np.arange(theta - coarse_step, theta + coarse_step,
+                               np.radians(self.angle_step)):
+            d = x * np.cos(angle) + y * np.sin(angle) - rho
+            bins = np.rint(d + half_width + 1).astype(np.intp)
+            valid = (bins >= 0) & (bins < n_bins)
+            sums = np.bincount(bins[valid], weights=values[valid],
+                               minlength=n_bins)
+            k = np.argmax(sums)
+            if sums[k] > best[0]:
+                best = (sums[k], angle, rho + k - half_width - 1)
+        _, theta, rho = best
+        c, s = np.cos(theta), np.sin(theta)
+
+        # Cross-track profile. The thickness is its full width at half
+        # maximum, and rho is moved to its centroid. A profile not falling
+        # within the band is not of a streak.
+        x, y, values = self._band_pixels(theta, rho, t_min, t_max, b)
+        d = np.rint(x * c + y * s - rho).astype(np.intp) + b
+        profile = np.bincount(d, weights=values, minlength=2 * b + 1) / \
+            np.maximum(np.bincount(d, minlength=2 * b + 1), 1)
+        peak = np.max(profile)
+        wide = profile >= 0.5 * peak
+        if peak <= 0. or wide[0] or wide[-1]:
+            return None
+        thickness = float(np.sum(wide))
+        rho += np.sum((np.arange(2 * b + 1) - b)[wide] * profile[wide]) / \
+            np.sum(profile[wide])
+
+        # Along-track contrast of the streak against the bands on its both
+        # sides. It is smoothed by a running median, which a star on or
+        # beside the streak, narrower than half of the window, does not
+        # change. The median contrast must be significant, so a region of
+        # bright background is not a streak.
+        n_t = int(np.ceil(t_max - t_min)) + 1
+        if n_t <= b:
+            return None
+        half_width = max(thickness / 2., 1.)
+        x, y, values = self._band_pixels(theta, rho, t_min, t_max,
+                                         2. * half_width + 2.)
+        d = np.abs(x * c + y * s - rho)
+        t = np.rint(-x * s + y * c - t_min).astype(np.intp)
+        profiles = []
+        counts = []
+        for band in (d <= half_width, d >= half_width + 2.):
+            count = np.bincount(t[band], minlength=n_t)
+            profiles.append(np.bincount(t[band], weights=values[band],
+                                        minlength=n_t) /
+                            np.maximum(count, 1))
+            counts.append(max(np.median(count), 1.))
+        raw = profiles[0] - profiles[1]
+        contrast = ndimage.median_filter(raw, size=2 * b + 1,
+                                         mode='nearest')
+        noise = self.std * np.sqrt((1. / counts[0] + 1. / counts[1]) / b)
+        level = np.median(contrast)
+        if level < self.threshold * noise:
+            return None
+
+        # The ends are those of the longest run above the half of the
+        # median contrast, so stars beyond the ends do not extend it.
+        above = np.nonzero(contrast >= 0.5 * level)[0]
+        runs = np.split(above,
+                        np.nonzero(np.diff(above) > self.max_gap)[0] + 1)
+        run = max(runs, key=lambda run: run[-1] - run[0])
+
+        # A streak is bright along its length, so the first quartile of
+        # the unsmoothed contrast is close to its median. A chain of stars
+        # is bright only around the stars, so its first quartile is close
+        # to zero.
+        quartile, median = np.percentile(raw[run[0]:run[-1] + 1], [25, 50])
+        if median <= 0. or quartile < self.min_uniformity * median:
+            return None
+
+        t_max = t_min + run[-1]
+        t_min = t_min + run[0]
+        if t_max - t_min < self.min_length:
+            return None
+
+        return theta, rho, t_min, t_max, thickness
+
+    def _to_edge(self, index, theta, rho, t_min, t_max, thickness):
+        """Return an edge having the same values as those of EDGE."""
+        c, s = np.cos(theta), np.sin(theta)
+        p1 = np.array([rho * c - t_min * s, rho * s + t_min * c])
+        p2 = np.array([rho * c - t_max * s, rho * s + t_max * c])
+        if p1[0] > p2[0]:
+            p1, p2 = p2, p1
+        length = np.sqrt(np.sum((p2 - p1)**2))
+
+        # Outline of the streak as a rectangle, one point per pixel.
+        normal = np.array([c, s]) * thickness / 2.
+        corners = np.array([p1 - normal, p2 - normal, p2 + normal,
+                            p1 + normal, p1 - normal])
+        n_points = np.maximum(np.ceil(np.sqrt(np.sum(
+            np.diff(corners, axis=0)**2, axis=1))), 1).astype(int)
+        outline = np.vstack([
+            np.linspace(corners[k], corners[k + 1], n_points[k],
+                            endpoint=False)
+            for k in range(4)] + [corners[-1:]])
+        x = outline[:, 0]
+        y = outline[:, 1]
+
+        area, perimeter, x_center, y_center, distances = \
+            EDGE([]).get_shape_factor(x, y)
+        radius = np.median(distances)
+
+        with np.errstate(divide='ignore'):
+            slope = -c / s
+            intercept = rho / s
+
+        return {
+            'index': index,
+            'x': x, 'y': y,
+            'x_center': x_center, 'y_center': y_center,
+            'perimeter': perimeter, 'area': area,
+            'shape_factor': 4. * np.pi * area / perimeter ** 2.,
+            'radius_deviation': np.std(distances - radius) / radius,
+            'slope': slope, 'intercept': intercept,
+            'slope_angle': np.degrees(np.arctan(slope)),
+            'connectivity': -1,
+            'x_min': np.min(x), 'x_max': np.max(x),
+            'y_min': np.min(y), 'y_max': np.max(y),
+            'extreme_points': [p1, p2],
+            'length': length,
+            'thickness': thickness}
+
+    def get_edges(self):
+        return self.edges
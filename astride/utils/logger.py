@@ -1,39 +1,119 @@
+import atexit
+import contextlib
+import contextvars
+import json
 import logging
+import logging.handlers
+import multiprocessing
+import threading
+import time
+
+# Context fields (e.g. frame and stage) added to every log record.
+_context = contextvars.ContextVar('astride_log_context', default={})
+
+# Queue and its listener shared by all the Logger instances, and the
+# number of owners (e.g. process pools) using them.
+_queue = None
+_listener = None
+_n_owners = 0
+_queue_lock = threading.Lock()
+
+
+class ContextFilter(logging.Filter):
+    """Add the current context fields to log records."""
+    def filter(self, record):
+        if not hasattr(record, 'context'):
+            record.context = _context.get()
+        return True
+
+
+class ContextFormatter(logging.Formatter):
+    """Text formatter appending the context fields, if any."""
+    def format(self, record):
+        message = super().format(record)
+        context = getattr(record, 'context', None)
+        if context:
+            message += ' [%s]' % ' '.join('%s=%s' % item
+                                          for item in context.items())
+        return message
+
+
+class JSONFormatter(logging.Formatter):
+    """Formatter writing each record as a line of JSON."""
+    def format(self, record):
+        entry = {'time': record.created, 'level': record.levelname,
+                 'process': record.process, 'message': record.getMessage()}
+        entry.update(getattr(record, 'context', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
 
 
 class Logger():
     """
     Create logger instance for writing to both console and a local file.
 
+    Creating another instance does not add duplicated handlers, so it is
+    safe to create an instance wherever a logger is needed.
+
     Parameters
     ----------
     filepath : str, optional
         Specify a log filename with the absolute path.
         If not given, no output is written to a file.
+    json_format : bool, optional
+        If True, each message is written as a line of JSON, having the
+        time, level, process ID, message and the context fields
+        (see log_context). If False, as text. If None, the handlers
+        created before keep their format, and new handlers write text.
     """
-    def __init__(self, filepath=None):
+    def __init__(self, filepath=None, json_format=None):
         # create logger.
         logger = logging.getLogger('ASTRiDE')
-        logger.setLevel(logging.DEBUG)
+        if not any(isinstance(f, ContextFilter) for f in logger.filters):
+            logger.addFilter(ContextFilter())
 
         # create formatter and add it to the handlers
-        formatter = logging.Formatter('%(asctime)s %(levelname)s - %(message)s')
-            #datefmt='%Y/%m/%d %H:%M:%S')
+        if json_format:
+            formatter = JSONFormatter()
+        else:
+            formatter = ContextFormatter(
+                '%(asctime)s %(levelname)s - %(message)s')
+
+        # Reuse the handlers created before.
+        handlers = {getattr(h, 'astride_key'): h for h in logger.handlers
+                    if hasattr(h, 'astride_key')}
 
         # create file handler which logs even debug messages.
         if filepath and filepath[0] == '/':
-            fh = logging.FileHandler(filepath, 'w')
-            fh.setLevel(logging.DEBUG)
-            fh.setFormatter(formatter)
-            logger.addHandler(fh)
+            key = 'file:%s' % filepath
+            if key not in handlers:
+                fh = logging.FileHandler(filepath, 'w')
+                fh.setLevel(logging.DEBUG)
+                fh.setFormatter(formatter)
+                fh.astride_key = key
+                logger.addHandler(fh)
+                handlers[key] = fh
 
         # create console handler with a higher log level.
-        ch = logging.StreamHandler()
-        ch.setLevel(logging.INFO)
-        ch.setFormatter(formatter)
+        if 'console' not in handlers:
+            ch = logging.StreamHandler()
+            ch.setLevel(logging.INFO)
+            ch.setFormatter(formatter)
+            ch.astride_key = 'console'
+            logger.addHandler(ch)
+            handlers['console'] = ch
+
+        # The format of the handlers created before is only changed if
+        # asked, so e.g. the server does not undo a JSON format.
+        if json_format is not None:
+            for handler in handlers.values():
+                handler.setFormatter(formatter)
 
-        # add the handlers to logger
-        logger.addHandler(ch)
+        # Debug messages are discarded at once unless a handler needs
+        # them, so they are cheap to leave in hot paths.
+        logger.setLevel(min(h.level for h in handlers.values()))
 
         self.logger = logger
 
@@ -42,6 +122,125 @@ class Logger():
 
         return self.logger
 
+    def get_queue(self):
+        """
+        Return a queue to send log records from worker processes.
+
+        The records in the queue are written by the handlers of this
+        process, so the messages of the workers are not interleaved.
+        Pass the queue to init_worker in each worker process. The queue
+        is shared by all the callers, and each call must be paired with
+        a call of stop_queue once the workers are done.
+
+        Returns
+        -------
+        queue : multiprocessing.Queue
+            Queue of log records.
+        """
+        global _queue, _listener, _n_owners
+
+        with _queue_lock:
+            if _queue is None:
+                _queue = multiprocessing.Queue()
+                _listener = logging.handlers.QueueListener(
+                    _queue, *self.logger.handlers,
+                    respect_handler_level=True)
+                _listener.start()
+                atexit.register(stop_queue, force=True)
+            _n_owners += 1
+
+            return _queue
+
+
+def stop_queue(force=False):
+    """
+    Release the queue from Logger.get_queue.
+
+    Once every caller of get_queue has released it, the log records left
+    in the queue are written and its listener is stopped, so a process
+    pool does not stop the queue of another pool still running. Call it
+    e.g. after shutting down a process pool, to be sure all the records
+    of its workers are written.
+
+    Parameters
+    ----------
+    force : bool, optional
+        If True, stop the listener even if the queue is still used.
+        Called so at exit.
+    """
+    global _queue, _listener, _n_owners
+
+    with _queue_lock:
+        _n_owners = max(_n_owners - 1, 0)
+        if _listener is None or (_n_owners > 0 and not force):
+            return
+
+        _listener.stop()
+        _queue.close()
+        atexit.unregister(stop_queue)
+        _queue = None
+        _listener = None
+        _n_owners = 0
+
+
+def init_worker(queue, level=logging.DEBUG):
+    """
+    Send the log records of a worker process to a queue.
+
+    Use as (or inside) the initializer of a process pool.
+
+    Parameters
+    ----------
+    queue : multiprocessing.Queue
+        Queue from Logger.get_queue.
+    level : int, optional
+        Log level of the worker process.
+    """
+    logger = logging.getLogger('ASTRiDE')
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(queue))
+    if not any(isinstance(f, ContextFilter) for f in logger.filters):
+        logger.addFilter(ContextFilter())
+    logger.setLevel(level)
+
+
+@contextlib.contextmanager
+def log_context(**fields):
+    """
+    Add fields (e.g. frame) to the log records inside the context.
+
+    Parameters
+    ----------
+    fields : dict
+        Fields to add.
+    """
+    token = _context.set(dict(_context.get(), **fields))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+@contextlib.contextmanager
+def log_stage(logger, stage):
+    """
+    Add the stage field to the log records inside the context, and then
+    log the elapsed time of the stage at the debug level.
+
+    Parameters
+    ----------
+    logger : logging.Logger
+        Logger to log the elapsed time.
+    stage : str
+        Name of the stage.
+    """
+    start = time.perf_counter()
+    with log_context(stage=stage):
+        yield
+        logger.debug('Done in %.3f s.', time.perf_counter() - start)
+
+
 if __name__ == '__main__':
 
     logger = Logger().getLogger()
@@ -50,4 +249,4 @@ if __name__ == '__main__':
     logger.info('info message')
     logger.warn('warn message')
     logger.error('error message')
-    logger.critical('critical message')
\ No newline at end of file
+    logger.critical('critical message')
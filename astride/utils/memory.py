@@ -0,0 +1,212 @@
+import math
+import os
+import threading
+import tracemalloc
+
+import numpy as np
+
+
+def parse_memory(memory):
+    """
+    Return a memory size in bytes.
+
+    Parameters
+    ----------
+    memory : int or str
+        Size in bytes, or a string such as '512M' or '4G'.
+
+    Returns
+    -------
+    size : int
+        Size in bytes.
+    """
+    if isinstance(memory, str):
+        units = {'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+        memory = memory.strip().upper().rstrip('B')
+        if memory and memory[-1] in units:
+            return int(float(memory[:-1]) * units[memory[-1]])
+        return int(float(memory))
+
+    return int(memory)
+
+
+def get_pixel_memory(itemsize, remove_bkg='constant', pyramid_factor=1,
+                     local_threshold=False, masked=False,
+                     mask_sources=False, reference=False):
+    """
+    Return the estimated memory in bytes per pixel of the arrays of the
+    image size kept during the detection.
+
+    Parameters
+    ----------
+    itemsize : int
+        Size in bytes of the image data type.
+    remove_bkg : {'constant', 'map'}, optional
+        Method to remove the background.
+    pyramid_factor : int, optional
+        Pyramid factor, which decimates the background map estimation.
+    local_threshold : bool, optional
+        Whether the signal-to-noise image is used.
+    masked : bool, optional
+        Whether a mask or regions of interest are given.
+    mask_sources : bool, optional
+        Whether point sources are masked.
+    reference : bool, optional
+        Whether a reference image is subtracted.
+
+    Returns
+    -------
+    memory : float
+        Memory in bytes per pixel.
+    """
+    # The raw image and the background removed image.
+    memory = 2. * itemsize
+    if reference:
+        memory += itemsize
+    if remove_bkg == 'map':
+        # The background map, and the decimated data, mask, background
+        # and RMS maps of Background2D in float64.
+        memory += itemsize + 32. / pyramid_factor**2
+    if local_threshold:
+        memory += itemsize
+    if masked:
+        memory += 1.
+    if mask_sources:
+        # The thresholded image, the labels and the source mask.
+        memory += 1. + 4. + 1.
+
+    return memory
+
+
+def get_contour_memory(n_pixels):
+    """
+    Return the estimated memory in bytes to search contours in n_pixels.
+
+    find_contours converts the image to float64, and keeps the segments
+    of the contours, which are assumed to cover a tenth of the pixels.
+    """
+    return n_pixels * (8. + 0.1 * 4 * 8)
+
+
+def get_max_outer_points(max_memory):
+    """
+    Return the maximum number of points of an edge whose N x N distance
+    matrices take up to a tenth of max_memory.
+
+    The extreme points are searched using three N x N float64 matrices.
+    """
+    return max(int(math.sqrt(max_memory / 10. / (3 * 8))), 3)
+
+
+def plan_frame(shape, max_memory, dtype=None, **options):
+    """
+    Choose the data type and the strip height to detect streaks in a frame
+    within a memory budget.
+
+    float64 is used if the whole frame fits in the budget, and float32
+    otherwise. If the frame still does not fit, contours are searched in
+    horizontal strips, the highest that fit.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the image.
+    max_memory : int
+        Memory budget in bytes.
+    dtype : str, optional
+        Data type to use. If None, it is chosen.
+    options : dict, optional
+        Options of get_pixel_memory except for itemsize.
+
+    Returns
+    -------
+    dtype : numpy.dtype
+        Data type of the image.
+    strip_height : int
+        Number of rows of the strips, or None to search the whole image.
+    memory : float
+        Estimated peak memory in bytes.
+    """
+    n_pixels = shape[0] * shape[1]
+    if dtype is None:
+        candidates = [np.dtype(np.float64), np.dtype(np.float32)]
+    else:
+        candidates = [np.dtype(dtype)]
+
+    for dtype in candidates:
+        fixed = n_pixels * get_pixel_memory(dtype.itemsize, **options)
+        memory = fixed + get_contour_memory(n_pixels)
+        if memory <= max_memory:
+            return dtype, None, memory
+
+    # Strips as high as the remaining budget allows, at least 64 rows.
+    strip_area = max((max_memory - fixed) / get_contour_memory(1), 0.)
+    strip_height = max(int(strip_area // shape[1]), 64)
+    memory = fixed + get_contour_memory(strip_height * shape[1])
+
+    return dtype, strip_height, memory
+
+
+def _get_rss():
+    """Return the resident set size of this process in bytes, or None."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class PeakMemory:
+    """
+    Measure the peak memory allocated inside a with block.
+
+    The resident set size is polled by a thread, which is much cheaper
+    than tracing every allocation, but misses peaks shorter than the
+    interval. Where it is not available (i.e. not on Linux), tracemalloc
+    is used instead.
+
+    Parameters
+    ----------
+    interval : float, optional
+        Polling interval in seconds.
+
+    Attributes
+    ----------
+    peak : int
+        Peak memory in bytes above the memory at the start of the block.
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._tracing = False
+
+    def __enter__(self):
+        self._start = _get_rss()
+        if self._start is None:
+            self._tracing = tracemalloc.is_tracing()
+            if self._tracing:
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+        else:
+            self._max = self._start
+            self._thread = threading.Thread(target=self._poll, daemon=True)
+            self._thread.start()
+
+        return self
+
+    def _poll(self):
+        while not self._stop.wait(self.interval):
+            self._max = max(self._max, _get_rss())
+
+    def __exit__(self, *args):
+        if self._thread is None:
+            self.peak = tracemalloc.get_traced_memory()[1]
+            if not self._tracing:
+                tracemalloc.stop()
+        else:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self._max, _get_rss()) - self._start
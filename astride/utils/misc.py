@@ -20,4 +20,31 @@ def moving_average(data, window_size=5):
     window = np.ones(int(window_size))/float(window_size)
     results = np.convolve(data, window, 'valid')
 
-    return results
\ No newline at end of file
+    return results
+
+def bin_image(image, factor):
+    """
+    Bin an image by averaging blocks of factor x factor pixels.
+
+    Rows and columns beyond the last full block are dropped.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        A 2D image.
+    factor : int
+        Binning factor.
+
+    Returns
+    -------
+    binned : numpy.ndarray
+        Binned image.
+    """
+    factor = int(factor)
+    ny = image.shape[0] // factor
+    nx = image.shape[1] // factor
+
+    # A view of the blocks, so the image is not copied.
+    blocks = image[:ny * factor, :nx * factor].reshape(ny, factor, nx, factor)
+
+    return blocks.mean(axis=(1, 3))
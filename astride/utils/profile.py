@@ -0,0 +1,116 @@
+import numpy as np
+
+from scipy.ndimage import map_coordinates
+
+
+def get_profiles(image, edges, step=1., half_width=None, padding=10):
+    """
+    Sample an image along and across every streak at once.
+
+    Each streak is sampled on a grid of points from its first extreme
+    point to the second one, every "step" pixels along the track and
+    every pixel across the track. The grid points of all the streaks are
+    interpolated by a single call of scipy.ndimage.map_coordinates.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        Background removed image.
+    edges : list of dict
+        Streaks having the 'extreme_points' and 'thickness' values
+        (e.g. Streak.streaks).
+    step : float, optional
+        Sampling interval along the track in pixels.
+    half_width : float, optional
+        Half width in pixels of the band across the track to sum the flux
+        in. If None, the thickness of each streak is used.
+    padding : int, optional
+        Padding in pixels around each streak of its cutout.
+
+    Returns
+    -------
+    profiles : list of dict
+        One dictionary per streak, having the 'index' of the streak,
+        the 'distance' of the samples from the first extreme point, the
+        along-track 'flux' summed across the band, the cross-track 'width'
+        (FWHM in pixels, from the second moment of the positive values),
+        the 'cutout' around the streak, which is a view of the image, and
+        the 'cutout_origin' of the cutout as (x, y) in the image.
+    """
+    if step <= 0.:
+        raise RuntimeError('"step" must be larger than zero.')
+    if len(edges) == 0:
+        return []
+
+    p1 = np.array([edge['extreme_points'][0] for edge in edges],
+                  dtype=np.float64)
+    p2 = np.array([edge['extreme_points'][1] for edge in edges],
+                  dtype=np.float64)
+    if half_width is None:
+        half_widths = np.array([max(edge['thickness'], 1.)
+                                for edge in edges])
+    else:
+        half_widths = np.full(len(edges), float(half_width))
+
+    # Unit vectors along and across each track.
+    lengths = np.sqrt(np.sum((p2 - p1)**2, axis=1))
+    along = (p2 - p1) / np.maximum(lengths, 1e-12)[:, np.newaxis]
+    across = np.column_stack([-along[:, 1], along[:, 0]])
+
+    # Cross-track offsets common to all the streaks. Offsets beyond the
+    # half width of a streak are not summed.
+    max_offset = int(np.ceil(half_widths.max()))
+    offsets = np.arange(-max_offset, max_offset + 1, dtype=np.float64)
+    inside = np.abs(offsets) <= half_widths[:, np.newaxis]
+
+    # Along-track distances of all the streaks, packed in one buffer.
+    counts = (lengths // step).astype(np.intp) + 1
+    starts = np.zeros(len(edges), dtype=np.intp)
+    starts[1:] = np.cumsum(counts)[:-1]
+    streak_ids = np.repeat(np.arange(len(edges)), counts)
+    distances = (np.arange(counts.sum()) - np.repeat(starts, counts)) * step
+
+    # Grid points, (N_sample, N_offset), interpolated at once.
+    x = p1[streak_ids, 0:1] + distances[:, np.newaxis] * \
+        along[streak_ids, 0:1] + offsets * across[streak_ids, 0:1]
+    y = p1[streak_ids, 1:2] + distances[:, np.newaxis] * \
+        along[streak_ids, 1:2] + offsets * across[streak_ids, 1:2]
+    values = map_coordinates(image, [y.ravel(), x.ravel()], order=1,
+                             mode='constant', cval=0.,
+                             output=np.float64).reshape(x.shape)
+    values *= inside[streak_ids]
+
+    # Flux across the band, and the width from the second moment of the
+    # positive values around their centroid.
+    fluxes = values.sum(axis=1)
+    weights = np.clip(values, 0., None)
+    total = weights.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        centroids = (weights * offsets).sum(axis=1) / total
+        variances = (weights * (offsets - centroids[:, np.newaxis])**2) \
+            .sum(axis=1) / total
+    widths = 2. * np.sqrt(2. * np.log(2.)) * np.sqrt(variances)
+
+    profiles = []
+    for i, edge in enumerate(edges):
+        samples = slice(starts[i], starts[i] + counts[i])
+
+        # Cutouts are views, so the image is not copied.
+        x_min = max(int(np.floor(min(p1[i, 0], p2[i, 0]) - half_widths[i]))
+                    - padding, 0)
+        x_max = min(int(np.ceil(max(p1[i, 0], p2[i, 0]) + half_widths[i]))
+                    + padding + 1, image.shape[1])
+        y_min = max(int(np.floor(min(p1[i, 1], p2[i, 1]) - half_widths[i]))
+                    - padding, 0)
+        y_max = min(int(np.ceil(max(p1[i, 1], p2[i, 1]) + half_widths[i]))
+                    + padding + 1, image.shape[0])
+
+        profiles.append({
+            'index': edge['index'],
+            'distance': distances[samples],
+            'flux': fluxes[samples],
+            'width': widths[samples],
+            'cutout': image[y_min:y_max, x_min:x_max],
+            'cutout_origin': (x_min, y_min)})
+
+    return profiles
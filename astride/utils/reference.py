@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class ReferenceStack:
+    """
+    Running median stack of the previous frames of the same field.
+
+    Frames are kept in a ring buffer in memory, so adding a frame only
+    replaces the oldest one. The median is recomputed lazily when the
+    reference is requested after the stack has changed.
+
+    Parameters
+    ----------
+    depth : int, optional
+        The number of previous frames to keep.
+    """
+    def __init__(self, depth=5):
+        if depth < 1:
+            raise RuntimeError('"depth" must be larger than zero.')
+        self.depth = depth
+
+        # Ring buffer of frames, allocated at the first frame.
+        self._frames = None
+        self._n_frames = 0
+        self._next = 0
+        # Cached median of the frames.
+        self._median = None
+
+    def __len__(self):
+        return self._n_frames
+
+    def add(self, image):
+        """
+        Add a frame to the stack, replacing the oldest one if it is full.
+
+        Parameters
+        ----------
+        image : numpy.ndarray
+            Image of the frame.
+        """
+        if self._frames is None:
+            self._frames = np.empty((self.depth,) + image.shape,
+                                    dtype=image.dtype)
+        elif image.shape != self._frames.shape[1:]:
+            raise RuntimeError('The frame shape %s does not match the '
+                               'stack shape %s.' %
+                               (image.shape, self._frames.shape[1:]))
+
+        self._frames[self._next] = image
+        self._next = (self._next + 1) % self.depth
+        self._n_frames = min(self._n_frames + 1, self.depth)
+        self._median = None
+
+    def get_reference(self):
+        """
+        Return the median of the frames in the stack.
+
+        Returns
+        -------
+        reference : numpy.ndarray
+            Median image, or None if no frame has been added yet.
+        """
+        if self._n_frames == 0:
+            return None
+
+        if self._median is None:
+            self._median = np.median(self._frames[:self._n_frames], axis=0)
+
+        return self._median
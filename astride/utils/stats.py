@@ -0,0 +1,149 @@
+import numpy as np
+
+from scipy.stats import norm
+
+
+def sample_clipped_stats(data, mask=None, sigma=3., maxiters=5,
+                         max_samples=2**20, confidence=0.95, seed=0,
+                         windows=None):
+    """
+    Return sigma-clipped statistics of a bounded pixel sample.
+
+    Same statistics as astropy.stats.sigma_clipped_stats with the median
+    as the center and the standard deviation as the spread, but on at
+    most max_samples pixels drawn at random, so the time hardly depends on
+    the image size. The sample is sorted once, and each clipping iteration
+    only searches the clipping bounds in the sorted sample and takes the
+    sums inside them from prefix sums, without any masked array.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Image data. Non-finite values are ignored.
+    mask : numpy.ndarray, optional
+        Boolean mask that is True at pixels to ignore. Masked pixels drawn
+        in the sample are dropped, so the sample is smaller.
+    sigma : float, optional
+        The number of standard deviations of the clipping bounds.
+    maxiters : int, optional
+        The maximum number of clipping iterations.
+    max_samples : int, optional
+        The maximum number of pixels to use. If the image has fewer
+        pixels, all the pixels are used.
+    confidence : float, optional
+        Confidence level of the bounds of the median and the standard
+        deviation.
+    seed : int, optional
+        Seed of the random sample, so the statistics of an image are
+        reproducible.
+    windows : list, optional
+        A list of (y_min, y_max, x_min, x_max) windows not overlapping
+        each other. If given, only the pixels inside them are used, and
+        the sample is drawn inside them in proportion to their areas.
+
+    Returns
+    -------
+    mean : float
+        Mean of the clipped sample.
+    median : float
+        Median of the clipped sample.
+    std : float
+        Standard deviation of the clipped sample.
+    median_bounds : tuple
+        Lower and upper confidence bounds of the median, from the order
+        statistics of the clipped sample.
+    std_bounds : tuple
+        Lower and upper confidence bounds of the standard deviation,
+        assuming the clipped sample is normally distributed.
+    """
+    if windows is not None:
+        sample = _sample_windows(data, mask, windows, max_samples, seed)
+    elif data.size > max_samples:
+        rng = np.random.default_rng(seed)
+        rows = rng.integers(0, data.shape[0], max_samples)
+        cols = rng.integers(0, data.shape[1], max_samples)
+        sample = data[rows, cols]
+        if mask is not None:
+            sample = sample[~mask[rows, cols]]
+    elif mask is not None:
+        sample = data[~mask]
+    else:
+        sample = data.ravel()
+    sample = np.sort(sample[np.isfinite(sample)].astype(np.float64))
+    if len(sample) == 0:
+        return np.nan, np.nan, np.nan, (np.nan, np.nan), (np.nan, np.nan)
+
+    # Prefix sums of the values relative to the sample median, which
+    # keeps the variance from the sums accurate.
+    shift = sample[len(sample) // 2]
+    cumsum = np.zeros(len(sample) + 1)
+    np.cumsum(sample - shift, out=cumsum[1:])
+    cumsum2 = np.zeros(len(sample) + 1)
+    np.cumsum((sample - shift)**2, out=cumsum2[1:])
+
+    # The sample is clipped to sample[lower:upper].
+    lower, upper = 0, len(sample)
+    for iteration in range(maxiters + 1):
+        n = upper - lower
+        median = 0.5 * (sample[lower + (n - 1) // 2] + sample[lower + n // 2])
+        mean = (cumsum[upper] - cumsum[lower]) / n
+        variance = (cumsum2[upper] - cumsum2[lower]) / n - mean**2
+        std = np.sqrt(max(variance, 0.))
+        mean += shift
+        if iteration == maxiters:
+            break
+
+        # Values equal to the clipping bounds are kept.
+        new_lower = np.searchsorted(sample, median - sigma * std, 'left')
+        new_upper = np.searchsorted(sample, median + sigma * std, 'right')
+        if (new_lower == lower and new_upper == upper) or \
+           new_upper <= new_lower:
+            break
+        lower, upper = new_lower, new_upper
+
+    # The final statistics in two passes, as accurate as those of astropy.
+    clipped = sample[lower:upper]
+    mean = np.mean(clipped)
+    std = np.std(clipped)
+
+    # Order statistics bracketing the median at the confidence level.
+    z = norm.ppf(0.5 + confidence / 2.)
+    half_width = 0.5 * z * np.sqrt(n)
+    median_bounds = (
+        sample[lower + max(int(np.floor(0.5 * n - half_width)), 0)],
+        sample[lower + min(int(np.ceil(0.5 * n + half_width)), n - 1)])
+    std_error = z / np.sqrt(2. * max(n - 1, 1))
+    std_bounds = (std * max(1. - std_error, 0.), std * (1. + std_error))
+
+    return mean, median, std, median_bounds, std_bounds
+
+
+def _sample_windows(data, mask, windows, max_samples, seed):
+    """Return at most max_samples unmasked pixels inside the windows."""
+    windows = np.asarray(windows, dtype=np.intp).reshape(-1, 4)
+    heights = windows[:, 1] - windows[:, 0]
+    widths = windows[:, 3] - windows[:, 2]
+    sizes = heights * widths
+    if sizes.sum() <= max_samples:
+        samples = []
+        for y_min, y_max, x_min, x_max in windows:
+            sample = data[y_min:y_max, x_min:x_max]
+            if mask is not None:
+                samples.append(sample[~mask[y_min:y_max, x_min:x_max]])
+            else:
+                samples.append(sample.ravel())
+        return np.concatenate(samples)
+
+    # Pixels drawn uniformly over the total area of the windows.
+    rng = np.random.default_rng(seed)
+    indices = rng.integers(0, sizes.sum(), max_samples)
+    starts = np.cumsum(sizes) - sizes
+    window_ids = np.searchsorted(starts, indices, 'right') - 1
+    indices = indices - starts[window_ids]
+    rows = windows[window_ids, 0] + indices // widths[window_ids]
+    cols = windows[window_ids, 2] + indices % widths[window_ids]
+    sample = data[rows, cols]
+    if mask is not None:
+        sample = sample[~mask[rows, cols]]
+
+    return sample